@@ -0,0 +1,36 @@
+"""Memory held by the float64 frames vs. the compact panel.
+
+For each size a synthetic database is generated and ``etf_compact.memory_report``
+measures the bytes held by the per-ticker frames, by the joined portfolio frame
+and by a ``CompactPanel`` holding the same data.
+"""
+
+import argparse
+import os
+import tempfile
+
+from common import make_database
+
+import etf_compact
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, nargs='+', default=[4, 100])
+    parser.add_argument('--days', type=int, nargs='+', default=[1_000, 20_000])
+    args = parser.parse_args(argv)
+
+    print(f'{"tickers":>8} {"days":>8} {"frames (MB)":>12} {"portfolio (MB)":>15} {"compact (MB)":>13} '
+          f'{"vs frames":>10} {"vs both":>8}')
+    with tempfile.TemporaryDirectory() as directory:
+        for n_tickers in args.tickers:
+            for n_days in args.days:
+                database_path = make_database(os.path.join(directory, f'{n_tickers}_{n_days}.db'), n_tickers, n_days)
+                report = etf_compact.memory_report(database_path=database_path)
+                print(f'{n_tickers:>8} {n_days:>8} {report["frames"] / 1e6:>12.2f} {report["portfolio"] / 1e6:>15.2f} '
+                      f'{report["compact"] / 1e6:>13.2f} {report["ratio_frames"]:>9.2f}x '
+                      f'{report["ratio_frames_and_portfolio"]:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Throughput of concurrent ticker reads, pooled read-only vs. a default engine.
+
+A synthetic database is generated and every reader thread repeatedly reads
+whole ticker tables, uncached, for a fixed number of reads in total:
+
+* pooled:  ``etf_data.query_asset`` on the read-only connection pool (``etf_db``)
+* engine:  ``pandas.read_sql_query`` on a default ``sqlalchemy.create_engine``,
+  the way the notebook used to read
+
+The table shows the reads per second at each number of concurrent readers.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from common import make_database
+
+import etf_data
+import etf_db
+
+
+def pooled_read(symbol, database_path):
+    return etf_data.query_asset(symbol, database_path=database_path)
+
+
+def engine_reader(database_path):
+    import sqlalchemy
+
+    engine = sqlalchemy.create_engine(f'sqlite:///{database_path}')
+
+    def read(symbol, database_path):
+        return pd.read_sql_query(
+            sqlalchemy.text(f'SELECT * FROM {etf_data.quote_identifier(symbol)}'),
+            engine,
+            parse_dates=['time'],
+            index_col='time',
+        )
+    return read
+
+
+def throughput(read, symbols, database_path, readers, reads):
+    tasks = [symbols[i % len(symbols)] for i in range(reads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=readers) as executor:
+        for _ in executor.map(lambda symbol: read(symbol, database_path), tasks):
+            pass
+    return reads / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=16)
+    parser.add_argument('--days', type=int, default=5_000)
+    parser.add_argument('--readers', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--reads', type=int, default=64, help='reads per measurement')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = make_database(os.path.join(directory, 'etf.db'), args.tickers, args.days)
+        symbols = etf_data.ticker_names(database_path)
+        engine_read = engine_reader(database_path)
+        print(f'{args.tickers} tickers x {args.days} days, {args.reads} reads per run, pool size {etf_db.POOL_SIZE}')
+        print(f'{"readers":>8} {"pooled (reads/s)":>17} {"engine (reads/s)":>17}')
+        for readers in args.readers:
+            pooled = throughput(pooled_read, symbols, database_path, readers, args.reads)
+            engine = throughput(engine_read, symbols, database_path, readers, args.reads)
+            print(f'{readers:>8} {pooled:>17.1f} {engine:>17.1f}')
+        print('pool:', etf_db.get_pool(database_path).stats())
+
+
+if __name__ == '__main__':
+    main()
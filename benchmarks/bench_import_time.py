@@ -0,0 +1,71 @@
+"""Measure the cold-start import cost of the analyzer modules.
+
+Each scenario runs in a fresh interpreter under ``python -X importtime``.  The
+table shows the total time spent importing, the wall time of the whole process
+and whether the heavy optional stacks (SQLAlchemy, the hvPlot/Bokeh plotting
+stack) were loaded.  ``--top`` lists the slowest imports of each scenario.
+
+The first row imports the libraries the notebook used to load up front, as a
+reference for the fast-start path.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import common
+
+
+SCENARIOS = [
+    ('notebook libraries', 'import numpy, pandas, hvplot.pandas, sqlalchemy'),
+    ('etf_data', 'import etf_data'),
+    ('etf_pipeline', 'import etf_pipeline'),
+    ('portfolio returns', 'import etf_pipeline; etf_pipeline.portfolio_returns()'),
+    ('etf_report (csv only)', 'import etf_report'),
+]
+
+# Packages reported in the 'loaded' column
+HEAVY_PACKAGES = ('sqlalchemy', 'hvplot', 'holoviews', 'bokeh', 'panel')
+
+
+def import_times(statement, cwd):
+    """Run ``statement`` in a new interpreter and return ({module: (self_us, cumulative_us)}, wall seconds)."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=cwd, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - start
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules, elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3, help='runs per scenario (the fastest is reported)')
+    parser.add_argument('--top', type=int, default=0, help='also list the N slowest imports of each scenario')
+    args = parser.parse_args(argv)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(common.__file__)))
+
+    print(f'{"scenario":<24} {"imports (ms)":>12} {"process (ms)":>12}  loaded')
+    for label, statement in SCENARIOS:
+        runs = [import_times(statement, root) for _ in range(args.repeat)]
+        modules, elapsed = min(runs, key=lambda run: run[1])
+        total_ms = sum(self_us for self_us, _ in modules.values()) / 1000
+        loaded = [package for package in HEAVY_PACKAGES if package in modules] or ['-']
+        print(f'{label:<24} {total_ms:>12.1f} {elapsed * 1000:>12.1f}  {", ".join(loaded)}')
+        if args.top:
+            slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+            for name, (_, cumulative_us) in slowest:
+                print(f'    {name:<40} {cumulative_us / 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Time the path-dependent kernels against the pandas expressions they replace.
+
+For each TICKERSxDAYS size a random returns frame (with a few missing values)
+is processed three ways:
+
+* pandas - ``(1 + r).cumprod() - 1``, then the drawdown from ``cummax``, its
+  ``cummin`` and the rows since the last peak, as separate frame operations
+* numpy  - ``etf_kernels`` with ``backend='numpy'``
+* numba  - ``etf_kernels`` with ``backend='numba'`` (compiled before timing;
+  the compile time is reported once), when Numba is installed
+
+The drifting portfolio (``portfolio_values`` without rebalancing) is timed
+for the vectorized engine and the compiled kernel.  Results are checked
+against pandas, and the two portfolio paths against each other.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import common  # noqa: F401  (puts the analyzer modules on sys.path)
+
+import etf_kernels
+
+
+def pandas_path_metrics(returns):
+    cumulative = (1 + returns).cumprod() - 1
+    values = (1 + returns.fillna(0.0)).cumprod()
+    # The initial value of 1, at row -1, is the first peak
+    peak = values.cummax().clip(lower=1.0)
+    drawdown = values / peak - 1
+    rows = pd.DataFrame(np.arange(len(returns))[:, None].repeat(returns.shape[1], axis=1),
+                        index=returns.index, columns=returns.columns)
+    duration = rows - rows.where(values.eq(peak)).ffill().fillna(-1)
+    return pd.concat({
+        'cum_returns': cumulative,
+        'drawdown': drawdown,
+        'max_drawdown': drawdown.cummin(),
+        'duration': duration,
+        'max_duration': duration.cummax(),
+    }, axis=1)
+
+
+def best_time(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['4x1000', '100x10000', '500x20000'], help='TICKERSxDAYS')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    backends = ['numpy'] + (['numba'] if etf_kernels.backend() == 'numba' else [])
+    if 'numba' in backends:
+        start = time.perf_counter()
+        sample = pd.DataFrame(np.zeros((2, 2)))
+        etf_kernels.path_metrics(sample, backend='numba')
+        etf_kernels.cumulative_returns(sample, backend='numba')
+        etf_kernels.portfolio_values(sample, backend='numba')
+        print(f'Numba compile (or cache load): {time.perf_counter() - start:.2f}s\n')
+    else:
+        print('Numba is not installed (or ETF_KERNELS=numpy): timing the NumPy fallback only\n')
+
+    rng = np.random.default_rng(0)
+    print(f'{"tickers":>8} {"days":>7} {"kernel":>12} {"pandas (s)":>11} '
+          + ' '.join(f'{backend + " (s)":>11}' for backend in backends))
+    for size in args.sizes:
+        n_tickers, n_days = (int(part) for part in size.split('x'))
+        values = rng.normal(0.0004, 0.02, (n_days, n_tickers))
+        values[rng.random(values.shape) < 0.001] = np.nan
+        returns = pd.DataFrame(values, index=pd.bdate_range('1950-01-02', periods=n_days))
+
+        cumulative_time, expected = best_time(lambda: (1 + returns).cumprod() - 1, args.repeat)
+        timings = []
+        for backend in backends:
+            elapsed, result = best_time(lambda: etf_kernels.cumulative_returns(returns, backend=backend), args.repeat)
+            pd.testing.assert_frame_equal(result, expected, rtol=1e-10)
+            timings.append(elapsed)
+        print(f'{n_tickers:>8} {n_days:>7} {"cumulative":>12} {cumulative_time:>11.4f} '
+              + ' '.join(f'{elapsed:>11.4f}' for elapsed in timings))
+
+        path_time, expected = best_time(lambda: pandas_path_metrics(returns), args.repeat)
+        timings = []
+        for backend in backends:
+            elapsed, result = best_time(lambda: etf_kernels.path_metrics(returns, backend=backend), args.repeat)
+            pd.testing.assert_frame_equal(result, expected, rtol=1e-10, check_dtype=False)
+            timings.append(elapsed)
+        print(f'{n_tickers:>8} {n_days:>7} {"path metrics":>12} {path_time:>11.4f} '
+              + ' '.join(f'{elapsed:>11.4f}' for elapsed in timings))
+
+        timings = []
+        for backend in backends:
+            elapsed, result = best_time(lambda: etf_kernels.portfolio_values(returns, backend=backend), args.repeat)
+            if backend == backends[0]:
+                expected = result
+            np.testing.assert_allclose(result, expected, rtol=1e-10)
+            timings.append(elapsed)
+        print(f'{n_tickers:>8} {n_days:>7} {"drift":>12} {"":>11} '
+              + ' '.join(f'{elapsed:>11.4f}' for elapsed in timings))
+
+
+if __name__ == '__main__':
+    main()
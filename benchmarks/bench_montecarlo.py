@@ -0,0 +1,51 @@
+"""Run time and memory of the Monte Carlo simulation against the size of the path array.
+
+Simulates the equal-weight portfolio of a synthetic database shaped like
+etf.db (block bootstrap) for several path counts and worker counts, and reports the wall time, the paths simulated
+per second and the peak memory allocated in this process (with ``workers=1``,
+where the chunks run here), next to the size the full paths x days array would
+have.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import make_database
+
+import etf_join
+import etf_montecarlo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--history', type=int, default=1_000, help='days of history to resample')
+    parser.add_argument('--paths', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--days', type=int, default=2520)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = make_database(os.path.join(directory, 'etf.db'), args.tickers, args.history)
+        returns = etf_join.join_assets(fields=['daily_returns'], database_path=database_path).droplevel(1, axis=1)
+    print(f'{"paths":>8} {"workers":>8} {"seconds":>8} {"paths/s":>9} {"peak (MB)":>10} {"full array (MB)":>16}')
+    for n_paths in args.paths:
+        for workers in args.workers:
+            if workers == 1:
+                tracemalloc.start()
+            start = time.perf_counter()
+            etf_montecarlo.simulate(returns, n_paths=n_paths, n_days=args.days, workers=workers)
+            elapsed = time.perf_counter() - start
+            peak = ''
+            if workers == 1:
+                peak = f'{tracemalloc.get_traced_memory()[1] / 1e6:.0f}'
+                tracemalloc.stop()
+            print(f'{n_paths:>8} {workers:>8} {elapsed:>8.2f} {n_paths / elapsed:>9.0f} {peak:>10} '
+                  f'{n_paths * args.days * 8 / 1e6:>16.0f}')
+
+
+if __name__ == '__main__':
+    main()
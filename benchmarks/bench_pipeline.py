@@ -0,0 +1,142 @@
+"""Time and peak memory of each analyzer pipeline stage on synthetic data.
+
+For each size an etf.db-compatible database is generated with
+``etf_synthetic`` (with gaps and staggered listings, so the tickers are not
+perfectly aligned) and the stages of the notebook are run in order:
+
+* load      - read every ticker table (``etf_db.load_assets``)
+* join      - build the portfolio frame (``etf_join.join_assets``)
+* returns   - join the daily returns and take the equal-weight mean
+* annualize - ``mean * 252``
+* cumulate  - portfolio cumulative returns (incremental, first run computes all)
+* plot-prep - downsample the per-asset returns and the cumulative returns for the charts
+
+``--legacy-join`` adds the notebook's original join (``pd.concat`` of the
+tables, then ``T.drop_duplicates().T``) for comparison.  Each stage is timed
+first, then run again under ``tracemalloc`` for its peak memory.  ``--output``
+saves the results as JSON and ``--compare`` prints the change against a saved
+run, so regressions and wins show up between commits::
+
+    python benchmarks/bench_pipeline.py --output before.json
+    python benchmarks/bench_pipeline.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+from common import make_database
+
+import etf_data
+import etf_db
+import etf_incremental
+import etf_join
+import etf_pipeline
+import etf_plotting
+
+
+def legacy_join(symbols, database_path):
+    # The notebook's original Method #1: every column of every table, then drop the repeated columns
+    frames = [etf_data.query_asset(symbol, database_path=database_path).reset_index() for symbol in symbols]
+    return pd.concat(frames, axis=1, join='inner').T.drop_duplicates().T
+
+
+def pipeline_stages(database_path, legacy=False):
+    """Return the (name, callable) stages; each callable receives the results of the previous stages."""
+    symbols = etf_data.ticker_names(database_path)
+    stages = [
+        ('load', lambda results: etf_db.load_assets(symbols, database_path=database_path)),
+        ('join', lambda results: etf_join.join_assets(symbols, how='outer', database_path=database_path)),
+    ]
+    if legacy:
+        stages.append(('legacy join', lambda results: legacy_join(symbols, database_path)))
+    stages += [
+        ('returns', lambda results: etf_pipeline.portfolio_returns(symbols, database_path)),
+        ('annualize', lambda results: etf_pipeline.annualized_returns(results['returns'][('ETF', 'mean_daily_returns')])),
+        ('cumulate', lambda results: etf_pipeline.portfolio_cumulative_returns(symbols, database_path)),
+        ('plot-prep', lambda results: (
+            etf_plotting.downsample(results['returns'][symbols].droplevel(1, axis=1)),
+            etf_plotting.downsample(results['cumulate']),
+        )),
+    ]
+    return stages
+
+
+def run_pipeline(database_path, legacy=False, memory=True):
+    """Run every stage and return {stage: {'seconds': ..., 'peak_bytes': ...}}."""
+    measurements = {}
+    results = {}
+    for name, stage in pipeline_stages(database_path, legacy):
+        etf_data.invalidate()
+        start = time.perf_counter()
+        results[name] = stage(results)
+        measurements[name] = {'seconds': time.perf_counter() - start}
+
+    if memory:
+        # Second pass for memory, tracemalloc slows the stages down
+        etf_incremental.rebuild(etf_incremental.PORTFOLIO_SERIES, database_path)
+        results = {}
+        tracemalloc.start()
+        try:
+            for name, stage in pipeline_stages(database_path, legacy):
+                etf_data.invalidate()
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                results[name] = stage(results)
+                measurements[name]['peak_bytes'] = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+    return measurements
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, nargs='+', default=[4, 50])
+    parser.add_argument('--bars', type=int, nargs='+', default=[1_000, 20_000])
+    parser.add_argument('--freq', default='B', help="bar interval of the synthetic data ('B' or 'min')")
+    parser.add_argument('--gap-rate', type=float, default=0.01)
+    parser.add_argument('--listing-spread', type=float, default=0.1)
+    parser.add_argument('--legacy-join', action='store_true', help="also time the notebook's original join")
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    runs = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for n_tickers in args.tickers:
+            for n_bars in args.bars:
+                key = f'{n_tickers}x{n_bars}'
+                database_path = make_database(
+                    os.path.join(directory, f'{key}.db'), n_tickers, n_bars, freq=args.freq,
+                    gap_rate=args.gap_rate, listing_spread=args.listing_spread,
+                )
+                runs[key] = run_pipeline(database_path, args.legacy_join, not args.no_memory)
+
+                print(f'\n{n_tickers} tickers x {n_bars} bars')
+                print(f'{"stage":<12} {"seconds":>9} {"peak MB":>9}' + (f' {"vs baseline":>12}' if baseline else ''))
+                for stage, measurement in runs[key].items():
+                    peak = measurement.get('peak_bytes')
+                    line = f'{stage:<12} {measurement["seconds"]:>9.4f} {"" if peak is None else f"{peak / 1e6:.2f}":>9}'
+                    before = baseline.get(key, {}).get(stage)
+                    if before:
+                        line += f' {measurement["seconds"] / before["seconds"]:>11.2f}x'
+                    print(line)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(runs, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
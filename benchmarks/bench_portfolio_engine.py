@@ -0,0 +1,53 @@
+"""Time the vectorized portfolio engine on large synthetic returns matrices.
+
+For each size and rebalance frequency the engine computes the full value path
+of a random-weight portfolio.  A plain Python loop over days is timed on the
+smallest size for reference.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import common  # noqa: F401  (puts the analyzer modules on sys.path)
+
+import etf_portfolio_engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=['4x1000', '500x10000', '2000x20000'], help='TICKERSxDAYS')
+    parser.add_argument('--rebalance', nargs='+', default=['daily', 'monthly', 'quarterly', 'never'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    print(f'{"tickers":>8} {"days":>7} {"rebalance":>10} {"engine (s)":>11} {"Mcells/s":>9} {"loop (s)":>9}')
+    for size in args.sizes:
+        n_tickers, n_days = (int(part) for part in size.split('x'))
+        returns = rng.normal(0.0004, 0.02, (n_days, n_tickers))
+        weights = rng.dirichlet(np.ones(n_tickers))
+        index = pd.bdate_range('1950-01-02', periods=n_days)
+        for rebalance in args.rebalance:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                values = etf_portfolio_engine.portfolio_values(returns, weights, rebalance, index=index)
+                timings.append(time.perf_counter() - start)
+            engine_time = min(timings)
+
+            loop = ''
+            if size == args.sizes[0]:
+                points = etf_portfolio_engine.rebalance_points(index, rebalance)
+                start = time.perf_counter()
+                expected = etf_portfolio_engine.loop_values(returns, weights, points)
+                loop = f'{time.perf_counter() - start:.4f}'
+                np.testing.assert_allclose(values, expected, rtol=1e-10)
+            cells = n_tickers * n_days / engine_time / 1e6
+            print(f'{n_tickers:>8} {n_days:>7} {rebalance:>10} {engine_time:>11.4f} {cells:>9.1f} {loop:>9}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Cost of the etf_profiling instrumentation, disabled and enabled.
+
+Times an empty ``with etf_profiling.stage(...)`` block, then the whole
+pipeline (``etf_pipeline.compute_results``, loader cache cleared each run) on a
+synthetic database, with profiling off, timings only, and timings plus
+``tracemalloc``.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from common import best_of, make_database
+
+import etf_data
+import etf_pipeline
+import etf_profiling
+
+
+def stage_cost(calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        with etf_profiling.stage('noop'):
+            pass
+    return (time.perf_counter() - start) / calls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--days', type=int, default=5_000)
+    parser.add_argument('--calls', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    modes = {'disabled': None, 'timings': False, 'timings + memory': True}
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = make_database(os.path.join(directory, 'etf.db'), args.tickers, args.days)
+        symbol = etf_data.ticker_names(database_path)[0]
+
+        print(f'{"mode":<18} {"per stage (us)":>15} {"pipeline (s)":>13} {"stages":>7}')
+        for mode, memory in modes.items():
+            if memory is not None:
+                etf_profiling.enable(memory=memory)
+            per_stage = stage_cost(args.calls if memory is None else args.calls // 10)
+            etf_profiling.reset()
+            pipeline = best_of(lambda: etf_pipeline.compute_results(symbol, database_path), args.repeat)
+            stages = len(etf_profiling.trace()) // args.repeat
+            etf_profiling.disable()
+            etf_profiling.reset()
+            print(f'{mode:<18} {per_stage * 1e6:>15.2f} {pipeline:>13.4f} {stages:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Rows read and load time of long-range views from the rollups vs. the full-resolution rows.
+
+Generates a synthetic database of daily bars (or ``--freq min`` for minute
+bars), builds the rollups and times an incremental update after one new bar
+per ticker.  Then, for date ranges ending at the last bar, loads one ticker
+for a chart of ``--width`` points both from its price table and through
+``etf_rollups.load``, and reports the resolution the planner picked with the
+rows and time of each.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+from common import make_database
+
+import etf_data
+import etf_incremental
+import etf_ingest
+import etf_rollups
+
+
+def timed(function):
+    etf_data.invalidate()
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--bars', type=int, default=10_000)
+    parser.add_argument('--freq', default='B', help="bar interval: 'B' (business days) or 'min'")
+    parser.add_argument('--width', type=int, default=500, help='points wanted by the chart')
+    parser.add_argument('--years', type=float, nargs='+', default=[1, 5, 20, 40], help='length of the viewed ranges')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = make_database(os.path.join(directory, 'etf.db'), args.tickers, args.bars, freq=args.freq)
+        _, build = timed(lambda: etf_rollups.update_all(database_path))
+        # The cumulative returns of the full-resolution views come from etf_incremental's checkpoints
+        etf_incremental.update_all(database_path)
+        symbol = etf_data.ticker_names(database_path)[0]
+        last = etf_data.load_asset(symbol, ['close'], database_path=database_path).iloc[-1]
+        bars = [
+            {'symbol': ticker, 'time': etf_data.format_time(last.name + pd.Timedelta(days=1)), 'open': last['close'],
+             'high': last['close'], 'low': last['close'], 'close': last['close'], 'volume': 1000}
+            for ticker in etf_data.ticker_names(database_path)
+        ]
+        etf_ingest.ingest(bars, database_path)
+        etf_incremental.update_all(database_path)
+        _, update = timed(lambda: etf_rollups.update_all(database_path))
+        print(f'Rollups of {args.tickers} x {args.bars} bars built in {build:.2f}s, '
+              f'updated with one bar per ticker in {update * 1000:.1f}ms\n')
+
+        end = last.name + pd.Timedelta(days=1)
+        print(f'{"years":>6} {"raw rows":>9} {"raw (ms)":>9} {"resolution":>11} {"rows":>6} {"planned (ms)":>13}')
+        for years in args.years:
+            start = end - pd.Timedelta(days=365.25 * years)
+            raw, raw_time = timed(lambda: etf_data.load_asset(symbol, start=start, end=end,
+                                                              database_path=database_path))
+            (resolution, planned), planned_time = timed(
+                lambda: etf_rollups.load(symbol, start, end, args.width, database_path)
+            )
+            print(f'{years:>6g} {len(raw):>9} {raw_time * 1000:>9.1f} {resolution:>11} {len(planned):>6} '
+                  f'{planned_time * 1000:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Screen latency without indexes, with the screening indexes, and in memory.
+
+A synthetic database of minute bars is generated and three screens are run
+across every ticker:
+
+* top 10 daily returns
+* closes above the 99.9th percentile
+* bottom 10 daily returns within a one-month window
+
+first on the bare tables (only 'time' is indexed, as in etf.db), then after
+``etf_screen.create_indexes``, then on a ``ScreenIndex`` built from the loaded
+frames.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from common import best_of, make_database
+
+import etf_data
+import etf_screen
+
+
+def screens(threshold, window):
+    return {
+        'top 10 returns': lambda screen: screen.top_n('daily_returns', 10),
+        'close above p99.9': lambda screen: screen.between('close', above=threshold),
+        'bottom 10 in window': lambda screen: screen.top_n('daily_returns', 10, largest=False,
+                                                           start=window[0], end=window[1]),
+    }
+
+
+class _SQLScreens:
+    # Adapts the module functions to the ScreenIndex call signature
+    def __init__(self, database_path):
+        self.database_path = database_path
+
+    def top_n(self, *args, **kwargs):
+        return etf_screen.top_n(*args, database_path=self.database_path, **kwargs)
+
+    def between(self, *args, **kwargs):
+        return etf_screen.between(*args, database_path=self.database_path, **kwargs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=1_000_000, help='minute bars per ticker')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, 'etf.db')
+        start = time.perf_counter()
+        make_database(database_path, args.tickers, args.rows, freq='min')
+        print(f'{args.tickers} tickers x {args.rows} minute bars generated in {time.perf_counter() - start:.1f}s')
+
+        sample = etf_data.query_asset(etf_data.ticker_names(database_path)[0], ['close'], database_path=database_path)
+        threshold = float(sample['close'].quantile(0.999))
+        middle = sample.index[len(sample) // 2]
+        window = (middle, middle + (sample.index[1] - sample.index[0]) * 60 * 24 * 30)
+        cases = screens(threshold, window)
+        timings = {name: {} for name in cases}
+
+        sql = _SQLScreens(database_path)
+        for name, screen in cases.items():
+            timings[name]['unindexed'] = best_of(lambda: screen(sql), args.repeat)
+
+        start = time.perf_counter()
+        etf_screen.create_indexes(database_path)
+        print(f'create_indexes: {time.perf_counter() - start:.1f}s')
+        for name, screen in cases.items():
+            timings[name]['indexed'] = best_of(lambda: screen(sql), args.repeat)
+
+        start = time.perf_counter()
+        index = etf_screen.ScreenIndex.from_database(database_path=database_path)
+        print(f'ScreenIndex build (load + sort): {time.perf_counter() - start:.1f}s')
+        for name, screen in cases.items():
+            timings[name]['memory'] = best_of(lambda: screen(index), args.repeat)
+
+        print(f'\n{"screen":<22} {"unindexed (ms)":>15} {"indexed (ms)":>13} {"in memory (ms)":>15}')
+        for name, timing in timings.items():
+            print(f'{name:<22} {timing["unindexed"] * 1000:>15.1f} {timing["indexed"] * 1000:>13.1f} '
+                  f'{timing["memory"] * 1000:>15.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Requests per second and latency of etf_service at increasing concurrency.
+
+Starts ``etf_service.py`` on a free port (or targets ``--url``), then for each
+concurrency level opens that many keep-alive connections, each sending
+requests for a mix of endpoints in turn until ``--requests`` have completed,
+and reports the throughput and the p50 / p99 latencies.  The first pass over
+the endpoints warms the shared cache; ``--cold`` skips it, so the first
+requests include computing the results.
+
+The client is plain asyncio streams speaking HTTP/1.1, so the script needs
+nothing beyond the standard library on the client side.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+# Endpoints requested in turn by every connection
+MIX = [
+    '/portfolio/returns',
+    '/portfolio/annualized',
+    '/portfolio/cumulative',
+    '/assets/PYPL',
+    '/assets/PYPL/returns',
+    '/screens/top?n=10',
+    '/screens/between?field=close&above=200',
+    '/portfolio?format=arrow',
+]
+
+
+async def fetch(reader, writer, host, path):
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n'.encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+async def run_level(host, port, concurrency, total, mix):
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def connection(offset):
+        nonlocal remaining, errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            position = offset
+            while remaining > 0:
+                remaining -= 1
+                start = time.perf_counter()
+                status = await fetch(reader, writer, host, mix[position % len(mix)])
+                latencies.append(time.perf_counter() - start)
+                errors += status != 200
+                position += 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(offset) for offset in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'rps': len(latencies) / elapsed,
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'errors': errors,
+    }
+
+
+def start_service(database_path, workers):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    command = [sys.executable, os.path.join(root, 'etf_service.py'), '--port', str(port), '--database', database_path]
+    if workers:
+        command += ['--workers', str(workers)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + '/tickers')
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('etf_service did not start')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='an already running service (default: start one)')
+    parser.add_argument('--database', default='etf.db', help='database served when the script starts the service')
+    parser.add_argument('--workers', type=int, help='endpoint threads of the started service')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--requests', type=int, default=2_000, help='requests per concurrency level')
+    parser.add_argument('--cold', action='store_true', help='skip the cache warm-up pass')
+    args = parser.parse_args(argv)
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_service(args.database, args.workers)
+    try:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+        if not args.cold:
+            for path in MIX:
+                urllib.request.urlopen(url + path).read()
+
+        print(f'{"connections":>11} {"req/s":>9} {"p50 (ms)":>9} {"p99 (ms)":>9} {"errors":>7}')
+        for concurrency in args.concurrency:
+            result = asyncio.run(run_level(host, port, concurrency, args.requests, MIX))
+            print(f'{concurrency:>11} {result["rps"]:>9.0f} {result["p50"] * 1000:>9.1f} '
+                  f'{result["p99"] * 1000:>9.1f} {result["errors"]:>7}')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compare the pandas portfolio path with the SQL-side analytics.
+
+For each size a synthetic database is generated and both paths compute the
+per-day mean, annualized and cumulative portfolio returns:
+
+* pandas: join the daily returns, then ``mean(axis=1)``, ``* 252`` and ``cumprod``
+* SQL:    ``etf_sql_analytics.portfolio_returns_sql`` (window functions in SQLite)
+
+The last column shows which side wins, so the crossover point can be read off
+the table.
+"""
+
+import argparse
+import os
+import tempfile
+
+from common import best_of, make_database
+
+import etf_join
+import etf_sql_analytics
+
+
+def pandas_path(database_path):
+    returns = etf_join.join_assets(fields=['daily_returns'], database_path=database_path)
+    mean = returns.mean(axis=1)
+    annualized = mean * 252 * 100
+    cumulative = (1 + mean).cumprod() - 1
+    return mean, annualized, cumulative
+
+
+def sql_path(database_path):
+    return etf_sql_analytics.portfolio_returns_sql(database_path=database_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, nargs='+', default=[4, 16, 48])
+    parser.add_argument('--days', type=int, nargs='+', default=[1_000, 10_000, 50_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    print(f'{"tickers":>8} {"days":>8} {"pandas (s)":>11} {"sql (s)":>9} {"faster":>7}')
+    with tempfile.TemporaryDirectory() as directory:
+        for n_tickers in args.tickers:
+            for n_days in args.days:
+                database_path = make_database(os.path.join(directory, f'{n_tickers}_{n_days}.db'), n_tickers, n_days)
+                pandas_time = best_of(lambda: pandas_path(database_path), args.repeat)
+                sql_time = best_of(lambda: sql_path(database_path), args.repeat)
+                faster = 'sql' if sql_time < pandas_time else 'pandas'
+                print(f'{n_tickers:>8} {n_days:>8} {pandas_time:>11.4f} {sql_time:>9.4f} {faster:>7}')
+
+
+if __name__ == '__main__':
+    main()
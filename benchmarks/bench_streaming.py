@@ -0,0 +1,70 @@
+"""Peak memory of the in-memory pipeline vs. the streaming pass as the history grows.
+
+For each history length a synthetic database of minute bars is generated and
+the portfolio figures (mean and annualized returns, cumulative returns, max
+drawdown) are computed twice:
+
+* in memory - ``etf_pipeline.portfolio_returns`` on the joined tables, then
+  ``cumprod`` and the running drawdown on the whole frame
+* streaming - ``etf_streaming.portfolio_summary`` with a fixed chunk size
+
+The peak of the streaming pass should stay flat while the in-memory one grows
+with the number of bars.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import make_database
+
+import etf_data
+import etf_pipeline
+import etf_rolling
+import etf_streaming
+
+
+def in_memory(database_path):
+    returns = etf_pipeline.portfolio_returns(database_path=database_path)
+    etf_rolling.running_max_drawdown(returns)
+    return (1 + returns.fillna(0.0)).cumprod() - 1, returns.mean() * etf_pipeline.TRADING_DAYS
+
+
+def measure(function):
+    # Timed without tracemalloc, which slows the row-by-row fetches down, then run again for the peak
+    etf_data.invalidate()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    etf_data.invalidate()
+    tracemalloc.start()
+    try:
+        function()
+        return elapsed, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--bars', type=int, nargs='+', default=[100_000, 400_000], help='minute bars per ticker')
+    parser.add_argument('--chunksize', type=int, default=etf_streaming.CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    print(f'{"bars":>9} {"in memory (s)":>14} {"peak (MB)":>10} {"streaming (s)":>14} {"peak (MB)":>10}')
+    with tempfile.TemporaryDirectory() as directory:
+        for n_bars in args.bars:
+            database_path = make_database(os.path.join(directory, f'{n_bars}.db'), args.tickers, n_bars, freq='min')
+            memory_time, memory_peak = measure(lambda: in_memory(database_path))
+            stream_time, stream_peak = measure(
+                lambda: etf_streaming.portfolio_summary(chunksize=args.chunksize, database_path=database_path)
+            )
+            print(f'{n_bars:>9} {memory_time:>14.2f} {memory_peak / 1e6:>10.1f} '
+                  f'{stream_time:>14.2f} {stream_peak / 1e6:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
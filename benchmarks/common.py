@@ -0,0 +1,37 @@
+"""Shared helpers for the benchmark scripts in this directory.
+
+The scripts are run from the repository root, e.g.::
+
+    python benchmarks/bench_sql_analytics.py
+"""
+
+import os
+import sys
+import time
+
+# Make the analyzer modules importable when a script is run directly
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import etf_data  # noqa: E402
+import etf_synthetic  # noqa: E402
+
+
+def make_database(path, n_tickers, n_days, seed=0, freq='B', **options):
+    """Write an etf.db-compatible database with ``n_tickers`` random-walk tickers of ``n_days`` bars.
+
+    ``freq`` is the bar interval (business days by default, 'min' for minute
+    bars); ``options`` are passed on to ``etf_synthetic.generate_database``
+    (gaps, listing spread, clock jitter).
+    """
+    return etf_synthetic.generate_database(path, n_tickers, n_days, freq=freq, seed=seed, **options)
+
+
+def best_of(function, repeat=3):
+    """Return the fastest wall time of ``repeat`` calls, clearing the loader cache before each."""
+    timings = []
+    for _ in range(repeat):
+        etf_data.invalidate()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
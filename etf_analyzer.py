@@ -108,10 +108,37 @@
 
 
 # Importing the required libraries and dependencies
-import numpy as np
+# Only the data libraries are imported up front: SQLAlchemy is loaded by the steps that write
+# to etf.db, and hvPlot when the first chart is drawn
+import os
 import pandas as pd
-import hvplot.pandas
-import sqlalchemy
+
+# Cached loader for the ticker tables ('time' is parsed and indexed at read time, through the stdlib sqlite3 driver)
+from etf_data import load_asset, table_names, ticker_names
+from etf_db import load_assets
+# Optional compact in-memory storage for the OHLCV data (enabled with ETF_COMPACT=1)
+from etf_compact import CompactPanel
+# Join engine for building the portfolio from any number of ticker tables
+from etf_join import join_assets
+# Screening queries that work with either the per-ticker or the consolidated 'prices' layout
+from etf_store import closing_prices_above, top_daily_returns
+# The analysis steps, as importable functions (cumulative returns are kept up to date incrementally,
+# with checkpoints stored next to the data in etf_checkpoints.db, so etf.db itself is never written to)
+from etf_pipeline import (
+    annualized_returns,
+    asset_cumulative_returns,
+    assets_cumulative_returns,
+    portfolio_cumulative_returns,
+    portfolio_returns,
+)
+# Derived results are memoized on the version of the data in etf.db, and shared between
+# Voila sessions through the on-disk cache directory
+from etf_cache import cached, configure as configure_cache
+configure_cache(directory=os.environ.get('ETF_CACHE_DIR', 'etf_cache'))
+# hvPlot line charts downsampled to a few thousand points (full detail is re-fetched when zooming in)
+from etf_plotting import line as line_plot
+# Per-stage timings and memory of the page, recorded when it is started with ETF_PROFILE=1
+import etf_profiling
 
 import warnings
 warnings.filterwarnings('ignore')
@@ -123,11 +150,9 @@ warnings.filterwarnings('ignore')
 # Create a temporary SQLite database and populate the database with content from the etf.db seed file
 database_connection_string = 'sqlite:///etf.db'
 
-# Create an engine to interact with the SQLite database
-engine = sqlalchemy.create_engine(database_connection_string)
-
 # Confirm that table names contained in the SQLite database.
-engine.table_names()
+# (read with the stdlib sqlite3 driver, the same list as sqlalchemy.create_engine(database_connection_string).table_names())
+table_names('etf.db')
 
 
 # ## Analyze a single asset in the FinTech ETF
@@ -157,12 +182,8 @@ SELECT * FROM pypl
 """
 
 # Use the query to read the PYPL data into a Pandas DataFrame
-pypl_dataframe = pd.read_sql_query(query, engine)
-
-# Remvove 0 timestamps from the 'time' column, keep only dates
-pypl_dataframe['time'] = pd.to_datetime(pypl_dataframe['time'])
-# Set the index column to 'time'
-pypl_dataframe = pypl_dataframe.set_index('time')
+# (the cached loader runs the equivalent query, parsing 'time' and setting it as the index)
+pypl_dataframe = load_asset('PYPL')
 
 
 # ### Step 2: Use the `head` and `tail` functions to review the first five and the last five rows of the DataFrame. Make a note of the beginning and end dates that are available from this dataset. You’ll use this information to complete your analysis.
@@ -187,7 +208,8 @@ display(pypl_dataframe.tail())
 
 
 # Create an interactive visualization with hvplot to plot the daily returns for PYPL.
-pypl_dataframe['daily_returns'].hvplot.line(
+line_plot(
+    pypl_dataframe['daily_returns'],
     x = 'time',
     xlabel = "Time",
     y = 'daily_returns',
@@ -208,10 +230,12 @@ pypl_dataframe['daily_returns'].hvplot.line(
 # Create an interactive visaulization with hvplot to plot the cumulative returns for PYPL.
 
 #Calculate the cumalitive returns (from the 'daily_returns' column)
-pypl_dataframe_cum_returns = (1 + pypl_dataframe['daily_returns']).cumprod() - 1
+# Equivalent to (1 + pypl_dataframe['daily_returns']).cumprod() - 1, but only the rows added since the last run are processed
+pypl_dataframe_cum_returns = cached('pypl_dataframe_cum_returns', lambda: asset_cumulative_returns('PYPL'))
 
 # Interactive plot
-pypl_dataframe_cum_returns.hvplot.line(
+line_plot(
+    pypl_dataframe_cum_returns,
     xlabel = "Time",
     ylabel = "Cumulative Returns",
     title = "(PYLP) Cumulative Returns",
@@ -265,18 +289,12 @@ pypl_dataframe_cum_returns.hvplot.line(
 
 # Write a SQL SELECT statement to select the time and close columns 
 # where the PYPL closing price was higher than 200.0.
-query = f"""
-SELECT time, close FROM pypl
-WHERE close > 200.0
-"""
-
-# Using the query, read the data from the database into a Pandas DataFrame
-pypl_higher_than_200 =  pd.read_sql_query(query, engine)
+#   SELECT time, close FROM pypl
+#   WHERE close > 200.0
+# (on a database migrated to the consolidated 'prices' table this runs as an index range scan)
 
-# Remvove 0 timestamps from the 'time' column, keep only dates
-pypl_higher_than_200['time'] = pd.to_datetime(pypl_higher_than_200['time'])
-# Set the index column to 'time'
-pypl_higher_than_200 = pypl_higher_than_200.set_index('time')
+# Using the query, read the data from the database into a Pandas DataFrame indexed by 'time'
+pypl_higher_than_200 = closing_prices_above('PYPL', 200.0)
 
 # Review the resulting DataFrame
 display(pypl_higher_than_200)
@@ -300,19 +318,13 @@ display(pypl_higher_than_200)
 
 # Write a SQL SELECT statement to select the time and daily_returns columns
 # Sort the results in descending order and return only the top 10 return values
-query = f"""
-SELECT time, daily_returns FROM pypl
-ORDER BY daily_returns DESC
-LIMIT 10 
-"""
-
-# Using the query, read the data from the database into a Pandas DataFrame
-pypl_top_10_returns = pd.read_sql_query(query, engine)
+#   SELECT time, daily_returns FROM pypl
+#   ORDER BY daily_returns DESC
+#   LIMIT 10
+# (on a database migrated to the consolidated 'prices' table this runs as an index range scan)
 
-# Remvove 0 timestamps from the 'time' column, keep only dates
-pypl_top_10_returns['time'] = pd.to_datetime(pypl_top_10_returns['time'])
-# Set the index column to 'time'
-pypl_top_10_returns = pypl_top_10_returns.set_index('time')
+# Using the query, read the data from the database into a Pandas DataFrame indexed by 'time'
+pypl_top_10_returns = top_daily_returns('PYPL', 10)
 
 # Review the resulting DataFrame
 display(pypl_top_10_returns)
@@ -361,107 +373,53 @@ display(pypl_top_10_returns)
 
 
 # First, lets review all the individual asset dataframes...
-
-query = f"""
-SELECT * FROM gdot
-"""
-GDOT_dataframe = pd.read_sql_query(query, engine)
+if os.environ.get('ETF_COMPACT'):
+    # Compact storage (float32 prices and a shared time axis in contiguous arrays), for long histories:
+    # the frames below are views on the panel rather than separate float64 copies
+    compact_panel = CompactPanel.from_database(['GDOT', 'GS', 'PYPL', 'SQ'], how='inner')
+    asset_dataframes = {symbol: compact_panel.asset(symbol) for symbol in compact_panel.symbols}
+else:
+    # The four tables are read concurrently, each on its own pooled read-only connection
+    # (PYPL was already loaded above, so it is served from the loader cache)
+    compact_panel = None
+    asset_dataframes = load_assets(['GDOT', 'GS', 'PYPL', 'SQ'])
+
+GDOT_dataframe = asset_dataframes['GDOT']
 display(GDOT_dataframe.tail())
 
-query = f"""
-SELECT * FROM gs
-"""
-GS_dataframe = pd.read_sql_query(query, engine)
+GS_dataframe = asset_dataframes['GS']
 display(GS_dataframe.tail())
 
-query = f"""
-SELECT * FROM pypl
-"""
-PYPL_dataframe = pd.read_sql_query(query, engine)
+PYPL_dataframe = asset_dataframes['PYPL']
 display(PYPL_dataframe.tail())
 
-query = f"""
-SELECT * FROM sq
-"""
-SQ_dataframe = pd.read_sql_query(query, engine)
+SQ_dataframe = asset_dataframes['SQ']
 display(SQ_dataframe.tail())
 
 
 # In[ ]:
 
 
-# Method #1: Select all columns from each asset
-
-# Wreate a SQL query to join each table in the portfolio into a single DataFrame 
-# Use the time column from each table as the basis for the join
-query = f"""
-SELECT * FROM gdot
-INNER JOIN gs   ON gdot.time = gs.time
-INNER JOIN pypl ON gdot.time = pypl.time
-INNER JOIN sq   ON gdot.time = sq.time    
-"""
-
-# Using the query, read the data from the database into a Pandas DataFrame
-etf_portfolio = pd.read_sql_query(query, engine)
-
-# Remove redundant time columns
-etf_portfolio = etf_portfolio.T.drop_duplicates().T
-
-# Remvove 0 timestamps from the 'time' column, keep only dates
-etf_portfolio['time'] = pd.to_datetime(etf_portfolio['time'])
-# Set the index column to 'time'
-etf_portfolio = etf_portfolio.set_index('time')
+# Join every ticker table in the portfolio into a single DataFrame on the 'time' column
+# The join engine generates the SELECT projection for each asset (so there are no redundant 'time' columns to remove)
+# and returns typed columns under heirarchical (symbol, field) column names
+ticker_tables = ticker_names()
 
-# Since each of the portfolios have the same column names (open, high, close, etc.), renaming the columns prepending asset names
-# Create heirarchical columns names based on symbol
-columns = [('GDOT','open'), ('GDOT','high'), ('GDOT','low'), ('GDOT','close'), ('GDOT','volume'), ('GDOT','daily_returns'),
-           ('GS','open'),   ('GS','high'),   ('GS','low'),   ('GS','close'),   ('GS','volume'),   ('GS','daily_returns'),
-           ('PYPL','open'), ('PYPL','high'), ('PYPL','low'), ('PYPL','close'), ('PYPL','volume'), ('PYPL','daily_returns'),
-           ('SQ','open'),   ('SQ','high'),   ('SQ','low'),   ('SQ','close'),   ('SQ','volume'),   ('SQ','daily_returns')]                                           
-etf_portfolio.columns = pd.MultiIndex.from_tuples(columns)
+# Equivalent to:
+#   SELECT gdot.time, gdot.open, ..., sq.daily_returns FROM gdot
+#   INNER JOIN gs   ON gdot.time = gs.time
+#   INNER JOIN pypl ON gdot.time = pypl.time
+#   INNER JOIN sq   ON gdot.time = sq.time
+if compact_panel is not None and compact_panel.symbols == ticker_tables:
+    # Compact mode: the joined columns are views on the panel, so the data is not copied a second time
+    etf_portfolio = compact_panel.portfolio()
+else:
+    etf_portfolio = cached('etf_portfolio', lambda: join_assets(ticker_tables, how='inner'), ticker_tables)
 
 # Review the resulting DataFrame
 display(etf_portfolio)
 
 
-# In[ ]:
-
-
-# Method #2: Filter out time from only one of the portfolios, and select which columns from each asset to extract
-
-# Wreate a SQL query to join each table in the portfolio into a single DataFrame 
-# Use the time column from each table as the basis for the join
-query = f"""
-SELECT 
-    gdot.time, gdot.open, gdot.high, gdot.low, gdot.close, gdot.volume, gdot.daily_returns,
-               gs.open,   gs.high,   gs.low,   gs.close,   gs.volume,   gs.daily_returns,
-               pypl.open, pypl.high, pypl.low, pypl.close, pypl.volume, pypl.daily_returns,
-               sq.open,   sq.high,   gdot.low, sq.close,   sq.volume,   sq.daily_returns
-FROM gdot
-INNER JOIN gs   ON gdot.time = gs.time
-INNER JOIN pypl ON gdot.time = pypl.time
-INNER JOIN sq   ON gdot.time = sq.time    
-"""
-
-# Using the query, read the data from the database into a Pandas DataFrame
-etf_portfolio = pd.read_sql_query(query, engine)
-
-# Remvove 0 timestamps from the 'time' column, keep only dates
-etf_portfolio['time'] = pd.to_datetime(etf_portfolio['time'])
-# Set the index column to 'time'
-etf_portfolio = etf_portfolio.set_index('time')
-
-# Since each of the portfolios have the same column names (open, high, close, etc.), renaming the columns prepending asset names
-# Create heirarchical columns names based on symbol
-columns = [('GDOT','open'), ('GDOT','high'), ('GDOT','low'), ('GDOT','close'), ('GDOT','volume'), ('GDOT','daily_returns'),
-           ('GS','open'),   ('GS','high'),   ('GS','low'),   ('GS','close'),   ('GS','volume'),   ('GS','daily_returns'),
-           ('PYPL','open'), ('PYPL','high'), ('PYPL','low'), ('PYPL','close'), ('PYPL','volume'), ('PYPL','daily_returns'),
-           ('SQ','open'),   ('SQ','high'),   ('SQ','low'),   ('SQ','close'),   ('SQ','volume'),   ('SQ','daily_returns')]                                           
-etf_portfolio.columns = pd.MultiIndex.from_tuples(columns)
-
-display(etf_portfolio)
-
-
 # ### Step 2: Create a DataFrame that averages the “daily_returns” columns for all four assets. Review the resulting DataFrame.
 
 # In[ ]:
@@ -469,35 +427,10 @@ display(etf_portfolio)
 
 # Create a DataFrame that displays the mean value of the “daily_returns” columns for all four assets.
 
-#  Filter via SQL
-query = f"""
-SELECT 
-    gdot.time, gdot.daily_returns,
-               gs.daily_returns,
-               pypl.daily_returns,
-               sq.daily_returns
-FROM gdot
-INNER JOIN gs   ON gdot.time = gs.time
-INNER JOIN pypl ON gdot.time = pypl.time
-INNER JOIN sq   ON gdot.time = sq.time    
-"""
-# Using the query, read the data from the database into a Pandas DataFrame
-etf_portfolio_returns_sql = pd.read_sql_query(query, engine)
-# Remvove 0 timestamps from the 'time' column, keep only dates
-etf_portfolio_returns_sql['time'] = pd.to_datetime(etf_portfolio_returns_sql['time'])
-# Set the index column to 'time'
-etf_portfolio_returns_sql = etf_portfolio_returns_sql.set_index('time')
-
-# Choose method #2 (SQL) approach (preferred to filter via SQL)
-etf_portfolio_returns = etf_portfolio_returns_sql
-
-# Since each of the portfolios have the same column names (daily returns), renaming the columns prepending the asset names.
-#etf_portfolio_returns.columns = ['GDOT_daily_returns', 'GS_daily_returns', 'PYPL_daily_returns', 'SQ_daily_returns']
-columns = [('GDOT','daily_returns',), ('GS','daily_returns',), ('PYPL','daily_returns',), ('SQ','daily_returns',)] 
-etf_portfolio_returns.columns = pd.MultiIndex.from_tuples(columns)
-
-# Add a column to the etf portfolio dataframe to include the mean daily returns
-etf_portfolio_returns[('ETF','mean_daily_returns',)] = etf_portfolio_returns.mean(axis=1)
+#  Filter via SQL: join only the 'daily_returns' column of each asset
+# The columns come back named (symbol, 'daily_returns'), e.g. ('GDOT', 'daily_returns'),
+# plus a ('ETF', 'mean_daily_returns') column holding the mean daily returns
+etf_portfolio_returns = cached('etf_portfolio_returns', lambda: portfolio_returns(ticker_tables), ticker_tables)
 
 # Review the resulting DataFrame
 display(etf_portfolio_returns)
@@ -510,7 +443,12 @@ display(etf_portfolio_returns)
 
 # Use the average daily returns provided by the etf_portfolio_returns DataFrame 
 # to calculate the annualized return for the portfolio. 
-annualized_etf_portfolio_returns = etf_portfolio_returns['ETF']['mean_daily_returns'] * 252
+# (the mean daily returns multiplied by the 252 trading days in a year)
+annualized_etf_portfolio_returns = cached(
+    'annualized_etf_portfolio_returns',
+    lambda: annualized_returns(etf_portfolio_returns['ETF']['mean_daily_returns']),
+    ticker_tables,
+)
 
 # Convert decimal to percentages (multiply by 100)
 annualized_etf_portfolio_returns_percent = annualized_etf_portfolio_returns * 100
@@ -530,7 +468,8 @@ display(etf_portfolio_returns)
 
 # Use the average daily returns provided by the etf_portfolio_returns DataFrame 
 # to calculate the cumulative returns
-etf_cumulative_returns = (1 + etf_portfolio_returns['ETF']['mean_daily_returns']).cumprod() - 1
+# Equivalent to (1 + etf_portfolio_returns['ETF']['mean_daily_returns']).cumprod() - 1, computed incrementally
+etf_cumulative_returns = cached('etf_cumulative_returns', lambda: portfolio_cumulative_returns(ticker_tables), ticker_tables)
 
 # Display the final cumulative return value
 display(etf_cumulative_returns)
@@ -547,10 +486,10 @@ display(etf_portfolio_returns)
 
 # Create an interactive visualization with hvplot to plot the daily returns for PYPL.
 # Create a dataframe of the individual dataframe asset daily returns
-asset_daily_returns_df = pd.concat([etf_portfolio_returns.iloc[:,0], etf_portfolio_returns.iloc[:,1], etf_portfolio_returns.iloc[:,2], etf_portfolio_returns.iloc[:,3]], axis=1)
-asset_daily_returns_df.columns = ['GDOT',' GS', 'PYPL', 'SQ']
+asset_daily_returns_df = etf_portfolio_returns[ticker_tables].droplevel(1, axis=1)
 
-asset_daily_returns_df.hvplot.line(
+line_plot(
+    asset_daily_returns_df,
     xlabel = "Time",
     ylabel = "Cumulative Returns",
     title = "(GDOT, GS, PYPL, SQ) Daily Returns",
@@ -566,9 +505,15 @@ asset_daily_returns_df.hvplot.line(
 
 # Create an interactive visaulization with hvplot to plot the cumulative returns for PYPL.
 
-etf_cumulative_return_ppyls = (1 + asset_daily_returns_df).cumprod() - 1
+# Equivalent to (1 + asset_daily_returns_df).cumprod() - 1: compounded over the dates of the portfolio
+etf_cumulative_return_ppyls = cached(
+    'etf_cumulative_return_ppyls',
+    lambda: assets_cumulative_returns(asset_daily_returns_df),
+    ticker_tables,
+)
 
-etf_cumulative_return_ppyls.hvplot.line(
+line_plot(
+    etf_cumulative_return_ppyls,
     xlabel = "Time",
     ylabel = "Cumulative Returns",
     title = "(GDOT, GS, PYPL, SQ) Cumulative Returns",
@@ -583,7 +528,8 @@ etf_cumulative_return_ppyls.hvplot.line(
 
 
 # Using hvplot, create an interactive line plot that visualizes the ETF portfolios cumulative return values.
-etf_portfolio_returns['ETF']['cum_returns'].hvplot.line(
+line_plot(
+    etf_portfolio_returns['ETF']['cum_returns'],
     xlabel = "Time",
     ylabel = "Cumulative Returns",
     title = "ETF Cumulative Returns",
@@ -597,5 +543,16 @@ etf_portfolio_returns['ETF']['cum_returns'].hvplot.line(
 # In[ ]:
 
 
+# Where the time of this page went (SQL execution and fetching, DataFrame construction, transforms, chart building),
+# as a collapsed "Performance" section when profiling is enabled; ETF_PROFILE_TRACE saves the full trace as JSON
+if etf_profiling.is_enabled():
+    display(etf_profiling.panel())
+    if os.environ.get('ETF_PROFILE_TRACE'):
+        etf_profiling.write_trace(os.environ['ETF_PROFILE_TRACE'])
+
+
+# In[ ]:
+
+
 
 
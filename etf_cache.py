@@ -0,0 +1,194 @@
+"""Memoized analytics results keyed on the version of the data in etf.db.
+
+The notebook rebuilds the same derived artifacts (the joined portfolio, the
+portfolio returns, annualized and cumulative returns) for every visitor.
+``cached`` stores them in an in-memory LRU cache and, when a cache directory
+is configured, also as pickles on disk so separate Voilà kernels (separate
+processes) are served from the same results.
+
+Entries are keyed on a data version computed from the content of the ticker
+data (row count and latest 'time' of every ticker).  It only changes when bars
+are added or removed, so writes that leave the prices alone (such as the
+cumulative return checkpoints) do not evict anything.  The content version is
+itself recomputed only when the database file changes.  Call ``clear`` after
+correcting prices in place.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+
+import etf_data
+import etf_profiling
+import etf_store
+
+
+# Number of results kept in memory
+CACHE_SIZE = 128
+
+# Directory for the on-disk cache (unset: memory only)
+CACHE_DIR = os.environ.get('ETF_CACHE_DIR')
+
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def data_version(database_path=etf_data.DATABASE_PATH):
+    """Return a short hash of the row count and latest 'time' of every ticker."""
+    key = (os.path.abspath(database_path), etf_data.database_version(database_path))
+    with _versions_lock:
+        if key in _versions:
+            return _versions[key]
+
+    if etf_store.layout(database_path) == 'long':
+        queries = [f'SELECT symbol, COUNT(*), MAX(time) FROM {etf_store.PRICES_TABLE} GROUP BY symbol ORDER BY symbol']
+    else:
+        queries = [
+            f"SELECT '{symbol}', COUNT(*), MAX(time) FROM {etf_data.quote_identifier(symbol)}"
+            for symbol in sorted(etf_data.wide_ticker_names(database_path))
+        ]
+    stats = []
+    with etf_data.read_connection(database_path) as connection:
+        for query in queries:
+            stats.extend(tuple(row) for row in connection.execute(query))
+    version = hashlib.sha1(repr(stats).encode()).hexdigest()[:16]
+
+    with _versions_lock:
+        _versions[key] = version
+    return version
+
+
+def _copy(value):
+    # DataFrames and Series are handed out as copies so callers can add columns freely
+    return value.copy() if hasattr(value, 'copy') else value
+
+
+class AnalyticsCache:
+    """LRU cache of computed results, optionally spilled to ``directory``."""
+
+    def __init__(self, maxsize=CACHE_SIZE, directory=CACHE_DIR):
+        self.memory = etf_data.LRUCache(maxsize)
+        self.directory = directory
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def _path(self, name, version, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f'{name}-{digest}-{version}.pkl')
+
+    def _read_disk(self, path):
+        try:
+            with open(path, 'rb') as file:
+                return pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write_disk(self, path, value):
+        os.makedirs(self.directory, exist_ok=True)
+        # Remove the entries of older data versions for the same key
+        prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+        for filename in os.listdir(self.directory):
+            if filename.startswith(prefix) and filename != os.path.basename(path):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+        temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+    def get_or_compute(self, name, compute, key=(), database_path=etf_data.DATABASE_PATH, copy=True):
+        """Return the cached result of ``compute()`` for ``name`` and ``key`` at the current data version."""
+        version = data_version(database_path)
+        memory_key = (name, os.path.abspath(database_path), version, key)
+        with self._lock:
+            if memory_key in self.memory:
+                self.memory_hits += 1
+                value = self.memory.get(memory_key)
+                etf_profiling.annotate(cache='memory')
+                return _copy(value) if copy else value
+            key_lock = self._key_locks.setdefault(memory_key, threading.Lock())
+
+        # Only one thread computes a given entry; the others wait and then reuse it
+        with key_lock:
+            try:
+                with self._lock:
+                    if memory_key in self.memory:
+                        self.memory_hits += 1
+                        value = self.memory.get(memory_key)
+                        etf_profiling.annotate(cache='memory')
+                        return _copy(value) if copy else value
+
+                value = None
+                path = None
+                if self.directory is not None:
+                    path = self._path(name, version, (os.path.abspath(database_path), key))
+                    value = self._read_disk(path)
+                if value is not None:
+                    etf_profiling.annotate(cache='disk')
+                    with self._lock:
+                        self.disk_hits += 1
+                else:
+                    etf_profiling.annotate(cache='miss')
+                    value = compute()
+                    with self._lock:
+                        self.misses += 1
+                    if path is not None:
+                        self._write_disk(path, value)
+
+                with self._lock:
+                    self.memory.put(memory_key, value)
+            finally:
+                # Also when compute() raised, or the lock of a failed key would be kept forever
+                with self._lock:
+                    self._key_locks.pop(memory_key, None)
+        return _copy(value) if copy else value
+
+    def clear(self, disk=True):
+        with self._lock:
+            self.memory.clear()
+        if disk and self.directory is not None and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if filename.endswith('.pkl'):
+                    os.remove(os.path.join(self.directory, filename))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self.memory),
+                'directory': self.directory,
+            }
+
+
+analytics_cache = AnalyticsCache()
+
+
+def configure(maxsize=CACHE_SIZE, directory=CACHE_DIR):
+    """Replace the shared cache, e.g. to enable the on-disk cache directory."""
+    global analytics_cache
+    analytics_cache = AnalyticsCache(maxsize, directory)
+    return analytics_cache
+
+
+def cached(name, compute, key=(), database_path=etf_data.DATABASE_PATH):
+    """Return ``compute()`` memoized in the shared cache under ``name`` and ``key``."""
+    with etf_profiling.stage('cached', entry=name):
+        return analytics_cache.get_or_compute(name, compute, tuple(key), database_path)
+
+
+def clear():
+    analytics_cache.clear()
+
+
+def cache_stats():
+    """Return the hit/miss counters of the shared cache."""
+    return analytics_cache.stats()
@@ -0,0 +1,177 @@
+"""Compact in-memory storage for the OHLCV data of many tickers.
+
+``pd.read_sql_query`` returns float64 prices, int64 volume and a datetime64
+index for every ticker, and the portfolio join copies all of it again, about
+100 bytes per row and ticker once both are held.  ``CompactPanel`` stores the
+same data once:
+
+* the prices and ``daily_returns`` as float32, in one contiguous
+  ``(time, symbol, field)`` array
+* the volume in the smallest unsigned integer type that holds it
+* a single time axis shared by every ticker, as integer offsets from the first
+  timestamp in the coarsest unit that represents them exactly (days for the
+  daily bars in etf.db, minutes for minute bars)
+
+That is about 24 bytes per row and ticker.  ``asset``, ``field`` and
+``portfolio`` return DataFrames whose columns are views on those arrays (no
+copy is made), shaped like ``etf_data.load_asset`` and ``etf_join.join_assets``
+results.  The arrays are read-only, so the analysis cannot modify the shared
+data in place; derive new frames or columns instead.
+
+float32 keeps about 7 significant digits, which is plenty for prices and daily
+returns but not for long compounding chains: convert with
+``.astype('float64')`` before a ``cumprod`` over many years.
+"""
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_join
+
+
+# Fields stored as float32, in storage order
+FLOAT_FIELDS = ['open', 'high', 'low', 'close', 'daily_returns']
+
+# Units tried for the time axis, coarsest first (nanoseconds per unit)
+TIME_UNITS = [('D', 86_400_000_000_000), ('h', 3_600_000_000_000), ('m', 60_000_000_000),
+              ('s', 1_000_000_000), ('ms', 1_000_000), ('us', 1_000), ('ns', 1)]
+
+
+def _smallest_unsigned(maximum):
+    for dtype in (np.uint16, np.uint32):
+        if maximum <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def encode_times(index):
+    """Return ``(epoch_ns, unit_ns, codes)`` encoding a sorted DatetimeIndex as small integers."""
+    nanoseconds = pd.DatetimeIndex(index).asi8
+    if not len(nanoseconds):
+        return 0, 1, np.empty(0, dtype=np.uint16)
+    epoch = int(nanoseconds[0])
+    offsets = nanoseconds - epoch
+    for _, unit in TIME_UNITS:
+        if not (offsets % unit).any():
+            break
+    codes = offsets // unit
+    return epoch, unit, codes.astype(_smallest_unsigned(codes.max()))
+
+
+def decode_times(epoch, unit, codes, name='time'):
+    """Return the DatetimeIndex encoded by ``encode_times``."""
+    return pd.DatetimeIndex(epoch + codes.astype(np.int64) * unit, name=name)
+
+
+class CompactPanel:
+    """OHLCV data of several tickers on a shared time axis, in compact NumPy arrays."""
+
+    def __init__(self, symbols, epoch, unit, time_codes, prices, volume):
+        self.symbols = list(symbols)
+        self.epoch = epoch
+        self.unit = unit
+        self.time_codes = time_codes
+        self.prices = prices
+        self.volume = volume
+        for array in (time_codes, prices, volume):
+            array.setflags(write=False)
+        self._index = None
+
+    @classmethod
+    def from_database(cls, symbols=None, how='outer', database_path=etf_data.DATABASE_PATH):
+        """Load the tickers one at a time into a panel on their inner or outer shared time axis."""
+        if how not in ('inner', 'outer'):
+            raise ValueError(f"Unknown alignment {how!r}, expected 'inner' or 'outer'")
+        if symbols is None:
+            symbols = etf_data.ticker_names(database_path)
+        # First pass: only the times, to size the arrays
+        axis = None
+        for symbol in symbols:
+            times = etf_data.query_asset(symbol, ['close'], database_path=database_path).index
+            if axis is None:
+                axis = times
+            else:
+                axis = axis.union(times) if how == 'outer' else axis.intersection(times)
+        axis = pd.DatetimeIndex([] if axis is None else axis).sort_values()
+
+        prices = np.full((len(axis), len(symbols), len(FLOAT_FIELDS)), np.nan, dtype=np.float32)
+        volumes = np.zeros((len(axis), len(symbols)), dtype=np.int64)
+        # Second pass: one full-precision ticker in memory at a time
+        for position, symbol in enumerate(symbols):
+            frame = etf_data.query_asset(symbol, database_path=database_path)
+            rows = axis.get_indexer(frame.index)
+            found = rows >= 0
+            prices[rows[found], position] = frame[FLOAT_FIELDS].to_numpy()[found]
+            volumes[rows[found], position] = frame['volume'].fillna(0).to_numpy()[found]
+
+        epoch, unit, codes = encode_times(axis)
+        volume_dtype = _smallest_unsigned(volumes.max() if volumes.size else 0)
+        return cls([symbol.upper() for symbol in symbols], epoch, unit, codes, prices, volumes.astype(volume_dtype))
+
+    @property
+    def index(self):
+        """The shared time axis as a DatetimeIndex (decoded once)."""
+        if self._index is None:
+            self._index = decode_times(self.epoch, self.unit, self.time_codes)
+        return self._index
+
+    @property
+    def nbytes(self):
+        """Bytes held by the compact arrays."""
+        return self.time_codes.nbytes + self.prices.nbytes + self.volume.nbytes
+
+    def _columns(self, position, fields):
+        columns = {}
+        for field in fields:
+            if field == 'volume':
+                columns[field] = self.volume[:, position]
+            else:
+                columns[field] = self.prices[:, position, FLOAT_FIELDS.index(field)]
+        return columns
+
+    def asset(self, symbol, fields=None):
+        """Return one ticker as a DataFrame of views, with the columns of ``etf_data.load_asset``."""
+        fields = etf_data.PRICE_COLUMNS if fields is None else fields
+        position = self.symbols.index(symbol.upper())
+        return pd.DataFrame(self._columns(position, fields), index=self.index, copy=False)
+
+    def field(self, field):
+        """Return one field of every ticker as a (time x symbol) DataFrame view."""
+        if field == 'volume':
+            values = self.volume
+        else:
+            values = self.prices[:, :, FLOAT_FIELDS.index(field)]
+        return pd.DataFrame(values, index=self.index, columns=self.symbols, copy=False)
+
+    def portfolio(self, fields=None):
+        """Return every ticker under (symbol, field) columns, like ``etf_join.join_assets``."""
+        fields = etf_data.PRICE_COLUMNS if fields is None else fields
+        columns = {}
+        for position, symbol in enumerate(self.symbols):
+            for field, values in self._columns(position, fields).items():
+                columns[symbol, field] = values
+        frame = pd.DataFrame(columns, index=self.index, copy=False)
+        frame.columns = pd.MultiIndex.from_tuples(frame.columns)
+        return frame
+
+
+def frame_nbytes(frame):
+    """Bytes held by a DataFrame, its index included."""
+    return int(frame.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(symbols=None, database_path=etf_data.DATABASE_PATH):
+    """Return the bytes held by the float64 frames (per ticker plus the joined portfolio) and by the panel."""
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    frames = sum(frame_nbytes(etf_data.query_asset(symbol, database_path=database_path)) for symbol in symbols)
+    portfolio = frame_nbytes(etf_join.join_assets(symbols, how='outer', database_path=database_path))
+    panel = CompactPanel.from_database(symbols, database_path=database_path).nbytes
+    return {
+        'frames': frames,
+        'portfolio': portfolio,
+        'compact': panel,
+        'ratio_frames': frames / panel,
+        'ratio_frames_and_portfolio': (frames + portfolio) / panel,
+    }
@@ -0,0 +1,293 @@
+"""Cached data access for the ETF analyzer.
+
+Each ticker in ``etf.db`` lives in its own table with the columns
+``time, open, high, low, close, volume, daily_returns``.  The helpers in this
+module read those tables (or arbitrary queries) straight into DataFrames with
+``time`` already parsed and set as the index, and keep the results in an
+in-process LRU cache so repeated reads of the same data are free.
+
+Cached entries are keyed on the database file version (size and modification
+time of ``etf.db`` and its WAL file), so any write to the database invalidates
+them automatically.  When an up-to-date Arrow snapshot of a ticker exists (see
+``etf_snapshot``) it is memory-mapped instead of querying SQLite.
+
+Reads go through the standard library ``sqlite3`` driver, on read-only
+connections borrowed from the pool in ``etf_db``, so importing this module does
+not import SQLAlchemy.  SQLAlchemy is only loaded when ``get_engine`` is
+called, by the modules that write to the database.
+"""
+
+import math
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+import etf_profiling
+
+
+# Default location of the SQLite database
+DATABASE_PATH = 'etf.db'
+
+# Columns stored in every per-ticker table (besides 'time')
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'daily_returns']
+
+# Timestamp layout used by the 'time' column in etf.db
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Maximum number of DataFrames kept in the in-process cache
+CACHE_SIZE = 64
+
+
+class LRUCache:
+    """A small least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        # Drop every entry whose key matches the predicate
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data), 'maxsize': self.maxsize}
+
+
+_cache = LRUCache()
+_cache_lock = threading.Lock()
+_engines = {}
+
+
+def _ln(value):
+    # NULL outside the domain, as SQLite's built-in LN
+    return None if value is None or value <= 0 else math.log(value)
+
+
+def _exp(value):
+    return None if value is None else math.exp(value)
+
+
+def _sqrt(value):
+    return None if value is None or value < 0 else math.sqrt(value)
+
+
+# Math functions used by the SQL-side analytics; not every SQLite build ships them
+SQL_FUNCTIONS = {'LN': _ln, 'EXP': _exp, 'SQRT': _sqrt}
+
+
+def register_functions(dbapi_connection, connection_record=None):
+    """Add the ``SQL_FUNCTIONS`` missing from SQLite to a DBAPI connection."""
+    for name, function in SQL_FUNCTIONS.items():
+        # Keep SQLite's built-in version when it has one, it avoids a Python call per row
+        try:
+            dbapi_connection.execute(f'SELECT {name}(1)')
+        except sqlite3.OperationalError:
+            dbapi_connection.create_function(name, 1, function, deterministic=True)
+
+
+def read_connection(database_path=DATABASE_PATH):
+    """Borrow a pooled read-only ``sqlite3`` connection: ``with read_connection(path) as connection:``."""
+    # Imported here because etf_db builds on this module
+    import etf_db
+    return etf_db.get_pool(database_path).connection()
+
+
+def get_engine(database_path=DATABASE_PATH):
+    """Return a shared SQLAlchemy engine for the database at ``database_path``."""
+    # Imported here so that read-only use of this module does not pay for SQLAlchemy
+    import sqlalchemy
+
+    database_path = os.path.abspath(database_path)
+    if database_path not in _engines:
+        engine = sqlalchemy.create_engine(f'sqlite:///{database_path}')
+        sqlalchemy.event.listen(engine, 'connect', register_functions)
+        _engines[database_path] = engine
+    return _engines[database_path]
+
+
+def table_names(database_path=DATABASE_PATH):
+    """Return the names of all the tables contained in the database."""
+    query = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    with read_connection(database_path) as connection:
+        return [row[0] for row in connection.execute(query)]
+
+
+def wide_ticker_names(database_path=DATABASE_PATH):
+    """Return the per-ticker tables (a 'time' column plus the price columns)."""
+    required = {'time', *PRICE_COLUMNS}
+    tickers = []
+    tables = table_names(database_path)
+    with read_connection(database_path) as connection:
+        for table in tables:
+            columns = {row[1] for row in connection.execute(f'PRAGMA table_info({quote_identifier(table)})')}
+            if required <= columns and 'symbol' not in columns:
+                tickers.append(table)
+    return tickers
+
+
+def ticker_names(database_path=DATABASE_PATH):
+    """Return the tickers held in the database, whichever layout it uses."""
+    # Imported here because etf_store builds on this module
+    import etf_store
+    if etf_store.layout(database_path) == 'long':
+        return etf_store.long_symbols(database_path)
+    return wide_ticker_names(database_path)
+
+
+def database_version(database_path=DATABASE_PATH):
+    """Return a token that changes whenever the database file is written to."""
+    version = []
+    for path in (database_path, database_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            version.append(None)
+        else:
+            version.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(version)
+
+
+def format_time(value):
+    """Format a date-like value the same way 'time' is stored in etf.db."""
+    return pd.Timestamp(value).strftime(TIME_FORMAT)
+
+
+def quote_identifier(name):
+    """Quote a table or column name for use in a SQLite statement."""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _cached_read(key, database_path, read, copy):
+    key = (os.path.abspath(database_path), database_version(database_path)) + key
+    with _cache_lock:
+        frame = _cache.get(key)
+    etf_profiling.annotate(cache='miss' if frame is None else 'hit')
+    if frame is None:
+        frame = read()
+        with _cache_lock:
+            _cache.put(key, frame)
+    return frame.copy() if copy else frame
+
+
+def load_asset(symbol, columns=None, start=None, end=None, database_path=DATABASE_PATH, copy=True):
+    """Load one ticker table into a DataFrame indexed by 'time'.
+
+    ``columns`` selects a subset of the price columns and ``start``/``end``
+    restrict the (inclusive) date range.  Results are cached until the
+    database changes; pass ``copy=False`` to get the cached frame itself
+    instead of a copy (do not modify it in that case).
+    """
+    symbol = symbol.upper()
+    columns = tuple(PRICE_COLUMNS if columns is None else columns)
+    unknown = set(columns) - set(PRICE_COLUMNS)
+    if unknown:
+        raise ValueError(f'Unknown column(s) for {symbol}: {sorted(unknown)}')
+    start = None if start is None else format_time(start)
+    end = None if end is None else format_time(end)
+
+    def read():
+        # Prefer the memory-mapped Arrow snapshot when it is newer than the database
+        frame = _read_snapshot(symbol, columns, database_path)
+        if frame is not None:
+            return frame.loc[start:end]
+        return query_asset(symbol, columns, start, end, database_path)
+
+    with etf_profiling.stage('load_asset', symbol=symbol):
+        return _cached_read(('asset', symbol, columns, start, end), database_path, read, copy)
+
+
+def query_asset(symbol, columns=None, start=None, end=None, database_path=DATABASE_PATH):
+    """Read one ticker straight from the database (uncached), in either storage layout."""
+    import etf_store
+    columns = PRICE_COLUMNS if columns is None else columns
+    start = None if start is None else format_time(start)
+    end = None if end is None else format_time(end)
+    query, params = etf_store.asset_query(symbol, columns, start, end, database_path)
+    return read_sql(query, database_path, params=params)
+
+
+def _read_snapshot(symbol, columns, database_path):
+    # Imported here because etf_snapshot builds on this module
+    import etf_snapshot
+    return etf_snapshot.read_snapshot(symbol, list(columns), database_path)
+
+
+def read_query(query, params=None, database_path=DATABASE_PATH, index_col='time', copy=True):
+    """Run a SQL query and return the result with 'time' parsed and set as the index.
+
+    Results are cached on the query text and parameters until the database
+    changes.
+    """
+    params_key = tuple(sorted((params or {}).items()))
+
+    def read():
+        return read_sql(query, database_path, params=params, index_col=index_col)
+
+    return _cached_read(('query', query, params_key, index_col), database_path, read, copy)
+
+
+def read_sql(query, database_path=DATABASE_PATH, params=None, index_col='time'):
+    """Run a SQL query (uncached), parsing 'time' at read time.
+
+    The same steps as ``pd.read_sql_query(..., parse_dates=['time'])``, split
+    up so that ``etf_profiling`` can time each of them.
+    """
+    with read_connection(database_path) as connection:
+        with etf_profiling.stage('sql.execute'):
+            cursor = connection.execute(query, params or ())
+        with etf_profiling.stage('sql.fetch') as stage:
+            rows = cursor.fetchall()
+            stage.set(rows=len(rows))
+        columns = [description[0] for description in cursor.description]
+    with etf_profiling.stage('frame.build', rows=len(rows)):
+        frame = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    with etf_profiling.stage('frame.parse_time', rows=len(rows)):
+        if 'time' in frame:
+            frame['time'] = pd.to_datetime(frame['time'])
+        if index_col is not None:
+            frame = frame.set_index(index_col)
+    return frame
+
+
+def invalidate(symbol=None):
+    """Drop cached results, either all of them or just those for one ticker."""
+    with _cache_lock:
+        if symbol is None:
+            _cache.clear()
+        else:
+            symbol = symbol.upper()
+            _cache.discard(lambda key: key[2] == 'asset' and key[3] == symbol)
+
+
+def cache_stats():
+    """Return the hit/miss counters of the in-process cache."""
+    return _cache.stats()
@@ -0,0 +1,150 @@
+"""Pooled read-only connections to etf.db.
+
+Every read in the analyzer (``etf_data.read_sql``, the table listing, the
+cache's data version) borrows a connection from a ``ConnectionPool`` instead
+of opening its own:
+
+* connections are opened through a read-only URI (``mode=ro``), so readers
+  never take a write lock, and with ``immutable=1`` when the file is a frozen
+  snapshot (not writable), which also skips SQLite's file locking
+* each connection is set up once with the ``READ_PRAGMAS`` (memory-mapped I/O,
+  a larger page cache, in-memory temporary storage) and the math functions
+  from ``etf_data``
+* at most ``size`` connections are open per database; further readers wait
+  for one to be returned
+
+Pools are created per database file and per process, so worker processes
+forked after a read open their own connections.  ``load_assets`` reads several
+tickers concurrently on a thread pool; ``benchmarks/bench_concurrent_reads.py``
+measures the throughput for 1, 4 and 16 readers.
+"""
+
+import contextlib
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import etf_data
+import etf_profiling
+
+
+# Maximum number of open connections per database
+POOL_SIZE = 8
+
+# Applied to every pooled connection
+READ_PRAGMAS = {
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+    'query_only': 'ON',
+}
+
+
+def read_only_uri(database_path, immutable=False):
+    """Return the ``file:`` URI opening ``database_path`` read-only (and immutable when asked)."""
+    uri = 'file:' + quote(os.path.abspath(database_path)) + '?mode=ro'
+    return uri + '&immutable=1' if immutable else uri
+
+
+def is_frozen(database_path):
+    """Return True when the database file cannot be written to (e.g. a published snapshot)."""
+    return os.path.exists(database_path) and not os.access(database_path, os.W_OK)
+
+
+class ConnectionPool:
+    """A bounded pool of read-only ``sqlite3`` connections to one database."""
+
+    def __init__(self, database_path=etf_data.DATABASE_PATH, size=POOL_SIZE, immutable=False, pragmas=None):
+        self.database_path = os.path.abspath(database_path)
+        self.uri = read_only_uri(database_path, immutable)
+        self.size = size
+        self.pragmas = READ_PRAGMAS if pragmas is None else pragmas
+        self.opened = 0
+        self.waits = 0
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+
+    def _open(self):
+        connection = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        etf_data.register_functions(connection)
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a ``with`` block."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.waits += 1
+            self._slots.acquire()
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._open()
+            try:
+                yield connection
+            finally:
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections (borrowed ones stay open until they are returned)."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            return {'size': self.size, 'opened': self.opened, 'idle': self._idle.qsize(), 'waits': self.waits}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database_path=etf_data.DATABASE_PATH, immutable=None, size=POOL_SIZE):
+    """Return the shared pool for ``database_path`` in this process.
+
+    ``immutable`` defaults to ``is_frozen(database_path)``.
+    """
+    if immutable is None:
+        immutable = is_frozen(database_path)
+    key = (os.getpid(), os.path.abspath(database_path), immutable)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(database_path, size, immutable)
+        return _pools[key]
+
+
+def close_pools():
+    """Close the idle connections of every pool and forget the pools."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def load_assets(symbols=None, columns=None, database_path=etf_data.DATABASE_PATH, workers=None):
+    """Load several tickers concurrently with ``etf_data.load_asset`` and return them by symbol.
+
+    ``workers`` defaults to one thread per ticker, up to the pool size.
+    """
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    workers = workers or min(len(symbols), POOL_SIZE) or 1
+    with etf_profiling.stage('load_assets', symbols=len(symbols)), ThreadPoolExecutor(max_workers=workers) as executor:
+        frames = executor.map(
+            lambda symbol: etf_data.load_asset(symbol, columns, database_path=database_path), symbols
+        )
+        return dict(zip(symbols, frames))
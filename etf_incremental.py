@@ -0,0 +1,305 @@
+"""Incremental cumulative returns with persisted checkpoints.
+
+``(1 + r).cumprod() - 1`` over the whole history is recomputed every time the
+notebook runs, although only a few bars arrive each day.  This module keeps
+the cumulative return series of each ticker and of the portfolio, together
+with a checkpoint per series holding the last processed time, the running sum
+of ``log(1 + r)`` and the last cumulative value.  An update only reads and
+processes the rows after the checkpoint.
+
+They are stored in a companion database next to the price data
+(``etf_checkpoints.db`` for ``etf.db``, see ``checkpoint_path``), so running
+the notebook never writes to the price database itself.  It is derived data:
+delete it to start over.
+
+Compounding is done on the log-return sum, which stays accurate over long
+histories where a running product would accumulate rounding error.  Missing
+returns are skipped as ``cumprod`` does: the row gets NaN and the running value
+carries over.
+
+``asset_returns`` and ``portfolio_returns`` never write: they read the stored
+series up to its checkpoint and compound the newer rows in memory, so readers
+(e.g. the HTTP service) get current figures while the updates run in one place
+(``etf_ingest --update-checkpoints`` or a single background task).
+
+Rows are expected to be appended in time order.  Call ``rebuild`` after
+back-filling or correcting history before a checkpoint.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+import etf_data
+import etf_sql_analytics
+import etf_store
+
+
+CHECKPOINTS_TABLE = 'cumulative_checkpoints'
+RETURNS_TABLE = 'cumulative_returns'
+
+# Name of the equal-weight portfolio series
+PORTFOLIO_SERIES = 'ETF'
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+        series TEXT PRIMARY KEY,
+        members TEXT NOT NULL,
+        time TIMESTAMP NOT NULL,
+        log_sum FLOAT NOT NULL,
+        cum_returns FLOAT NOT NULL,
+        rows BIGINT NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {RETURNS_TABLE} (
+        series TEXT NOT NULL,
+        time TIMESTAMP NOT NULL,
+        daily_returns FLOAT,
+        cum_returns FLOAT,
+        PRIMARY KEY (series, time)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def checkpoint_path(database_path=etf_data.DATABASE_PATH):
+    """Return the companion database holding the checkpoints and series for ``database_path``."""
+    return os.path.splitext(database_path)[0] + '_checkpoints.db'
+
+
+def create_schema(connection):
+    for statement in SCHEMA:
+        connection.execute(sqlalchemy.text(statement))
+
+
+def checkpoint(series, database_path=etf_data.DATABASE_PATH):
+    """Return the checkpoint row of ``series`` as a dict, or None."""
+    path = checkpoint_path(database_path)
+    if not os.path.exists(path) or CHECKPOINTS_TABLE not in etf_data.table_names(path):
+        return None
+    with etf_data.get_engine(path).connect() as connection:
+        row = connection.execute(
+            sqlalchemy.text(f'SELECT * FROM {CHECKPOINTS_TABLE} WHERE series = :series'), {'series': series}
+        ).fetchone()
+    return None if row is None else dict(row._mapping)
+
+
+def _reset(connection, series):
+    for table in (CHECKPOINTS_TABLE, RETURNS_TABLE):
+        connection.execute(sqlalchemy.text(f'DELETE FROM {table} WHERE series = :series'), {'series': series})
+
+
+def _compound(rows, log_sum=0.0):
+    # (times, daily returns, cumulative returns, running log sums) of (time, return) rows, continuing from ``log_sum``
+    times = [row[0] for row in rows]
+    returns = np.array([np.nan if row[1] is None else row[1] for row in rows], dtype=float)
+    missing = np.isnan(returns)
+    log_sums = log_sum + np.cumsum(np.where(missing, 0.0, np.log1p(returns)))
+    cumulative = np.expm1(log_sums)
+    cumulative[missing] = np.nan
+    return times, returns, cumulative, log_sums
+
+
+def _update(series, members, new_rows_query, database_path):
+    # Process the rows after the checkpoint of ``series`` in one transaction of the checkpoint database
+    with etf_data.get_engine(checkpoint_path(database_path)).begin() as connection:
+        create_schema(connection)
+        state = connection.execute(
+            sqlalchemy.text(f'SELECT * FROM {CHECKPOINTS_TABLE} WHERE series = :series'), {'series': series}
+        ).fetchone()
+        if state is not None and state.members != members:
+            # The portfolio composition changed, so the stored series no longer applies
+            _reset(connection, series)
+            state = None
+
+        query, params = new_rows_query(None if state is None else state.time)
+        with etf_data.read_connection(database_path) as source:
+            rows = source.execute(query, params).fetchall()
+        if not rows:
+            return 0
+
+        times, returns, cumulative, log_sum = _compound(rows, 0.0 if state is None else state.log_sum)
+        missing = np.isnan(returns)
+
+        connection.execute(
+            sqlalchemy.text(
+                f'INSERT OR REPLACE INTO {RETURNS_TABLE} (series, time, daily_returns, cum_returns) '
+                'VALUES (:series, :time, :daily_returns, :cum_returns)'
+            ),
+            [
+                {
+                    'series': series,
+                    'time': time,
+                    'daily_returns': None if is_missing else float(value),
+                    'cum_returns': None if is_missing else float(total),
+                }
+                for time, value, total, is_missing in zip(times, returns, cumulative, missing)
+            ],
+        )
+        connection.execute(
+            sqlalchemy.text(
+                f'INSERT OR REPLACE INTO {CHECKPOINTS_TABLE} (series, members, time, log_sum, cum_returns, rows) '
+                'VALUES (:series, :members, :time, :log_sum, :cum_returns, :rows)'
+            ),
+            {
+                'series': series,
+                'members': members,
+                'time': times[-1],
+                'log_sum': float(log_sum[-1]),
+                'cum_returns': float(np.expm1(log_sum[-1])),
+                'rows': (0 if state is None else state.rows) + len(rows),
+            },
+        )
+    return len(rows)
+
+
+def _asset_rows(symbol, database_path):
+    # new_rows_query of one ticker: its (time, daily_returns) rows after a time
+    def new_rows_query(after):
+        return etf_store.asset_query(symbol, ['daily_returns'], database_path=database_path, after=after)
+
+    return new_rows_query
+
+
+def _portfolio_rows(symbols, database_path):
+    # new_rows_query of the equal-weight portfolio: its (time, mean_daily_returns) rows after a time
+    def new_rows_query(after):
+        portfolio, params = etf_sql_analytics.portfolio_mean_query(symbols, database_path)
+        query = f'SELECT time, mean_daily_returns FROM ({portfolio}) AS portfolio'
+        if after is not None:
+            query += ' WHERE time > :after'
+            params = dict(params, after=after)
+        return query + ' ORDER BY time', params
+
+    return new_rows_query
+
+
+def _symbols(symbols, database_path):
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    return [symbol.upper() for symbol in symbols]
+
+
+def update_asset(symbol, database_path=etf_data.DATABASE_PATH):
+    """Extend the cumulative returns of ``symbol``; returns the number of new rows processed."""
+    symbol = symbol.upper()
+    return _update(symbol, symbol, _asset_rows(symbol, database_path), database_path)
+
+
+def update_portfolio(symbols=None, series=PORTFOLIO_SERIES, database_path=etf_data.DATABASE_PATH):
+    """Extend the cumulative returns of the equal-weight portfolio of ``symbols``."""
+    symbols = _symbols(symbols, database_path)
+    return _update(series, ','.join(symbols), _portfolio_rows(symbols, database_path), database_path)
+
+
+def update_all(database_path=etf_data.DATABASE_PATH):
+    """Update every ticker and the equal-weight portfolio; returns the new rows per series."""
+    symbols = etf_data.ticker_names(database_path)
+    counts = {symbol.upper(): update_asset(symbol, database_path) for symbol in symbols}
+    counts[PORTFOLIO_SERIES] = update_portfolio(symbols, database_path=database_path)
+    return counts
+
+
+def rebuild(series, database_path=etf_data.DATABASE_PATH):
+    """Drop the stored series and its checkpoint so the next update starts from scratch."""
+    with etf_data.get_engine(checkpoint_path(database_path)).begin() as connection:
+        create_schema(connection)
+        _reset(connection, series)
+
+
+def stored_cumulative_returns(series, database_path=etf_data.DATABASE_PATH):
+    """Read the persisted cumulative returns of ``series`` as a Series indexed by 'time'."""
+    query = f'SELECT time, cum_returns FROM {RETURNS_TABLE} WHERE series = :series ORDER BY time'
+    frame = etf_data.read_query(query, params={'series': series}, database_path=checkpoint_path(database_path))
+    return frame['cum_returns'].rename(series)
+
+
+def stored_returns(series, start=None, end=None, database_path=etf_data.DATABASE_PATH):
+    """Read the persisted daily and cumulative returns of ``series`` between ``start`` and ``end`` (inclusive)."""
+    query = f'SELECT time, daily_returns, cum_returns FROM {RETURNS_TABLE} WHERE series = :series'
+    params = {'series': series}
+    if start is not None:
+        query += ' AND time >= :start'
+        params['start'] = etf_data.format_time(start)
+    if end is not None:
+        query += ' AND time <= :end'
+        params['end'] = etf_data.format_time(end)
+    return etf_data.read_query(query + ' ORDER BY time', params=params, database_path=checkpoint_path(database_path))
+
+
+def _read(series, members, new_rows_query, start, end, database_path):
+    # The stored rows of ``series`` up to its checkpoint, then the rows after it compounded here: nothing is written
+    state = checkpoint(series, database_path)
+    if state is not None and state['members'] != members:
+        state = None
+    query, params = new_rows_query(None if state is None else state['time'])
+    with etf_data.read_connection(database_path) as source:
+        rows = source.execute(query, params).fetchall()
+    times, returns, cumulative, _ = _compound(rows, 0.0 if state is None else state['log_sum'])
+    frame = pd.DataFrame(
+        {'daily_returns': returns, 'cum_returns': cumulative},
+        index=pd.DatetimeIndex(pd.to_datetime(times), name='time'),
+    )
+    frame = frame.loc[None if start is None else pd.Timestamp(start):None if end is None else pd.Timestamp(end)]
+    if state is None:
+        return frame
+    stored = stored_returns(series, start, end, database_path)
+    # An update committed since the checkpoint was read is already in ``frame``
+    stored = stored.loc[:pd.Timestamp(state['time'])]
+    return pd.concat([stored, frame])
+
+
+def asset_returns(symbol, start=None, end=None, database_path=etf_data.DATABASE_PATH):
+    """Return the daily and cumulative returns of ``symbol`` without writing anything.
+
+    The stored series is read up to its checkpoint and the newer rows are
+    compounded on top of it; with no checkpoint the whole series is computed.
+    """
+    symbol = symbol.upper()
+    return _read(symbol, symbol, _asset_rows(symbol, database_path), start, end, database_path)
+
+
+def portfolio_returns(symbols=None, series=PORTFOLIO_SERIES, start=None, end=None,
+                      database_path=etf_data.DATABASE_PATH):
+    """Return the daily and cumulative returns of the equal-weight portfolio without writing anything."""
+    symbols = _symbols(symbols, database_path)
+    return _read(series, ','.join(symbols), _portfolio_rows(symbols, database_path), start, end, database_path)
+
+
+def _refresh(update, read):
+    if update is not None:
+        try:
+            update()
+        except sqlalchemy.exc.OperationalError:
+            # Read-only or locked checkpoint database: nothing is persisted, the read computes what is missing
+            pass
+    return read()
+
+
+def asset_cumulative_returns(symbol, database_path=etf_data.DATABASE_PATH, update=True):
+    """Return the cumulative returns of ``symbol``, first bringing the stored series up to date if ``update``."""
+    symbol = symbol.upper()
+    return _refresh(
+        (lambda: update_asset(symbol, database_path)) if update else None,
+        lambda: asset_returns(symbol, database_path=database_path)['cum_returns'].rename(symbol),
+    )
+
+
+def portfolio_cumulative_returns(symbols=None, series=PORTFOLIO_SERIES, database_path=etf_data.DATABASE_PATH,
+                                 update=True):
+    """Return the cumulative returns of the equal-weight portfolio, first updating the stored series if ``update``."""
+    return _refresh(
+        (lambda: update_portfolio(symbols, series, database_path)) if update else None,
+        lambda: portfolio_returns(symbols, series, database_path=database_path)['cum_returns'].rename(series),
+    )
+
+
+def cumulative_returns_frame(symbols, database_path=etf_data.DATABASE_PATH):
+    """Return the cumulative returns of several tickers as columns of one DataFrame."""
+    return pd.concat(
+        {symbol.upper(): asset_cumulative_returns(symbol, database_path) for symbol in symbols}, axis=1
+    )
@@ -0,0 +1,274 @@
+"""Append new OHLCV bars to etf.db.
+
+Bars are read as CSV (with a header row) or JSON lines, from a file or stdin,
+with the fields ``symbol, time, open, high, low, close, volume``.  For every
+bar ``daily_returns`` is computed from the previous close of the same symbol
+(looked up in the database for the first bar of a symbol), and each batch is
+appended with ``executemany`` inside a single transaction.
+
+The database is switched to WAL mode so readers are not blocked while a batch
+is written, and put back in its previous journal mode once ``ingest`` is done.
+The connection uses relaxed ``synchronous`` plus larger
+``cache_size``/``mmap_size`` settings.  Ingesting is idempotent on
+``(symbol, time)``: bars already in the database (or repeated in the input) are
+skipped, and the return of the next bar is computed from the stored close.  Bars are
+expected to arrive in time order per symbol.
+
+Bars go to the per-ticker tables (creating a table for a new symbol) or, once
+the database has been migrated with ``etf_store``, to the ``prices`` table::
+
+    python etf_ingest.py new_bars.csv --database etf.db
+    tail -f feed.jsonl | python etf_ingest.py - --format jsonl
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import etf_data
+import etf_store
+
+
+# Connection settings used while ingesting
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # 64 MB
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# Fields expected for every bar
+BAR_FIELDS = ['symbol', 'time', 'open', 'high', 'low', 'close', 'volume']
+
+FORMATS = ('csv', 'jsonl')
+
+BATCH_SIZE = 10_000
+
+SYMBOL_PATTERN = re.compile(r'^[A-Za-z0-9._-]+$')
+
+
+def connect(database_path=etf_data.DATABASE_PATH):
+    """Open a connection to the database with the ingest pragmas applied."""
+    connection = sqlite3.connect(database_path, isolation_level=None)
+    for name, value in PRAGMAS.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+    return connection
+
+
+def _journal_mode(database_path):
+    if not os.path.exists(database_path):
+        return 'delete'
+    connection = sqlite3.connect(database_path)
+    try:
+        return connection.execute('PRAGMA journal_mode').fetchone()[0].lower()
+    finally:
+        connection.close()
+
+
+def read_bars(source, format=None):
+    """Yield bars (dicts) from the file ``source``, or from stdin when ``source`` is '-'."""
+    if format is None:
+        format = 'jsonl' if str(source).endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+    if format not in FORMATS:
+        raise ValueError(f'Unknown format {format!r}, expected one of {FORMATS}')
+    stream = sys.stdin if source == '-' else open(source, newline='')
+    try:
+        if format == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def parse_bar(bar):
+    """Validate one bar and convert its fields to the stored types."""
+    missing = [field for field in BAR_FIELDS if bar.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f'Bar is missing {missing}: {bar}')
+    symbol = str(bar['symbol']).upper()
+    if not SYMBOL_PATTERN.match(symbol):
+        raise ValueError(f'Invalid symbol {symbol!r}')
+    return {
+        'symbol': symbol,
+        'time': etf_data.format_time(bar['time']),
+        'open': float(bar['open']),
+        'high': float(bar['high']),
+        'low': float(bar['low']),
+        'close': float(bar['close']),
+        'volume': int(float(bar['volume'])),
+    }
+
+
+def _create_ticker_table(connection, symbol):
+    table = etf_data.quote_identifier(symbol)
+    connection.execute(
+        f'CREATE TABLE IF NOT EXISTS {table} ('
+        'time TIMESTAMP, open FLOAT, high FLOAT, low FLOAT, close FLOAT, volume BIGINT, daily_returns FLOAT)'
+    )
+    connection.execute(f'CREATE INDEX IF NOT EXISTS {etf_data.quote_identifier(f"ix_{symbol}_time")} ON {table} (time)')
+    # Keep new tickers screenable when the other tables have the screening indexes
+    import etf_screen
+    if etf_screen.has_indexes(connection):
+        etf_screen.create_ticker_indexes(connection, symbol)
+
+
+def _previous_close(connection, symbol, before, layout):
+    if layout == 'long':
+        row = connection.execute(
+            f'SELECT close FROM {etf_store.PRICES_TABLE} WHERE symbol = ? AND time < ? ORDER BY time DESC LIMIT 1',
+            (symbol, before),
+        ).fetchone()
+    else:
+        row = connection.execute(
+            f'SELECT close FROM {etf_data.quote_identifier(symbol)} WHERE time < ? ORDER BY time DESC LIMIT 1',
+            (before,),
+        ).fetchone()
+    return None if row is None else row[0]
+
+
+def _stored_closes(connection, symbol, start, end, layout):
+    # {time: close} of the bars already stored between ``start`` and ``end``
+    if layout == 'long':
+        rows = connection.execute(
+            f'SELECT time, close FROM {etf_store.PRICES_TABLE} WHERE symbol = ? AND time BETWEEN ? AND ?',
+            (symbol, start, end),
+        )
+    else:
+        rows = connection.execute(
+            f'SELECT time, close FROM {etf_data.quote_identifier(symbol)} WHERE time BETWEEN ? AND ?', (start, end)
+        )
+    return dict(rows.fetchall())
+
+
+def _insert_statement(symbol, layout):
+    columns = ', '.join(['time'] + etf_data.PRICE_COLUMNS)
+    values = ', '.join(f':{column}' for column in ['time'] + etf_data.PRICE_COLUMNS)
+    if layout == 'long':
+        return f'INSERT OR IGNORE INTO {etf_store.PRICES_TABLE} (symbol, {columns}) VALUES (:symbol, {values})'
+    # The per-ticker tables have no unique key on time, so skip existing bars explicitly
+    table = etf_data.quote_identifier(symbol)
+    return (
+        f'INSERT INTO {table} ({columns}) SELECT {values} '
+        f'WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE time = :time)'
+    )
+
+
+def ingest_batch(connection, bars, layout, last_close):
+    """Append one batch of parsed bars in a single transaction; returns the number of rows inserted.
+
+    ``last_close`` maps each symbol to its latest known close and is updated
+    in place, so consecutive batches do not look it up again.
+    """
+    bars_by_symbol = {}
+    for bar in sorted(bars, key=lambda bar: (bar['symbol'], bar['time'])):
+        bars_by_symbol.setdefault(bar['symbol'], []).append(bar)
+
+    inserted = 0
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for symbol, symbol_bars in bars_by_symbol.items():
+            if layout == 'wide':
+                _create_ticker_table(connection, symbol)
+            previous = last_close.get(symbol)
+            if previous is None:
+                previous = _previous_close(connection, symbol, symbol_bars[0]['time'], layout)
+            # Bars already stored (or repeated in the batch) are skipped, and their stored
+            # close is the previous close of the next bar
+            stored = _stored_closes(connection, symbol, symbol_bars[0]['time'], symbol_bars[-1]['time'], layout)
+            new_bars = []
+            for bar in symbol_bars:
+                if bar['time'] in stored:
+                    previous = stored[bar['time']]
+                    continue
+                bar['daily_returns'] = bar['close'] / previous - 1 if previous else None
+                previous = stored[bar['time']] = bar['close']
+                new_bars.append(bar)
+            last_close[symbol] = previous
+
+            changes = connection.total_changes
+            connection.executemany(_insert_statement(symbol, layout), new_bars)
+            inserted += connection.total_changes - changes
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return inserted
+
+
+def ingest(bars, database_path=etf_data.DATABASE_PATH, batch_size=BATCH_SIZE):
+    """Append an iterable of bars to the database in batches of ``batch_size``.
+
+    Returns a report with the rows read, inserted and skipped, the elapsed
+    time and the throughput in rows per second.
+    """
+    layout = etf_store.layout(database_path) if os.path.exists(database_path) else 'wide'
+    journal_mode = _journal_mode(database_path)
+    connection = connect(database_path)
+    last_close = {}
+    read = inserted = 0
+    start = time.perf_counter()
+    try:
+        bars = iter(bars)
+        while True:
+            batch = [parse_bar(bar) for bar in itertools.islice(bars, batch_size)]
+            if not batch:
+                break
+            read += len(batch)
+            inserted += ingest_batch(connection, batch, layout, last_close)
+    finally:
+        if journal_mode != 'wal':
+            # Leave the database in the journal mode it had, without -wal/-shm files next to it
+            connection.execute(f'PRAGMA journal_mode = {journal_mode}')
+        connection.close()
+    seconds = time.perf_counter() - start
+    return {
+        'rows': read,
+        'inserted': inserted,
+        'skipped': read - inserted,
+        'seconds': seconds,
+        'rows_per_second': read / seconds if seconds else float('inf'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Append OHLCV bars (CSV or JSON lines) to etf.db.')
+    parser.add_argument('source', help="file to read the bars from, or '-' for stdin")
+    parser.add_argument('--format', choices=FORMATS, help='input format (default: from the file extension, else csv)')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='bars written per transaction')
+    parser.add_argument(
+        '--update-checkpoints', action='store_true', help='extend the stored cumulative returns afterwards'
+    )
+    parser.add_argument(
+        '--update-rollups', action='store_true', help='extend the daily/weekly/monthly/yearly rollups afterwards'
+    )
+    args = parser.parse_args(argv)
+
+    report = ingest(read_bars(args.source, args.format), args.database, args.batch_size)
+    print(
+        f"{report['rows']} rows read, {report['inserted']} inserted, {report['skipped']} skipped "
+        f"in {report['seconds']:.3f}s ({report['rows_per_second']:,.0f} rows/sec)"
+    )
+    if args.update_checkpoints:
+        import etf_incremental
+        for series, count in etf_incremental.update_all(args.database).items():
+            print(f'{series}: {count} new cumulative return rows')
+    if args.update_rollups:
+        import etf_rollups
+        for series, count in etf_rollups.update_all(args.database).items():
+            print(f'{series}: {count} new bars rolled up')
+
+
+if __name__ == '__main__':
+    main()
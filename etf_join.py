@@ -0,0 +1,108 @@
+"""Join any number of ticker tables on 'time' into one (symbol, field) DataFrame.
+
+The SQL projection and column aliases are generated from the list of tickers,
+so adding a constituent to etf.db needs no query changes.  The result comes
+back with typed columns under a ``(symbol, field)`` MultiIndex, without the
+redundant 'time' columns a ``SELECT *`` join produces.  When the database has
+been migrated to the long-format ``prices`` table (see ``etf_store``) the frame
+is built with a single pivot instead.
+
+Three alignments are supported:
+
+* ``'inner'`` - only times present in every table (the original portfolio join)
+* ``'outer'`` - every time present in any table, missing values as NaN
+* ``'asof'``  - the time axis of the first ticker, each other ticker taking its
+  most recent row at or before that time (optionally within ``tolerance``)
+"""
+
+import pandas as pd
+
+import etf_data
+import etf_profiling
+import etf_snapshot
+import etf_store
+
+
+# Separator between the symbol and the field in the generated column aliases
+ALIAS_SEPARATOR = '.'
+
+JOIN_TYPES = ('inner', 'outer', 'asof')
+
+
+def build_join_query(symbols, fields=None, how='inner'):
+    """Return the SQL joining ``symbols`` on 'time' and the (symbol, field) column tuples."""
+    if how not in ('inner', 'outer'):
+        raise ValueError(f"SQL joins support 'inner' or 'outer', not {how!r}")
+    fields = list(etf_data.PRICE_COLUMNS if fields is None else fields)
+    tables = [etf_data.quote_identifier(symbol) for symbol in symbols]
+
+    columns = [(symbol, field) for symbol in symbols for field in fields]
+    projection = [
+        f'{table}.{etf_data.quote_identifier(field)} AS {etf_data.quote_identifier(symbol + ALIAS_SEPARATOR + field)}'
+        for symbol, table in zip(symbols, tables)
+        for field in fields
+    ]
+
+    if how == 'inner':
+        time_column = f'{tables[0]}.time'
+        source = f'FROM {tables[0]}\n' + ''.join(
+            f'INNER JOIN {table} ON {tables[0]}.time = {table}.time\n' for table in tables[1:]
+        )
+    else:
+        # SQLite has no portable FULL OUTER JOIN, so left join every table onto the union of times
+        time_column = 'times.time'
+        union = '\n    UNION '.join(f'SELECT time FROM {table}' for table in tables)
+        source = f'FROM (\n    {union}\n) AS times\n' + ''.join(
+            f'LEFT JOIN {table} ON times.time = {table}.time\n' for table in tables
+        )
+
+    query = f'SELECT\n    {time_column} AS time,\n    ' + ',\n    '.join(projection) + '\n' + source
+    query += f'ORDER BY {time_column}'
+    return query, columns
+
+
+@etf_profiling.profiled('join')
+def join_assets(symbols=None, fields=None, how='inner', tolerance=None, database_path=etf_data.DATABASE_PATH):
+    """Join the ticker tables ``symbols`` (default: every ticker table in the database) on 'time'.
+
+    ``fields`` selects the price columns to keep for every ticker and ``how``
+    is one of ``JOIN_TYPES``.  ``tolerance`` (e.g. ``'3D'``) limits how stale an
+    as-of match may be.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f'Unknown join type {how!r}, expected one of {JOIN_TYPES}')
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    symbols = [symbol.upper() for symbol in symbols]
+    if not symbols:
+        raise ValueError('At least one ticker is required')
+
+    if how == 'asof':
+        return _join_asof(symbols, fields, tolerance, database_path)
+
+    if how == 'inner' and fields is None and symbols == etf_data.ticker_names(database_path):
+        # The full portfolio join is materialized by etf_snapshot when it is up to date
+        portfolio = etf_snapshot.read_portfolio_snapshot(database_path)
+        if portfolio is not None:
+            return portfolio
+
+    if etf_store.layout(database_path) == 'long':
+        # One ordered read of the consolidated prices table and a pivot, instead of N joins
+        return etf_store.pivot_prices(symbols, fields, how, database_path)
+
+    query, columns = build_join_query(symbols, fields, how)
+    portfolio = etf_data.read_query(query, database_path=database_path)
+    with etf_profiling.stage('frame.columns'):
+        portfolio.columns = pd.MultiIndex.from_tuples(columns)
+    return portfolio
+
+
+def _join_asof(symbols, fields, tolerance, database_path):
+    frames = [etf_data.load_asset(symbol, columns=fields, database_path=database_path) for symbol in symbols]
+    time_axis = frames[0].index
+    aligned = [frames[0]] + [
+        # Both sides are sorted by time, so a forward-filling reindex is an as-of lookup
+        frame.reindex(time_axis, method='ffill', tolerance=None if tolerance is None else pd.Timedelta(tolerance))
+        for frame in frames[1:]
+    ]
+    return pd.concat(aligned, axis=1, keys=symbols)
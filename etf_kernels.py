@@ -0,0 +1,248 @@
+"""Compiled kernels for the path-dependent series: compounding, drawdowns and drifting portfolios.
+
+Cumulative returns (``(1 + r).cumprod() - 1``), running drawdowns, drawdown
+durations and buy-and-hold portfolio values depend on every earlier row, so in
+pandas they are chains of ``cumprod``/``cummax``/division that each allocate a
+full-size intermediate.  The kernels here walk the rows once and write every
+output of a column in that single pass:
+
+* ``cumulative_returns`` - ``(1 + r).cumprod() - 1``, missing returns give NaN
+  on their row and leave the product unchanged, as in pandas
+* ``path_metrics``       - cumulative returns, drawdown from the running peak
+  (the initial value included), running maximum drawdown, rows since the last
+  peak and the longest such stretch so far, in one pass
+* ``portfolio_values``   - the value path of a portfolio that is rebalanced to
+  fixed weights on given rows and drifts with its holdings in between (the
+  ``etf_portfolio_engine`` semantics)
+
+Inputs are T x N returns (rows are times, columns tickers) as a DataFrame,
+Series or array.  They are processed as Fortran-ordered float64 arrays, the
+layout pandas already keeps the float block of a frame in, so each ticker is a
+contiguous column and no copy is made for a frame of floats.
+
+With Numba installed the kernels are compiled (``nopython``, cached on disk)
+on first use and the columns are processed in parallel (``prange``).  Without
+it, or with ``ETF_KERNELS=numpy`` in the environment, the same results come
+from NumPy accumulations.  ``benchmarks/bench_kernels.py`` compares both with
+the pandas expressions.
+"""
+
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import etf_portfolio_engine
+
+
+BACKENDS = ('numba', 'numpy')
+
+PATH_METRICS = ('cum_returns', 'drawdown', 'max_drawdown', 'duration', 'max_duration')
+
+
+def _build_kernels(numba):
+    # Compile the kernels with Numba: nopython, cached on disk, columns in parallel with prange
+    prange = numba.prange
+
+    def cumulative_kernel(returns, cumulative):
+        n_rows, n_columns = returns.shape
+        for column in prange(n_columns):
+            product = 1.0
+            for row in range(n_rows):
+                value = returns[row, column]
+                if math.isnan(value):
+                    cumulative[row, column] = math.nan
+                else:
+                    product *= 1.0 + value
+                    cumulative[row, column] = product - 1.0
+
+    def path_kernel(returns, cumulative, drawdown, max_drawdown, duration, max_duration):
+        n_rows, n_columns = returns.shape
+        for column in prange(n_columns):
+            # The initial value of 1, just before the first row, is the first peak
+            product = 1.0
+            peak = 1.0
+            worst = 0.0
+            last_peak = -1
+            longest = 0
+            for row in range(n_rows):
+                value = returns[row, column]
+                if math.isnan(value):
+                    cumulative[row, column] = math.nan
+                else:
+                    product *= 1.0 + value
+                    cumulative[row, column] = product - 1.0
+                if product >= peak:
+                    peak = product
+                    last_peak = row
+                current = product / peak - 1.0
+                worst = min(worst, current)
+                drawdown[row, column] = current
+                max_drawdown[row, column] = worst
+                longest = max(longest, row - last_peak)
+                duration[row, column] = row - last_peak
+                max_duration[row, column] = longest
+
+    def portfolio_kernel(returns, weights, points, initial_value, values):
+        # Holdings per asset plus cash; rebalanced to ``weights`` on the marked rows
+        n_rows, n_columns = returns.shape
+        holdings = np.zeros(n_columns)
+        cash = 0.0
+        value = initial_value
+        for row in range(n_rows):
+            if points[row]:
+                cash = value
+                for column in range(n_columns):
+                    holdings[column] = value * weights[column]
+                    cash -= holdings[column]
+            value = cash
+            for column in range(n_columns):
+                growth = returns[row, column]
+                if math.isnan(growth):
+                    growth = 0.0
+                holdings[column] *= 1.0 + max(growth, -1.0)
+                value += holdings[column]
+            values[row] = value
+
+    parallel = numba.njit(parallel=True, cache=True)
+    return {
+        'cumulative': parallel(cumulative_kernel),
+        'path': parallel(path_kernel),
+        # Steps through time, one row depending on the previous: nothing to run in parallel
+        'portfolio': numba.njit(cache=True)(portfolio_kernel),
+    }
+
+
+# Compiled kernels by name, built once on first use
+_compiled = {}
+_compile_lock = threading.Lock()
+
+
+def _numba():
+    # Imported on first use, so importing this module stays cheap
+    try:
+        import numba
+    except ImportError:
+        return None
+    return numba
+
+
+def backend():
+    """Return the backend the kernels run on: 'numba' when it is installed and not disabled, else 'numpy'."""
+    if os.environ.get('ETF_KERNELS', '').lower() == 'numpy' or _numba() is None:
+        return 'numpy'
+    return 'numba'
+
+
+def _check_backend(name):
+    name = backend() if name is None else name
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown kernel backend {name!r}, expected one of {BACKENDS}')
+    if name == 'numba' and _numba() is None:
+        raise ValueError("The 'numba' kernel backend needs Numba installed")
+    return name
+
+
+def _kernel(name):
+    with _compile_lock:
+        if not _compiled:
+            _compiled.update(_build_kernels(_numba()))
+    return _compiled[name]
+
+
+def _as_matrix(returns):
+    # (T x N Fortran-ordered float64 array, wrap(array) -> result like the input)
+    if isinstance(returns, pd.DataFrame):
+        values = np.asfortranarray(returns.to_numpy(dtype=float))
+        return values, lambda array: pd.DataFrame(array, index=returns.index, columns=returns.columns)
+    if isinstance(returns, pd.Series):
+        values = returns.to_numpy(dtype=float).reshape(-1, 1)
+        return values, lambda array: pd.Series(array[:, 0], index=returns.index, name=returns.name)
+    values = np.asarray(returns, dtype=float)
+    if values.ndim == 1:
+        return values.reshape(-1, 1), lambda array: array[:, 0]
+    return np.asfortranarray(values), lambda array: array
+
+
+def _numpy_cumulative(values):
+    missing = np.isnan(values)
+    cumulative = np.cumprod(np.where(missing, 1.0, 1.0 + values), axis=0)
+    cumulative -= 1.0
+    cumulative[missing] = np.nan
+    return cumulative
+
+
+def _numpy_path(values):
+    growth = np.cumprod(np.where(np.isnan(values), 1.0, 1.0 + values), axis=0)
+    # The initial value of 1 (at row -1) is the first peak
+    peak = np.maximum(np.maximum.accumulate(growth, axis=0), 1.0)
+    drawdown = growth / peak - 1.0
+    rows = np.arange(len(values))[:, None]
+    duration = rows - np.maximum.accumulate(np.where(growth >= peak, rows, -1), axis=0)
+    cumulative = growth - 1.0
+    cumulative[np.isnan(values)] = np.nan
+    return (cumulative, drawdown, np.minimum.accumulate(drawdown, axis=0), duration,
+            np.maximum.accumulate(duration, axis=0))
+
+
+def cumulative_returns(returns, backend=None):
+    """Return ``(1 + returns).cumprod() - 1`` for every column, shaped like ``returns``."""
+    values, wrap = _as_matrix(returns)
+    if _check_backend(backend) == 'numpy':
+        return wrap(_numpy_cumulative(values))
+    cumulative = np.empty(values.shape, order='F')
+    _kernel('cumulative')(values, cumulative)
+    return wrap(cumulative)
+
+
+def path_metrics(returns, backend=None):
+    """Return the cumulative returns, drawdowns and drawdown durations of every column in one pass.
+
+    For a DataFrame or Series the result is a DataFrame with ``(metric,
+    column)`` columns, metric being one of ``PATH_METRICS``; for an array it
+    is a dict of arrays.  Drawdowns are measured from the running peak of
+    ``cumprod(1 + r)`` (missing returns leave it unchanged), the initial value
+    of 1 included, so a loss on the first day counts.  Durations are counted in
+    rows since that peak, the initial value sitting just before the first row.
+    """
+    values, wrap = _as_matrix(returns)
+    if _check_backend(backend) == 'numpy':
+        outputs = _numpy_path(values)
+    else:
+        outputs = tuple(np.empty(values.shape, order='F') for _ in range(3))
+        outputs += tuple(np.empty(values.shape, dtype=np.int64, order='F') for _ in range(2))
+        _kernel('path')(values, *outputs)
+    result = {name: wrap(output) for name, output in zip(PATH_METRICS, outputs)}
+    if isinstance(returns, pd.DataFrame):
+        return pd.concat(result, axis=1)
+    if isinstance(returns, pd.Series):
+        return pd.DataFrame(result)
+    return result
+
+
+def portfolio_values(returns, weights=None, rebalance='never', index=None, initial_value=1.0, backend=None):
+    """Return the value path of a portfolio of the ``returns`` columns, like ``etf_portfolio_engine``.
+
+    ``weights`` is one target vector (default: equal weights) restored on the
+    ``rebalance`` rows (see ``etf_portfolio_engine.REBALANCE_FREQUENCIES``);
+    the default 'never' lets the holdings drift from the first day.  Weight
+    schedules and the NumPy backend go to ``etf_portfolio_engine.portfolio_values``.
+    """
+    if isinstance(returns, pd.DataFrame):
+        index = returns.index if index is None else index
+    vector = weights is None or (not isinstance(weights, pd.DataFrame) and np.ndim(weights) == 1)
+    if _check_backend(backend) == 'numpy' or not vector:
+        return etf_portfolio_engine.portfolio_values(returns, weights, rebalance, index, initial_value)
+
+    values, _ = _as_matrix(returns)
+    n_rows, n_assets = values.shape
+    weights = np.full(n_assets, 1.0 / n_assets) if weights is None else np.asarray(weights, dtype=float)
+    if index is None:
+        index = pd.RangeIndex(n_rows)
+    points = etf_portfolio_engine.rebalance_points(index, rebalance)
+    # The kernel reads one row at a time, which is contiguous in C order
+    result = np.empty(n_rows)
+    _kernel('portfolio')(np.ascontiguousarray(values), weights, points, float(initial_value), result)
+    return result
@@ -0,0 +1,270 @@
+"""Forward Monte Carlo simulation of the ETF portfolio.
+
+The notebook only looks back at the realized cumulative returns.
+``simulate`` generates many possible futures of ``n_days`` for a weighted,
+daily-rebalanced portfolio of the constituents (equal weights by default, as
+the notebook's ETF) and summarizes their distribution:
+
+* ``method='bootstrap'`` - circular block bootstrap of the daily returns
+  matrix: each path is a sequence of randomly chosen ``block_size``-day
+  stretches of history.  Whole days are drawn, so the correlation between the
+  constituents (and the short-term autocorrelation within a block) is kept.
+* ``method='normal'`` - a multivariate normal fitted to the constituents'
+  daily returns.  For fixed weights the portfolio return of such a model is
+  normal with mean ``w @ mu`` and variance ``w' S w``, so that is what is sampled.
+
+A day of the portfolio is ``returns @ weights`` whatever the path, so the
+daily portfolio returns are computed once and paths are drawn from that
+series.  Paths are generated in chunks of ``chunk_paths`` with NumPy (one
+seeded ``Generator`` per chunk, from a ``SeedSequence``, so the results do not
+depend on the number of workers) and the chunks are spread over a
+``ProcessPoolExecutor``.  A chunk only sends back a histogram of the
+cumulative return at each band horizon, plus the final cumulative return and
+the maximum drawdown of each path.  The full paths x days array is never
+built, so memory stays at about ``chunk_paths x n_days`` per worker.
+
+The result holds the percentile bands (per horizon), the distribution of the
+final return with its VaR and CVaR, and the distribution of the maximum
+drawdown::
+
+    python etf_montecarlo.py --paths 100000 --days 2520 --workers 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_join
+
+
+# Number of trading days used to annualize daily figures
+TRADING_DAYS = 252
+
+# Paths generated per task
+CHUNK_PATHS = 1024
+
+# Percentiles reported for the bands and the final return
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# Confidence levels of the VaR / CVaR
+CONFIDENCE = (0.95, 0.99)
+
+# Horizons at which the bands are computed (spread evenly over the simulated days)
+BAND_POINTS = 252
+
+# Histogram bins per horizon, and the width of the binned range in standard deviations
+BINS = 4096
+BIN_RANGE = 10.0
+
+METHODS = ('bootstrap', 'normal')
+
+
+def band_horizons(n_days, points=BAND_POINTS):
+    """Return the (1-based) days at which the percentile bands are computed."""
+    return np.unique(np.linspace(1, n_days, min(n_days, points)).round().astype(int))
+
+
+# Set in each worker process (or in this one) by _setup
+_worker = {}
+
+
+def _setup(daily, method, n_days, block_size, horizons, lower, width):
+    _worker.update(
+        log_daily=np.log1p(daily),
+        mean=daily.mean(),
+        std=daily.std(),
+        method=method,
+        n_days=n_days,
+        block_size=block_size,
+        horizons=horizons,
+        lower=lower,
+        width=width,
+    )
+
+
+def _simulate_chunk(task):
+    seed, n_paths = task
+    rng = np.random.default_rng(seed)
+    log_daily = _worker['log_daily']
+    n_days = _worker['n_days']
+
+    if _worker['method'] == 'bootstrap':
+        block_size = _worker['block_size']
+        n_blocks = -(-n_days // block_size)
+        starts = rng.integers(0, len(log_daily), size=(n_paths, n_blocks, 1))
+        # Circular blocks: a block running past the last day wraps around to the first
+        positions = (starts + np.arange(block_size)).reshape(n_paths, -1)[:, :n_days]
+        positions %= len(log_daily)
+        log_growth = log_daily[positions]
+    else:
+        daily = rng.normal(_worker['mean'], _worker['std'], size=(n_paths, n_days))
+        # A day cannot lose more than everything
+        log_growth = np.log1p(np.maximum(daily, -1 + 1e-12))
+    np.cumsum(log_growth, axis=1, out=log_growth)
+
+    # Histogram of the log growth at every horizon, one bincount over all of them
+    horizons = _worker['horizons']
+    bins = np.floor((log_growth[:, horizons - 1] - _worker['lower']) / _worker['width'])
+    bins = np.clip(bins, 0, BINS - 1).astype(np.int64) + np.arange(len(horizons)) * BINS
+    counts = np.bincount(bins.ravel(), minlength=len(horizons) * BINS).reshape(len(horizons), BINS)
+
+    final = np.expm1(log_growth[:, -1])
+    # Drawdown from the running peak, the starting value included
+    peaks = np.maximum.accumulate(log_growth, axis=1)
+    np.maximum(peaks, 0.0, out=peaks)
+    np.subtract(log_growth, peaks, out=log_growth)
+    drawdown = np.expm1(log_growth.min(axis=1))
+    return counts, final, drawdown
+
+
+def _histogram_percentiles(counts, lower, width, percentiles):
+    # Interpolated percentiles of each row of a histogram, in the binned (log growth) units
+    cumulative = np.cumsum(counts, axis=1)
+    total = cumulative[:, -1:]
+    result = np.empty((len(counts), len(percentiles)))
+    for column, percentile in enumerate(percentiles):
+        target = total[:, 0] * percentile / 100
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), counts.shape[1] - 1)
+        below = np.where(index > 0, cumulative[np.arange(len(counts)), index - 1], 0)
+        inside = counts[np.arange(len(counts)), index]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(inside > 0, (target - below) / inside, 0.5)
+        result[:, column] = lower + (index + fraction) * width
+    return result
+
+
+def value_at_risk(returns, confidence=CONFIDENCE):
+    """Return the VaR and CVaR (as positive losses) of a sample of returns at each confidence level."""
+    returns = np.asarray(returns, dtype=float)
+    rows = []
+    for level in confidence:
+        cutoff = np.quantile(returns, 1 - level)
+        tail = returns[returns <= cutoff]
+        rows.append({'confidence': level, 'VaR': -cutoff, 'CVaR': -tail.mean()})
+    return pd.DataFrame(rows).set_index('confidence')
+
+
+def simulate(returns, weights=None, n_paths=10_000, n_days=TRADING_DAYS * 10, method='bootstrap', block_size=20,
+             percentiles=PERCENTILES, confidence=CONFIDENCE, seed=0, workers=None, chunk_paths=CHUNK_PATHS):
+    """Simulate ``n_paths`` futures of ``n_days`` for the portfolio and return their summaries.
+
+    ``returns`` is the T x N DataFrame or array of the constituents' daily
+    returns (missing values count as flat days) and ``weights`` the N portfolio
+    weights (default: equal).  ``workers`` sets the number of processes
+    (default: one per CPU; 1 simulates in this process).
+
+    Returns a dict with:
+
+    * ``'bands'``    - percentiles of the cumulative return at the band horizons (by day)
+    * ``'final'``    - mean, standard deviation and percentiles of the final cumulative return
+    * ``'risk'``     - VaR and CVaR of the final cumulative return at each confidence level
+    * ``'drawdown'`` - percentiles of the maximum drawdown of the paths
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown simulation method {method!r}, expected one of {METHODS}')
+    returns = np.nan_to_num(np.asarray(returns, dtype=float), nan=0.0)
+    returns = returns.reshape(len(returns), -1)
+    if weights is None:
+        weights = np.full(returns.shape[1], 1 / returns.shape[1])
+    weights = np.asarray(weights, dtype=float)
+    if weights.shape != (returns.shape[1],):
+        raise ValueError(f'Expected {returns.shape[1]} weights, got {weights.shape}')
+    if block_size < 1 or n_days < 1 or n_paths < 1:
+        raise ValueError('n_paths, n_days and block_size must be positive')
+
+    daily = returns @ weights
+    log_daily = np.log1p(daily)
+    horizons = band_horizons(n_days)
+    # Binned range of the log growth at each horizon: the drift plus or minus BIN_RANGE deviations
+    if method == 'bootstrap':
+        # Blocks are independent but the days within one are not, so the variance per day is
+        # taken from the sums of every (circular) block of history
+        circular = np.concatenate([log_daily, log_daily[:block_size - 1]])
+        variance = np.convolve(circular, np.ones(block_size), 'valid').var() / block_size
+    else:
+        variance = log_daily.var()
+    spread = np.maximum(np.sqrt(variance * horizons), 1e-9)
+    lower = log_daily.mean() * horizons - BIN_RANGE * spread
+    width = 2 * BIN_RANGE * spread / BINS
+
+    sizes = [min(chunk_paths, n_paths - start) for start in range(0, n_paths, chunk_paths)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = list(zip(seeds, sizes))
+    setup = (daily, method, n_days, block_size, horizons, lower, width)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+
+    counts = np.zeros((len(horizons), BINS), dtype=np.int64)
+    finals, drawdowns = [], []
+    if workers <= 1:
+        _setup(*setup)
+        results = map(_simulate_chunk, tasks)
+    else:
+        # Spawned, not forked: Numba's TBB threads, once started in this process, do not survive a fork
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_setup, initargs=setup)
+        results = executor.map(_simulate_chunk, tasks)
+    try:
+        for chunk_counts, final, drawdown in results:
+            counts += chunk_counts
+            finals.append(final)
+            drawdowns.append(drawdown)
+    finally:
+        if workers > 1:
+            executor.shutdown()
+
+    columns = [f'p{percentile}' for percentile in percentiles]
+    bands = np.expm1(_histogram_percentiles(counts, lower, width, percentiles))
+    final = np.concatenate(finals)
+    drawdown = np.concatenate(drawdowns)
+    return {
+        'bands': pd.DataFrame(bands, index=pd.Index(horizons, name='day'), columns=columns),
+        'final': pd.Series(
+            [final.mean(), final.std()] + list(np.percentile(final, percentiles)),
+            index=['mean', 'std'] + columns,
+            name='cum_returns',
+        ),
+        'risk': value_at_risk(final, confidence),
+        'drawdown': pd.Series(np.percentile(drawdown, percentiles), index=columns, name='max_drawdown'),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate future cumulative returns of the ETF portfolio.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--paths', type=int, default=10_000, help='number of simulated paths')
+    parser.add_argument('--days', type=int, default=TRADING_DAYS * 10, help='length of each path in trading days')
+    parser.add_argument('--method', choices=METHODS, default='bootstrap')
+    parser.add_argument('--block-size', type=int, default=20, help='days per bootstrapped block')
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the percentile bands to this CSV file')
+    args = parser.parse_args(argv)
+
+    returns = etf_join.join_assets(fields=['daily_returns'], database_path=args.database).droplevel(1, axis=1)
+    start = time.perf_counter()
+    result = simulate(returns, n_paths=args.paths, n_days=args.days, method=args.method,
+                      block_size=args.block_size, seed=args.seed, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f'Simulated {args.paths} paths of {args.days} days ({args.method}) in {elapsed:.2f}s')
+    print('\nFinal cumulative return:')
+    print(result['final'].to_string())
+    print('\nValue at risk of the final cumulative return:')
+    print(result['risk'].to_string())
+    print('\nMaximum drawdown:')
+    print(result['drawdown'].to_string())
+    if args.output:
+        result['bands'].to_csv(args.output)
+        print(f'\nPercentile bands written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
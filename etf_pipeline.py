@@ -0,0 +1,93 @@
+"""The analyzer pipeline as importable functions.
+
+The notebook (``etf_analyzer``) is a sequence of cells that display their
+results, so importing it runs the whole analysis.  The steps it performs live
+here instead, for the notebook, the headless report (``etf_report``) and
+worker processes to call directly.
+
+Importing this module is cheap: the ticker data is read through the stdlib
+``sqlite3`` driver, SQLAlchemy is only loaded by the steps that write the
+cumulative return checkpoints, and nothing here imports the plotting stack.
+``benchmarks/bench_import_time.py`` keeps track of the cold-start cost.
+"""
+
+import etf_data
+import etf_profiling
+
+
+# Number of trading days used to annualize daily figures
+TRADING_DAYS = 252
+
+
+def portfolio(symbols=None, database_path=etf_data.DATABASE_PATH):
+    """Return every column of the tickers inner-joined on 'time', under (symbol, field) columns."""
+    import etf_join
+    return etf_join.join_assets(symbols, how='inner', database_path=database_path)
+
+
+def portfolio_returns(symbols=None, database_path=etf_data.DATABASE_PATH):
+    """Return the daily returns of the tickers plus their equal-weight mean as ('ETF', 'mean_daily_returns')."""
+    import etf_join
+    with etf_profiling.stage('returns'):
+        returns = etf_join.join_assets(symbols, fields=['daily_returns'], how='inner', database_path=database_path)
+        with etf_profiling.stage('transform.mean'):
+            returns[('ETF', 'mean_daily_returns')] = returns.mean(axis=1)
+    return returns
+
+
+def annualized_returns(daily_returns):
+    """Return the annualized (daily x 252) returns."""
+    with etf_profiling.stage('annualize'):
+        return daily_returns * TRADING_DAYS
+
+
+@etf_profiling.profiled('cumulate')
+def asset_cumulative_returns(symbol, database_path=etf_data.DATABASE_PATH, update=True):
+    """Return the cumulative returns of one ticker, updated incrementally (``update=False`` only reads)."""
+    import etf_incremental
+    return etf_incremental.asset_cumulative_returns(symbol, database_path=database_path, update=update)
+
+
+@etf_profiling.profiled('cumulate')
+def assets_cumulative_returns(daily_returns):
+    """Return ``(1 + daily_returns).cumprod() - 1`` for the tickers' joined daily returns.
+
+    The returns are compounded over the dates of the joined frame, as the
+    notebook's ``etf_cumulative_return_ppyls`` always was, so the tickers'
+    cumulative returns start together on its first date.
+    """
+    import etf_kernels
+    return etf_kernels.cumulative_returns(daily_returns)
+
+
+@etf_profiling.profiled('cumulate')
+def portfolio_cumulative_returns(symbols=None, database_path=etf_data.DATABASE_PATH, update=True):
+    """Return the cumulative returns of the portfolio, updated incrementally (``update=False`` only reads)."""
+    import etf_incremental
+    return etf_incremental.portfolio_cumulative_returns(symbols, database_path=database_path, update=update)
+
+
+def compute_results(symbol='PYPL', database_path=etf_data.DATABASE_PATH):
+    """Run the whole analysis and return its tables and chart data by name."""
+    import etf_store
+
+    symbols = etf_data.ticker_names(database_path)
+    asset = etf_data.load_asset(symbol, database_path=database_path)
+
+    returns = portfolio_returns(symbols, database_path)
+    asset_daily_returns = returns[symbols].droplevel(1, axis=1)
+    returns[('ETF', 'ann_mean_daily_returns_per')] = annualized_returns(returns[('ETF', 'mean_daily_returns')]) * 100
+    returns[('ETF', 'cum_returns')] = portfolio_cumulative_returns(symbols, database_path)
+
+    return {
+        'pypl_dataframe': asset,
+        'pypl_higher_than_200': etf_store.closing_prices_above(symbol, 200.0, database_path),
+        'pypl_top_10_returns': etf_store.top_daily_returns(symbol, 10, database_path),
+        'etf_portfolio': portfolio(symbols, database_path),
+        'etf_portfolio_returns': returns,
+        'pypl_daily_returns': asset['daily_returns'],
+        'pypl_cumulative_returns': asset_cumulative_returns(symbol, database_path),
+        'asset_daily_returns': asset_daily_returns,
+        'asset_cumulative_returns': assets_cumulative_returns(asset_daily_returns),
+        'etf_cumulative_returns': returns[('ETF', 'cum_returns')].rename('cum_returns'),
+    }
@@ -0,0 +1,131 @@
+"""Downsampled hvPlot line charts.
+
+hvPlot sends every point of a series to the browser, so the page size and
+render time of the dashboard grow with the length of the history.  ``line``
+reduces the series before handing it to hvPlot:
+
+* ``'lttb'``   - Largest-Triangle-Three-Buckets, which keeps the points that
+  carry the visual shape of the line
+* ``'minmax'`` - the minimum and maximum of each bucket, which keeps every spike
+
+When the series is longer than ``max_points`` the chart is a HoloViews
+``DynamicMap`` on a ``RangeX`` stream: zooming in re-slices the full series to
+the visible range and downsamples that again, so detail comes back at full
+resolution while the payload stays bounded.
+
+The plotting libraries are imported when a chart is built, not when this
+module is imported.
+"""
+
+import numpy as np
+import pandas as pd
+
+import etf_profiling
+
+
+# Points kept per chart by default
+MAX_POINTS = 2000
+
+METHODS = ('lttb', 'minmax')
+
+
+def _x_values(index):
+    if isinstance(index, pd.DatetimeIndex):
+        return index.asi8.astype(float)
+    return np.asarray(index, dtype=float)
+
+
+def lttb_indices(x, y, n_out):
+    """Return the positions of the ``n_out`` points LTTB keeps out of ``x``/``y``."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # The first and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # Average of the next bucket (the last point for the final bucket)
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        # Pick the point forming the largest triangle with the previous pick and that average
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """Return the positions of the minimum and maximum of each of ``n_out // 2`` buckets."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    size = -(-n // (n_out // 2))
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    selected = np.concatenate([offsets + np.nanargmin(padded, axis=1), offsets + np.nanargmax(padded, axis=1)])
+    return np.unique(selected)
+
+
+@etf_profiling.profiled('plot.downsample')
+def downsample(data, max_points=MAX_POINTS, method='lttb'):
+    """Return at most about ``max_points`` rows of a Series or DataFrame, chosen by ``method``.
+
+    For a DataFrame each column is reduced on its own and the union of the
+    kept rows is returned.
+    """
+    if method not in METHODS:
+        raise ValueError(f'Unknown downsampling method {method!r}, expected one of {METHODS}')
+    if len(data) <= max_points:
+        return data
+    frame = data.to_frame() if isinstance(data, pd.Series) else data
+    x = _x_values(frame.index)
+    keep = np.zeros(len(frame), dtype=bool)
+    per_column = max(max_points // frame.shape[1], 3)
+    for column in frame.columns:
+        y = frame[column].to_numpy(dtype=float)
+        valid = np.flatnonzero(~np.isnan(y))
+        if method == 'lttb':
+            chosen = lttb_indices(x[valid], y[valid], per_column)
+        else:
+            chosen = minmax_indices(y[valid], per_column)
+        keep[valid[chosen]] = True
+    return data[keep]
+
+
+@etf_profiling.profiled('plot.build')
+def line(data, max_points=MAX_POINTS, method='lttb', dynamic=True, **kwargs):
+    """Return ``data.hvplot.line(**kwargs)`` drawn from at most about ``max_points`` points.
+
+    With ``dynamic`` (the default) long series re-render at full resolution
+    for the visible range when the chart is zoomed.
+    """
+    import hvplot.pandas  # noqa: F401  (registers the .hvplot accessor)
+
+    if len(data) <= max_points:
+        return data.hvplot.line(**kwargs)
+    if not dynamic:
+        return downsample(data, max_points, method).hvplot.line(**kwargs)
+
+    import holoviews as hv
+
+    def render(x_range):
+        view = data
+        if x_range is not None and all(bound is not None for bound in x_range):
+            start, end = x_range
+            if isinstance(data.index, pd.DatetimeIndex):
+                start, end = pd.Timestamp(start), pd.Timestamp(end)
+            view = data.loc[start:end]
+        return downsample(view, max_points, method).hvplot.line(**kwargs)
+
+    return hv.DynamicMap(render, streams=[hv.streams.RangeX()])
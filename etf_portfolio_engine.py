@@ -0,0 +1,183 @@
+"""Vectorized portfolio value paths with arbitrary weights and rebalancing.
+
+The notebook's ETF is the equally weighted mean of the daily returns, which
+amounts to rebalancing back to equal weights every day.  ``portfolio_values``
+takes a T x N matrix of daily returns (e.g. ``etf_portfolio_returns`` for the
+four tickers), target weights, either one vector or a schedule of weight
+vectors, and a rebalance frequency:
+
+* ``'daily'``     - back to the target weights every day
+* ``'monthly'``   - on the first day of each month
+* ``'quarterly'`` - on the first day of each quarter
+* ``'never'`` / ``'drift'`` - invest once and let the holdings drift
+
+Between two rebalances each holding grows with its own compounded return, so
+the portfolio value on day t is the value at the last rebalance times
+``sum_i w_i * growth_i(rebalance -> t)``.  The growths come from one cumulative
+sum of ``log(1 + r)`` over the whole matrix; the per-segment values are then
+chained with a cumulative product, so there is no Python loop over days.  The
+matrix is processed in blocks of rows to bound the temporary memory.
+
+Weights that add up to less than one keep the remainder in cash (earning
+nothing).  Missing returns count as 0 (the holding is left unchanged that day), and
+returns are floored at -100%.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+REBALANCE_FREQUENCIES = ('daily', 'monthly', 'quarterly', 'never', 'drift')
+
+# Rows of the returns matrix processed at once
+BLOCK_ROWS = 2048
+
+
+def rebalance_points(index, rebalance='daily'):
+    """Return a boolean array marking the rows where the portfolio is rebalanced.
+
+    The first row is always a rebalance (the initial investment).
+    """
+    if rebalance not in REBALANCE_FREQUENCIES:
+        raise ValueError(f'Unknown rebalance frequency {rebalance!r}, expected one of {REBALANCE_FREQUENCIES}')
+    n_rows = len(index)
+    if rebalance == 'daily':
+        points = np.ones(n_rows, dtype=bool)
+    elif rebalance in ('never', 'drift'):
+        points = np.zeros(n_rows, dtype=bool)
+    else:
+        if not isinstance(index, pd.DatetimeIndex):
+            raise TypeError(f'{rebalance!r} rebalancing needs a DatetimeIndex')
+        period = index.to_period('M' if rebalance == 'monthly' else 'Q').asi8
+        points = np.empty(n_rows, dtype=bool)
+        points[1:] = period[1:] != period[:-1]
+    if n_rows:
+        points[0] = True
+    return points
+
+
+def _weight_rows(weights, index, columns, points):
+    # Return the segment start rows and the (segments x N) target weights applied at each
+    if isinstance(weights, pd.DataFrame):
+        # Weight schedule: every schedule date also forces a rebalance
+        schedule = weights.reindex(columns=columns).fillna(0.0).sort_index()
+        positions = np.searchsorted(np.asarray(index), np.asarray(schedule.index), side='left')
+        points = points.copy()
+        points[positions[positions < len(index)]] = True
+        starts = np.flatnonzero(points)
+        # Latest schedule row at or before each rebalance (the first one before the schedule begins)
+        rows = np.searchsorted(np.asarray(schedule.index), np.asarray(index)[starts], side='right') - 1
+        return starts, schedule.to_numpy(dtype=float)[np.clip(rows, 0, None)]
+
+    starts = np.flatnonzero(points)
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim == 1:
+        return starts, np.broadcast_to(weights, (len(starts), len(weights)))
+    if weights.shape[0] != len(starts):
+        raise ValueError(f'Expected one weight row per rebalance ({len(starts)}), got {weights.shape[0]}')
+    return starts, weights
+
+
+def _weighted_sum(growth, segment_weights, segment):
+    # Row-wise dot product of the growth with the weights of each row's segment
+    if segment_weights.strides[0] == 0:
+        # One weight vector broadcast over every segment: a single matrix-vector product
+        return growth @ segment_weights[0]
+    return np.einsum('tn,tn->t', growth, segment_weights[segment])
+
+
+def portfolio_values(returns, weights=None, rebalance='daily', index=None, initial_value=1.0, block_rows=BLOCK_ROWS):
+    """Return the portfolio value path (length T) for a T x N returns matrix.
+
+    ``weights`` is a length-N vector (default: equal weights), a
+    (rebalances x N) array with one row per rebalance, or a DataFrame of
+    target weights indexed by date.  ``index`` holds the dates of the rows and
+    is required for calendar rebalancing and weight schedules.
+    """
+    if isinstance(returns, pd.DataFrame):
+        index = returns.index if index is None else index
+        columns = returns.columns
+        returns = returns.to_numpy(dtype=float)
+    else:
+        returns = np.asarray(returns, dtype=float)
+        columns = pd.RangeIndex(returns.shape[1])
+    n_rows, n_assets = returns.shape
+    if index is None:
+        index = pd.RangeIndex(n_rows)
+    if weights is None:
+        weights = np.full(n_assets, 1.0 / n_assets)
+
+    points = rebalance_points(index, rebalance)
+    starts, segment_weights = _weight_rows(weights, index, columns, points)
+    segment_of_row = np.searchsorted(starts, np.arange(n_rows), side='right') - 1
+    # Weights that do not add up to one leave the remainder in cash
+    segment_cash = 1.0 - segment_weights.sum(axis=1)
+    growth_factor = np.maximum(returns, -1.0)
+    np.copyto(growth_factor, 0.0, where=np.isnan(growth_factor))
+
+    if len(starts) == n_rows:
+        # Rebalanced every row: each segment is a single day, so no compounding is needed
+        growth_factor += 1.0
+        relative = _weighted_sum(growth_factor, segment_weights, slice(None)) + segment_cash
+    else:
+        # A -100% day has no finite log: count those wipe-outs separately and let the log sum
+        # skip them, so a holding bought back at a later rebalance keeps a finite growth
+        wiped = growth_factor == -1.0
+        wipe_counts = np.cumsum(wiped, axis=0) if wiped.any() else None
+        growth_factor[wiped] = 0.0
+        # Running log growth of every asset; log_growth[t] covers rows 0..t
+        log_growth = np.log1p(growth_factor, out=growth_factor)
+        np.cumsum(log_growth, axis=0, out=log_growth)
+        # Log growth (and wipe-outs) before the start of each segment (zero before the first row)
+        segment_base = np.zeros((len(starts), n_assets))
+        segment_base[starts > 0] = log_growth[starts[starts > 0] - 1]
+        if wipe_counts is not None:
+            segment_wipes = np.zeros((len(starts), n_assets), dtype=wipe_counts.dtype)
+            segment_wipes[starts > 0] = wipe_counts[starts[starts > 0] - 1]
+
+        # Value of each row relative to the value at the start of its segment
+        relative = np.empty(n_rows)
+        for block_start in range(0, n_rows, block_rows):
+            block = slice(block_start, block_start + block_rows)
+            segment = segment_of_row[block]
+            growth = np.subtract(log_growth[block], segment_base[segment])
+            np.exp(growth, out=growth)
+            if wipe_counts is not None:
+                # Holdings wiped out since the start of their segment are worth nothing
+                growth[wipe_counts[block] > segment_wipes[segment]] = 0.0
+            relative[block] = _weighted_sum(growth, segment_weights, segment) + segment_cash[segment]
+
+    # Chain the segments: each starts from the value the previous one ended at
+    segment_end_value = relative[np.append(starts[1:] - 1, n_rows - 1)] if n_rows else relative
+    segment_start_value = initial_value * np.concatenate(([1.0], np.cumprod(segment_end_value)[:-1]))
+    return segment_start_value[segment_of_row] * relative
+
+
+def loop_values(returns, weights, points, initial_value=1.0):
+    """Return the value path of ``portfolio_values`` for one weight vector, with a plain loop over days.
+
+    Holds the shares and the cash remainder and rebalances on the rows marked
+    in ``points``.  Slow: the reference the vectorized engine is checked
+    against by the tests and ``benchmarks/bench_portfolio_engine.py``.
+    """
+    returns = np.asarray(returns, dtype=float)
+    value = initial_value
+    values = np.empty(len(returns))
+    for t in range(len(returns)):
+        if points[t]:
+            holdings = value * weights
+            cash = value - holdings.sum()
+        holdings = holdings * (1 + np.maximum(np.nan_to_num(returns[t]), -1.0))
+        value = holdings.sum() + cash
+        values[t] = value
+    return values
+
+
+def run_portfolio(returns, weights=None, rebalance='daily', initial_value=1.0):
+    """Run ``portfolio_values`` on a returns DataFrame and return value, daily and cumulative returns."""
+    values = portfolio_values(returns, weights, rebalance, initial_value=initial_value)
+    result = pd.DataFrame({'value': values}, index=returns.index)
+    previous = np.concatenate(([initial_value], values[:-1]))
+    result['daily_returns'] = values / previous - 1
+    result['cum_returns'] = values / initial_value - 1
+    return result
@@ -0,0 +1,287 @@
+"""Per-stage timing and memory instrumentation for the analyzer.
+
+The data access, join, return and plotting functions wrap their work in named
+stages (``sql.execute``, ``sql.fetch``, ``frame.build``, ``frame.parse_time``,
+``join``, ``returns``, ``cumulate``, ``plot.build``, ...).  While profiling is
+enabled every stage appends a record to the trace with:
+
+* ``wall_s`` / ``cpu_s`` - elapsed and CPU time of the calling thread
+* ``allocated_bytes`` / ``peak_bytes`` - net and peak allocations during the
+  stage, from ``tracemalloc`` (only when memory tracing is on)
+* ``parent`` / ``depth`` / ``thread`` - where the stage ran, stages nest
+* any fields the stage adds, e.g. ``rows`` fetched or the ``cache`` outcome
+
+Profiling is off by default.  Set ``ETF_PROFILE=1`` before starting the
+notebook (or Voila) to record the timings, or ``ETF_PROFILE=memory`` to add the
+``tracemalloc`` figures; the latter slows allocation-heavy code (notably the
+first import of the plotting stack) down by an order of magnitude.
+While disabled ``stage()`` returns a shared no-op context manager, so the
+instrumented code pays one function call and a flag check per stage.
+
+The trace is available as a list of dicts (``trace()``), as JSON
+(``write_trace``), as debug messages on the ``etf.profiling`` logger, and as a
+per-stage summary table (``summary()``) that ``panel()`` renders as a
+collapsible "Performance" section at the end of the notebook
+(``ETF_PROFILE_TRACE=trace.json`` also saves the notebook's trace).
+tracemalloc counts every thread, so the memory figures of stages running
+concurrently (``load_assets``) overlap.
+
+    ETF_PROFILE=1 voila etf_analyzer.ipynb
+    python etf_profiling.py --memory --output trace.json
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+
+logger = logging.getLogger('etf.profiling')
+
+_enabled = False
+_trace_memory = False
+_started_tracemalloc = False
+_records = []
+_records_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter()
+
+
+class _NullStage:
+    # Returned by stage() while profiling is disabled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Stage:
+    """One timed stage; use through ``stage()``."""
+
+    __slots__ = ('name', 'fields', 'parent', 'depth', 'start', 'cpu', 'memory', 'peak')
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.memory = None
+
+    def set(self, **fields):
+        """Add fields (row counts, symbols, ...) to the record of this stage."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        self.parent = None if parent is None else parent.name
+        self.depth = len(stack)
+        if _trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # Resetting the peak for this stage loses it for the enclosing one, so hand it over first
+            if parent is not None and parent.memory is not None:
+                parent.peak = max(parent.peak, peak)
+            tracemalloc.reset_peak()
+            self.memory = self.peak = current
+        stack.append(self)
+        self.cpu = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start
+        cpu = time.thread_time() - self.cpu
+        stack = _stack()
+        stack.pop()
+        record = {
+            'stage': self.name,
+            'parent': self.parent,
+            'depth': self.depth,
+            'thread': threading.current_thread().name,
+            'start_s': self.start - _origin,
+            'wall_s': wall,
+            'cpu_s': cpu,
+        }
+        if self.memory is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, self.peak)
+            record['allocated_bytes'] = current - self.memory
+            record['peak_bytes'] = peak - self.memory
+            if stack and stack[-1].memory is not None:
+                stack[-1].peak = max(stack[-1].peak, peak)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.fields)
+        with _records_lock:
+            _records.append(record)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(record, default=str))
+        return False
+
+
+def stage(name, **fields):
+    """Return a context manager timing the enclosed block as stage ``name``.
+
+    ``fields`` are stored with the record; more can be added with ``.set()``
+    on the value of the ``with`` statement.
+    """
+    if not _enabled:
+        return _NULL_STAGE
+    return Stage(name, fields)
+
+
+def annotate(**fields):
+    """Add fields to the innermost stage running in this thread (no-op when disabled)."""
+    if _enabled:
+        stack = _stack()
+        if stack:
+            stack[-1].fields.update(fields)
+
+
+def profiled(name=None):
+    """Decorator running the whole function as one stage (named after the function by default)."""
+    def decorator(function):
+        stage_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with Stage(stage_name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def enable(memory=False):
+    """Start recording stages, with ``tracemalloc`` allocation figures when ``memory`` is set."""
+    global _enabled, _trace_memory, _started_tracemalloc
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _started_tracemalloc = True
+    _trace_memory = memory
+    _enabled = True
+
+
+def disable():
+    """Stop recording (the trace is kept until ``reset()``)."""
+    global _enabled, _trace_memory, _started_tracemalloc
+    _enabled = False
+    _trace_memory = False
+    if _started_tracemalloc:
+        tracemalloc.stop()
+        _started_tracemalloc = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """Clear the recorded trace."""
+    with _records_lock:
+        _records.clear()
+
+
+def trace():
+    """Return a copy of the recorded stages, in completion order."""
+    with _records_lock:
+        return list(_records)
+
+
+def write_trace(path, records=None):
+    """Write the trace to ``path`` as JSON."""
+    records = trace() if records is None else records
+    with open(path, 'w') as file:
+        json.dump({'memory': _trace_memory, 'stages': records}, file, indent=2, default=str)
+
+
+def summary(records=None):
+    """Return the trace totalled per stage (calls, wall and CPU time, peak memory, rows), slowest first."""
+    import pandas as pd
+
+    records = trace() if records is None else records
+    columns = ['calls', 'wall_s', 'cpu_s', 'allocated_bytes', 'peak_bytes', 'rows']
+    if not records:
+        return pd.DataFrame(columns=columns).rename_axis('stage')
+    frame = pd.DataFrame(records)
+    aggregations = {'calls': ('wall_s', 'size'), 'wall_s': ('wall_s', 'sum'), 'cpu_s': ('cpu_s', 'sum')}
+    if 'allocated_bytes' in frame:
+        aggregations['allocated_bytes'] = ('allocated_bytes', 'sum')
+        aggregations['peak_bytes'] = ('peak_bytes', 'max')
+    if 'rows' in frame:
+        aggregations['rows'] = ('rows', lambda rows: rows.sum(min_count=1))
+    return frame.groupby('stage').agg(**aggregations).sort_values('wall_s', ascending=False)
+
+
+def panel(records=None, title='Performance'):
+    """Return the per-stage summary as a collapsed HTML section for the notebook / Voila page."""
+    from IPython.display import HTML
+
+    records = trace() if records is None else records
+    table = summary(records)
+    # Stages nest, so the total is the time of the outermost ones
+    total = sum(record['wall_s'] for record in records if record['depth'] == 0)
+    formatters = {
+        'wall_s': '{:.4f}'.format,
+        'cpu_s': '{:.4f}'.format,
+        'allocated_bytes': lambda value: f'{value / 1e6:.2f} MB',
+        'peak_bytes': lambda value: f'{value / 1e6:.2f} MB',
+        'rows': '{:,.0f}'.format,
+    }
+    body = table.to_html(
+        formatters={column: formatters[column] for column in table.columns if column in formatters}, na_rep=''
+    )
+    return HTML(
+        f'<details><summary><b>{title}</b>: {len(records)} stages, {total:.3f}s</summary>{body}</details>'
+    )
+
+
+if os.environ.get('ETF_PROFILE', '').lower() not in ('', '0', 'false', 'no'):
+    enable(memory=os.environ['ETF_PROFILE'].lower() == 'memory')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the analyzer pipeline stage by stage.')
+    parser.add_argument('--database', default='etf.db', help='path to the SQLite database')
+    parser.add_argument('--symbol', default='PYPL', help='ticker analyzed on its own')
+    parser.add_argument('--memory', action='store_true', help='add the tracemalloc figures')
+    parser.add_argument('--output', help='write the JSON trace to this file')
+    args = parser.parse_args(argv)
+
+    import pandas as pd
+    import etf_pipeline
+    # Run as a script this file is __main__, the instrumented modules record into the imported module
+    import etf_profiling as profiling
+
+    profiling.enable(memory=args.memory)
+    with profiling.stage('compute_results'):
+        etf_pipeline.compute_results(args.symbol, args.database)
+    profiling.disable()
+
+    with pd.option_context('display.width', 120, 'display.max_columns', None):
+        print(profiling.summary())
+    if args.output:
+        profiling.write_trace(args.output)
+
+
+if __name__ == '__main__':
+    main()
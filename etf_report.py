@@ -0,0 +1,161 @@
+"""Headless report: run the analyzer pipeline once and export static artifacts.
+
+The notebook is the interactive version of the analysis and needs Jupyter or
+Voilà.  This module runs the same pipeline without them and writes its tables
+and charts to a directory::
+
+    python etf_report.py --output report --format csv html png --workers 4
+
+* tables are written as CSV and/or HTML
+* charts are written as standalone HTML (hvPlot/Bokeh, downsampled with
+  ``etf_plotting``) and/or PNG (matplotlib)
+
+The pipeline (``etf_pipeline``) runs once in this process; the artifacts are
+then rendered in a pool of worker processes.  The plotting libraries are only
+imported by the workers that render a chart, so ``--format csv`` never pays
+for importing hvPlot.  matplotlib is only needed for PNG output, which is
+written only when asked for with ``--format png``.
+"""
+
+import argparse
+import importlib.util
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import etf_data
+import etf_pipeline
+
+
+FORMATS = ('csv', 'html', 'png')
+
+# Formats written when none are given: PNG needs matplotlib, which is optional
+DEFAULT_FORMATS = ('csv', 'html')
+
+# Charts of the notebook: (name, result holding the data, labels)
+CHARTS = [
+    ('pypl_daily_returns', 'pypl_daily_returns',
+     dict(xlabel='Time', ylabel='Daily Returns', title='(PYLP) Daily Returns', yformatter='%.04f')),
+    ('pypl_cumulative_returns', 'pypl_cumulative_returns',
+     dict(xlabel='Time', ylabel='Cumulative Returns', title='(PYLP) Cumulative Returns', yformatter='%.02f')),
+    ('asset_daily_returns', 'asset_daily_returns',
+     dict(xlabel='Time', ylabel='Daily Returns', title='(GDOT, GS, PYPL, SQ) Daily Returns', yformatter='%.02f')),
+    ('asset_cumulative_returns', 'asset_cumulative_returns',
+     dict(xlabel='Time', ylabel='Cumulative Returns', title='(GDOT, GS, PYPL, SQ) Cumulative Returns',
+          yformatter='%.02f')),
+    ('etf_cumulative_returns', 'etf_cumulative_returns',
+     dict(xlabel='Time', ylabel='Cumulative Returns', title='ETF Cumulative Returns', yformatter='%.02f')),
+]
+
+# Results exported as tables
+TABLES = [
+    'pypl_dataframe',
+    'pypl_higher_than_200',
+    'pypl_top_10_returns',
+    'etf_portfolio',
+    'etf_portfolio_returns',
+]
+
+
+def render_table(name, frame, directory, formats):
+    """Write ``frame`` as ``<name>.csv`` / ``<name>.html`` and return the paths written."""
+    paths = []
+    if 'csv' in formats:
+        paths.append(os.path.join(directory, f'{name}.csv'))
+        frame.to_csv(paths[-1])
+    if 'html' in formats:
+        paths.append(os.path.join(directory, f'{name}.html'))
+        frame.to_html(paths[-1])
+    return paths
+
+
+def render_chart(name, data, labels, directory, formats, max_points=None):
+    """Write the line chart of ``data`` as ``<name>.html`` / ``<name>.png`` and return the paths written."""
+    import etf_plotting
+
+    max_points = max_points or etf_plotting.MAX_POINTS
+    options = dict(labels)
+    yformatter = options.pop('yformatter', None)
+    paths = []
+    if 'html' in formats:
+        import hvplot
+
+        # A static page cannot re-fetch on zoom, so the chart is downsampled once
+        plot = etf_plotting.line(data, max_points, dynamic=False, frame_width=700, frame_height=300, **options)
+        if yformatter:
+            plot = plot.opts(yformatter=yformatter)
+        paths.append(os.path.join(directory, f'{name}.html'))
+        hvplot.save(plot, paths[-1])
+    if 'png' in formats:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        figure, axes = plt.subplots(figsize=(10, 4.5))
+        etf_plotting.downsample(data, max_points).plot(ax=axes, title=options.get('title'))
+        axes.set_xlabel(options.get('xlabel', ''))
+        axes.set_ylabel(options.get('ylabel', ''))
+        paths.append(os.path.join(directory, f'{name}.png'))
+        figure.savefig(paths[-1], dpi=100, bbox_inches='tight')
+        plt.close(figure)
+    return paths
+
+
+def _render(task):
+    kind, arguments = task
+    renderer = render_table if kind == 'table' else render_chart
+    return renderer(*arguments)
+
+
+def export_report(directory, formats=DEFAULT_FORMATS, charts=True, workers=None, database_path=etf_data.DATABASE_PATH):
+    """Compute the results once and write every table and chart to ``directory``.
+
+    Returns the list of paths written.  ``workers`` sets the number of render
+    processes (default: one per CPU; 1 renders in this process).
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f'Unknown formats {sorted(unknown)}, expected some of {FORMATS}')
+    if charts and 'png' in formats and importlib.util.find_spec('matplotlib') is None:
+        raise ImportError('PNG charts need matplotlib (pip install matplotlib)')
+    os.makedirs(directory, exist_ok=True)
+    results = etf_pipeline.compute_results(database_path=database_path)
+
+    tasks = [('table', (name, results[name], directory, formats)) for name in TABLES if {'csv', 'html'} & set(formats)]
+    chart_formats = [chart_format for chart_format in formats if chart_format in ('html', 'png')]
+    if charts and chart_formats:
+        tasks += [('chart', (name, results[key], labels, directory, chart_formats)) for name, key, labels in CHARTS]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        rendered = [_render(task) for task in tasks]
+    else:
+        # Spawned, not forked: the pipeline may have started Numba's TBB threads, which do not survive a fork
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            rendered = list(executor.map(_render, tasks))
+    return [path for paths in rendered for path in paths]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the ETF analyzer tables and charts as static files.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--output', default='report', help='directory to write the files to')
+    parser.add_argument('--format', nargs='+', default=list(DEFAULT_FORMATS), choices=FORMATS, dest='formats',
+                        help='file formats to write (default: csv html)')
+    parser.add_argument('--no-charts', action='store_true', help='only export the tables')
+    parser.add_argument('--workers', type=int, help='number of render processes')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    paths = export_report(args.output, args.formats, not args.no_charts, args.workers, args.database)
+    for path in paths:
+        print(path)
+    print(f'Wrote {len(paths)} files in {time.perf_counter() - start:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
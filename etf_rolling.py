@@ -0,0 +1,161 @@
+"""Rolling risk metrics over daily return series in linear time.
+
+``rolling_metrics`` computes the rolling mean, volatility and Sharpe ratio of
+every column of a returns DataFrame (e.g. the per-ticker ``daily_returns``)
+and, given a benchmark series such as the portfolio's
+``('ETF', 'mean_daily_returns')``, the rolling beta and correlation to it, for
+several window lengths in one call.
+
+Each statistic is a difference of prefix sums: the cumulative sums of ``x``,
+``x * x`` (and ``x * b`` for the benchmark) are computed once, and the sum over
+any window is ``prefix[t] - prefix[t - window]``.  Every extra window therefore
+costs one subtraction per row, independent of its length, instead of a
+``rolling().apply`` callback per row.  The series are centered on their overall
+mean first, which keeps the variance differences well conditioned.
+
+Missing values are skipped: a window needs at least ``min_periods`` valid rows
+(default: the window length).  ``rolling_correlation`` and
+``running_max_drawdown`` cover the correlation matrix and drawdowns.
+"""
+
+import numpy as np
+import pandas as pd
+
+import etf_kernels
+
+
+# Number of trading days used to annualize daily figures
+TRADING_DAYS = 252
+
+WINDOWS = (20, 60, 252)
+
+
+def _prefix_sums(values):
+    # Cumulative sums along time with a leading row of zeros
+    prefix = np.zeros((values.shape[0] + 1,) + values.shape[1:])
+    np.cumsum(values, axis=0, out=prefix[1:])
+    return prefix
+
+
+def _window_sums(prefix, window):
+    # Sum over the last ``window`` rows for every row (NaN-free, partial at the start)
+    n_rows = prefix.shape[0] - 1
+    sums = np.empty((n_rows,) + prefix.shape[1:])
+    head = min(window, n_rows)
+    sums[:head] = prefix[1:head + 1]
+    if window < n_rows:
+        sums[head:] = prefix[window + 1:] - prefix[1:n_rows - window + 1]
+    return sums
+
+
+def _centered(values):
+    valid = ~np.isnan(values)
+    center = np.nanmean(values, axis=0) if valid.any() else np.zeros(values.shape[1:])
+    center = np.nan_to_num(center)
+    return np.where(valid, values - center, 0.0), valid.astype(float), center
+
+
+def rolling_metrics(returns, windows=WINDOWS, benchmark=None, min_periods=None, risk_free_rate=0.0,
+                    trading_days=TRADING_DAYS):
+    """Return rolling mean, volatility and Sharpe (and beta/correlation to ``benchmark``).
+
+    The result is indexed like ``returns`` with ``(metric, window, column)``
+    columns.  Volatility and Sharpe are annualized; ``risk_free_rate`` is
+    annual.
+    """
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    names = list(returns.columns)
+    values = returns.to_numpy(dtype=float)
+
+    centered, valid, center = _centered(values)
+    prefix_count = _prefix_sums(valid)
+    prefix_sum = _prefix_sums(centered)
+    prefix_square = _prefix_sums(centered * centered)
+
+    if benchmark is not None:
+        benchmark = benchmark.reindex(returns.index).to_numpy(dtype=float)[:, None]
+        # Pairwise: only rows where both the column and the benchmark have a value
+        pair_valid = valid * ~np.isnan(benchmark)
+        bench_centered, _, _ = _centered(benchmark)
+        pair_b = bench_centered * pair_valid
+        if np.array_equal(pair_valid, valid):
+            # No extra gaps from the benchmark: reuse the sums of the columns
+            pair_x = centered
+            prefix_pair_count, prefix_pair_x, prefix_pair_xx = prefix_count, prefix_sum, prefix_square
+        else:
+            pair_x = centered * pair_valid
+            prefix_pair_count = _prefix_sums(pair_valid)
+            prefix_pair_x = _prefix_sums(pair_x)
+            prefix_pair_xx = _prefix_sums(pair_x * pair_x)
+        prefix_pair_b = _prefix_sums(pair_b)
+        prefix_pair_bb = _prefix_sums(pair_b * pair_b)
+        prefix_pair_xb = _prefix_sums(pair_x * pair_b)
+
+    metrics = {}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for window in windows:
+            required = window if min_periods is None else min_periods
+            count = _window_sums(prefix_count, window)
+            total = _window_sums(prefix_sum, window)
+            squares = _window_sums(prefix_square, window)
+            enough = count >= max(required, 2)
+
+            mean = np.where(enough, total / count + center, np.nan)
+            variance = np.where(enough, (squares - total * total / count) / (count - 1), np.nan)
+            deviation = np.sqrt(np.clip(variance, 0, None))
+            metrics['mean', window] = mean
+            metrics['volatility', window] = deviation * np.sqrt(trading_days)
+            metrics['sharpe', window] = (mean * trading_days - risk_free_rate) / (deviation * np.sqrt(trading_days))
+
+            if benchmark is not None:
+                count = _window_sums(prefix_pair_count, window)
+                x = _window_sums(prefix_pair_x, window)
+                b = _window_sums(prefix_pair_b, window)
+                covariance = _window_sums(prefix_pair_xb, window) - x * b / count
+                x_variance = _window_sums(prefix_pair_xx, window) - x * x / count
+                b_variance = _window_sums(prefix_pair_bb, window) - b * b / count
+                enough = count >= max(required, 2)
+                metrics['beta', window] = np.where(enough, covariance / b_variance, np.nan)
+                metrics['correlation', window] = np.where(
+                    enough, covariance / np.sqrt(np.clip(x_variance * b_variance, 0, None)), np.nan
+                )
+
+    frames = {key: pd.DataFrame(value, index=returns.index, columns=names) for key, value in metrics.items()}
+    return pd.concat(frames, axis=1).sort_index(axis=1)
+
+
+def rolling_correlation(returns, window, min_periods=None):
+    """Return the rolling correlation matrix of the columns of ``returns``.
+
+    The result has one row per time and ``(column, column)`` columns.  Rows
+    with a missing value in any column are left out of the windows.  Memory
+    grows with the square of the number of columns.
+    """
+    names = list(returns.columns)
+    values = returns.to_numpy(dtype=float)
+    complete = ~np.isnan(values).any(axis=1)
+    centered, _, _ = _centered(np.where(complete[:, None], values, np.nan))
+
+    count = _window_sums(_prefix_sums(complete.astype(float)), window)
+    total = _window_sums(_prefix_sums(centered), window)
+    products = _window_sums(_prefix_sums(centered[:, :, None] * centered[:, None, :]), window)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        covariance = products - total[:, :, None] * total[:, None, :] / count[:, None, None]
+        deviation = np.sqrt(np.clip(np.diagonal(covariance, axis1=1, axis2=2), 0, None))
+        correlation = covariance / (deviation[:, :, None] * deviation[:, None, :])
+    required = window if min_periods is None else min_periods
+    correlation[count < max(required, 2)] = np.nan
+
+    columns = pd.MultiIndex.from_product([names, names])
+    return pd.DataFrame(correlation.reshape(len(values), -1), index=returns.index, columns=columns)
+
+
+def running_max_drawdown(returns):
+    """Return the current drawdown and the running maximum drawdown of each return series."""
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    # One pass over the rows per column, compiled when Numba is installed
+    metrics = etf_kernels.path_metrics(returns)
+    return metrics[['drawdown', 'max_drawdown']]
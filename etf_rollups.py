@@ -0,0 +1,389 @@
+"""Daily, weekly, monthly and yearly rollups of the price tables, maintained incrementally.
+
+Every chart and statistic of the notebook reads the full-resolution rows, even
+for a multi-year overview where a point per month would do.  This module keeps
+precomputed rollups of each ticker and of the equal-weight portfolio in one
+long table of etf.db::
+
+    rollups(series, resolution, period, time, open, high, low, close, volume,
+            returns, cum_returns, bars)
+
+keyed on ``(series, resolution, period)``, where ``period`` is the start of the
+day, week (Monday), month or year and ``time`` the last bar in it.  A row holds the
+open of the first bar, the highest high and lowest low, the close of the last
+bar, the summed volume, the period return compounded from the bars' returns,
+the cumulative return at the end of the period and the number of bars.  The
+portfolio has no prices: its open/high/low/close are those of the growth of 1
+invested in it (``1 + cum_returns``) and its volume is empty.
+
+As in ``etf_incremental`` a checkpoint per series (last processed time and
+running sum of ``log(1 + r)``) lets an update read only the bars after it.  New
+bars are aggregated on their own and the first of their periods is merged into
+the stored, possibly partial, row of the same period.  Bars are expected to be
+appended in time order; call ``rebuild`` after back-filling history.
+
+``plan`` picks the coarsest resolution that still has at least ``width``
+points in the requested date range (the full-resolution rows when none has),
+and ``load`` reads the series at that resolution::
+
+    python etf_rollups.py --database etf.db
+    python etf_rollups.py --database etf.db --series PYPL --width 100
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+import etf_data
+import etf_incremental
+import etf_plotting
+import etf_sql_analytics
+import etf_store
+
+
+ROLLUPS_TABLE = 'rollups'
+CHECKPOINTS_TABLE = 'rollup_checkpoints'
+
+# Rollup resolution -> pandas period frequency, finest first ('day' matters for intraday bars)
+RESOLUTIONS = {'day': 'D', 'week': 'W', 'month': 'M', 'year': 'Y'}
+
+# Resolution of the rows read from the price tables themselves
+RAW = 'raw'
+
+# Name of the equal-weight portfolio series
+PORTFOLIO_SERIES = etf_incremental.PORTFOLIO_SERIES
+
+# Columns of the bars read by an update
+BAR_COLUMNS = ['time', 'open', 'high', 'low', 'close', 'volume', 'returns']
+
+VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume', 'returns', 'cum_returns', 'bars']
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+        series TEXT PRIMARY KEY,
+        members TEXT NOT NULL,
+        time TIMESTAMP NOT NULL,
+        log_sum FLOAT NOT NULL,
+        rows BIGINT NOT NULL
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUPS_TABLE} (
+        series TEXT NOT NULL,
+        resolution TEXT NOT NULL,
+        period TIMESTAMP NOT NULL,
+        time TIMESTAMP NOT NULL,
+        open FLOAT,
+        high FLOAT,
+        low FLOAT,
+        close FLOAT,
+        volume FLOAT,
+        returns FLOAT,
+        cum_returns FLOAT,
+        bars BIGINT NOT NULL,
+        PRIMARY KEY (series, resolution, period)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def create_schema(connection):
+    for statement in SCHEMA:
+        connection.execute(sqlalchemy.text(statement))
+
+
+def _reset(connection, series):
+    for table in (CHECKPOINTS_TABLE, ROLLUPS_TABLE):
+        connection.execute(sqlalchemy.text(f'DELETE FROM {table} WHERE series = :series'), {'series': series})
+
+
+def _aggregate(bars, freq):
+    # One row per period of the bars (in time order), with the log of the compounded return
+    periods = bars['time'].dt.to_period(freq).dt.start_time.rename('period')
+    grouped = bars.groupby(periods, sort=True)
+    frame = grouped.agg(
+        time=('time', 'last'),
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        cum_returns=('cum_returns', 'last'),
+        bars=('time', 'size'),
+    )
+    frame['volume'] = grouped['volume'].sum(min_count=1)
+    frame['log_returns'] = grouped['log_returns'].sum(min_count=1)
+    return frame
+
+
+def _merge(stored, row):
+    # Fold the aggregate of the new bars into the stored row of the same period
+    def pick(first, second):
+        return second if first is None or np.isnan(first) else first
+
+    merged = dict(row)
+    merged['open'] = pick(stored.open, row['open'])
+    merged['close'] = pick(row['close'], stored.close)
+    merged['high'] = np.fmax(np.nan if stored.high is None else stored.high, row['high'])
+    merged['low'] = np.fmin(np.nan if stored.low is None else stored.low, row['low'])
+    if stored.volume is not None:
+        merged['volume'] = stored.volume + np.nan_to_num(row['volume'])
+    if stored.returns is not None:
+        merged['log_returns'] = np.log1p(stored.returns) + np.nan_to_num(row['log_returns'])
+    merged['bars'] = stored.bars + row['bars']
+    return merged
+
+
+def _nullable(value):
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def _update(series, members, new_rows_query, database_path, growth=False):
+    # Roll the bars after the checkpoint of ``series`` into every resolution in one transaction
+    with etf_data.get_engine(database_path).begin() as connection:
+        create_schema(connection)
+        state = connection.execute(
+            sqlalchemy.text(f'SELECT * FROM {CHECKPOINTS_TABLE} WHERE series = :series'), {'series': series}
+        ).fetchone()
+        if state is not None and state.members != members:
+            # The portfolio composition changed, so the stored rollups no longer apply
+            _reset(connection, series)
+            state = None
+
+        query, params = new_rows_query(None if state is None else state.time)
+        rows = connection.execute(sqlalchemy.text(query), params).fetchall()
+        if not rows:
+            return 0
+
+        bars = pd.DataFrame.from_records(rows, columns=BAR_COLUMNS, coerce_float=True)
+        bars['time'] = pd.to_datetime(bars['time'])
+        bars['log_returns'] = np.log1p(bars['returns'].astype(float))
+        log_sum = (0.0 if state is None else state.log_sum) + bars['log_returns'].fillna(0.0).cumsum()
+        bars['cum_returns'] = np.expm1(log_sum)
+        if growth:
+            for column in ('open', 'high', 'low', 'close'):
+                bars[column] = 1 + bars['cum_returns']
+
+        records = []
+        for resolution, freq in RESOLUTIONS.items():
+            frame = _aggregate(bars, freq)
+            first = frame.index[0]
+            stored = connection.execute(
+                sqlalchemy.text(
+                    f'SELECT * FROM {ROLLUPS_TABLE} '
+                    'WHERE series = :series AND resolution = :resolution AND period = :period'
+                ),
+                {'series': series, 'resolution': resolution, 'period': etf_data.format_time(first)},
+            ).fetchone()
+            for period, row in zip(frame.index, frame.to_dict('records')):
+                if period == first and stored is not None:
+                    row = _merge(stored, row)
+                records.append({
+                    'series': series,
+                    'resolution': resolution,
+                    'period': etf_data.format_time(period),
+                    'time': etf_data.format_time(row['time']),
+                    'open': _nullable(row['open']),
+                    'high': _nullable(row['high']),
+                    'low': _nullable(row['low']),
+                    'close': _nullable(row['close']),
+                    'volume': _nullable(row['volume']),
+                    'returns': _nullable(np.expm1(row['log_returns'])),
+                    'cum_returns': float(row['cum_returns']),
+                    'bars': int(row['bars']),
+                })
+
+        columns = ['series', 'resolution', 'period', 'time'] + VALUE_COLUMNS
+        connection.execute(
+            sqlalchemy.text(
+                f'INSERT OR REPLACE INTO {ROLLUPS_TABLE} ({", ".join(columns)}) '
+                f'VALUES ({", ".join(":" + column for column in columns)})'
+            ),
+            records,
+        )
+        connection.execute(
+            sqlalchemy.text(
+                f'INSERT OR REPLACE INTO {CHECKPOINTS_TABLE} (series, members, time, log_sum, rows) '
+                'VALUES (:series, :members, :time, :log_sum, :rows)'
+            ),
+            {
+                'series': series,
+                'members': members,
+                'time': rows[-1][0],
+                'log_sum': float(log_sum.iloc[-1]),
+                'rows': (0 if state is None else state.rows) + len(rows),
+            },
+        )
+    return len(rows)
+
+
+def update_asset(symbol, database_path=etf_data.DATABASE_PATH):
+    """Extend the rollups of ``symbol``; returns the number of new bars processed."""
+    symbol = symbol.upper()
+    columns = ['open', 'high', 'low', 'close', 'volume', 'daily_returns']
+
+    def new_rows_query(after):
+        return etf_store.asset_query(symbol, columns, database_path=database_path, after=after)
+
+    return _update(symbol, symbol, new_rows_query, database_path)
+
+
+def update_portfolio(symbols=None, series=PORTFOLIO_SERIES, database_path=etf_data.DATABASE_PATH):
+    """Extend the rollups of the equal-weight portfolio of ``symbols``."""
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    symbols = [symbol.upper() for symbol in symbols]
+
+    def new_rows_query(after):
+        portfolio, params = etf_sql_analytics.portfolio_mean_query(symbols, database_path)
+        query = (
+            'SELECT time, NULL, NULL, NULL, NULL, NULL, mean_daily_returns '
+            f'FROM ({portfolio}) AS portfolio'
+        )
+        if after is not None:
+            query += ' WHERE time > :after'
+            params = dict(params, after=after)
+        return query + ' ORDER BY time', params
+
+    return _update(series, ','.join(symbols), new_rows_query, database_path, growth=True)
+
+
+def update_all(database_path=etf_data.DATABASE_PATH):
+    """Update the rollups of every ticker and of the equal-weight portfolio; returns the new bars per series."""
+    symbols = etf_data.ticker_names(database_path)
+    counts = {symbol.upper(): update_asset(symbol, database_path) for symbol in symbols}
+    counts[PORTFOLIO_SERIES] = update_portfolio(symbols, database_path=database_path)
+    return counts
+
+
+def rebuild(series, database_path=etf_data.DATABASE_PATH):
+    """Drop the rollups of ``series`` and its checkpoint so the next update starts from scratch."""
+    with etf_data.get_engine(database_path).begin() as connection:
+        create_schema(connection)
+        _reset(connection, series)
+
+
+def _range(start, end):
+    conditions, params = [], {}
+    if start is not None:
+        conditions.append('time >= :start')
+        params['start'] = etf_data.format_time(start)
+    if end is not None:
+        conditions.append('time <= :end')
+        params['end'] = etf_data.format_time(end)
+    return ''.join(f' AND {condition}' for condition in conditions), params
+
+
+def read_rollup(series, resolution, start=None, end=None, database_path=etf_data.DATABASE_PATH):
+    """Read the stored ``resolution`` rollup of ``series`` as a DataFrame indexed by the last bar 'time'.
+
+    ``start``/``end`` are inclusive bounds on that time.
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f'Unknown resolution {resolution!r}, expected one of {list(RESOLUTIONS)}')
+    conditions, params = _range(start, end)
+    query = (
+        f'SELECT time, period, {", ".join(VALUE_COLUMNS)} FROM {ROLLUPS_TABLE} '
+        f'WHERE series = :series AND resolution = :resolution{conditions} ORDER BY period'
+    )
+    params.update(series=series.upper(), resolution=resolution)
+    frame = etf_data.read_query(query, params=params, database_path=database_path)
+    frame['period'] = pd.to_datetime(frame['period'])
+    # The portfolio has no volume, which would otherwise come back as a column of None
+    frame['volume'] = frame['volume'].astype(float)
+    return frame
+
+
+def plan(series, start=None, end=None, width=etf_plotting.MAX_POINTS, database_path=etf_data.DATABASE_PATH):
+    """Return the coarsest resolution with at least ``width`` points between ``start`` and ``end``.
+
+    Falls back to ``RAW`` (the price tables) when no rollup has enough
+    points, or none has been built.
+    """
+    if ROLLUPS_TABLE not in etf_data.table_names(database_path):
+        return RAW
+    conditions, params = _range(start, end)
+    query = (
+        f'SELECT resolution, COUNT(*) FROM {ROLLUPS_TABLE} '
+        f'WHERE series = :series{conditions} GROUP BY resolution'
+    )
+    params['series'] = series.upper()
+    with etf_data.read_connection(database_path) as connection:
+        counts = dict(connection.execute(query, params).fetchall())
+    for resolution in reversed(list(RESOLUTIONS)):
+        if counts.get(resolution, 0) >= width:
+            return resolution
+    return RAW
+
+
+def _read_raw(series, start, end, database_path):
+    # The full-resolution rows in the rollup columns, returns read (never written) through etf_incremental
+    if series == PORTFOLIO_SERIES:
+        returns = etf_incremental.portfolio_returns(start=start, end=end, database_path=database_path)
+    else:
+        returns = etf_incremental.asset_returns(series, start, end, database_path)
+    frame = returns.rename(columns={'daily_returns': 'returns'})
+    if series == PORTFOLIO_SERIES:
+        for column in ('open', 'high', 'low', 'close'):
+            frame[column] = 1 + frame['cum_returns']
+        frame['volume'] = np.nan
+    else:
+        prices = etf_data.load_asset(series, ['open', 'high', 'low', 'close', 'volume'], start, end, database_path)
+        frame = prices.join(frame)
+    frame['bars'] = 1
+    return frame.assign(period=frame.index)[['period'] + VALUE_COLUMNS]
+
+
+def load(series, start=None, end=None, width=etf_plotting.MAX_POINTS, database_path=etf_data.DATABASE_PATH,
+         update=True):
+    """Read ``series`` at the resolution chosen by ``plan``, first bringing its rollups up to date if ``update``.
+
+    ``series`` is a ticker or ``PORTFOLIO_SERIES``.  Returns the resolution
+    and a DataFrame indexed by 'time' with the rollup columns; at ``RAW``
+    resolution each bar is its own period.  With ``update=False`` nothing is
+    written and the stored rollups are read as they are.
+    """
+    series = series.upper()
+    if update:
+        try:
+            if series == PORTFOLIO_SERIES:
+                update_portfolio(database_path=database_path)
+            else:
+                update_asset(series, database_path)
+        except sqlalchemy.exc.OperationalError:
+            # Read-only database: use whatever rollups are stored, or the full-resolution rows
+            pass
+    resolution = plan(series, start, end, width, database_path)
+    if resolution == RAW:
+        return resolution, _read_raw(series, start, end, database_path)
+    return resolution, read_rollup(series, resolution, start, end, database_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build or extend the daily/weekly/monthly/yearly rollups in etf.db.'
+    )
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from scratch')
+    parser.add_argument('--series', help='instead of updating, show the plan and the rows loaded for this series')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    parser.add_argument('--width', type=int, default=etf_plotting.MAX_POINTS, help='points wanted by the chart')
+    args = parser.parse_args(argv)
+
+    if args.series:
+        resolution, frame = load(args.series, args.start, args.end, args.width, args.database, update=False)
+        print(f'{args.series.upper()}: {len(frame)} rows at {resolution} resolution')
+        print(frame.tail().to_string())
+        return
+    if args.rebuild:
+        for series in etf_data.ticker_names(args.database) + [PORTFOLIO_SERIES]:
+            rebuild(series.upper(), args.database)
+    for series, count in update_all(args.database).items():
+        print(f'{series}: {count} new bars rolled up')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Evaluate many candidate ETF weightings at once.
+
+``evaluate_weights`` takes the T x N daily returns matrix of the constituents
+(GDOT, GS, PYPL and SQ in etf.db) and a K x N array of weight vectors, and
+returns the annualized return, volatility, Sharpe ratio and maximum drawdown of
+each daily-rebalanced portfolio, the same model as the notebook's equal-weight
+mean.
+
+The annualized return and volatility of every candidate come from the mean
+vector and covariance matrix of the returns (``mu @ w`` and ``w' S w``).  The
+maximum drawdown needs the daily portfolio returns, a single ``R @ W.T``
+matrix product per chunk of candidates.  Chunks are spread over a
+``ProcessPoolExecutor``.  The returns matrix is placed in shared memory once
+and each worker maps it, so only the weight chunks travel between processes.
+
+Candidates can come from ``weight_grid`` (every weighting on a simplex grid)
+or ``random_weights`` (uniform over the simplex).  ``efficient_frontier`` keeps
+the candidates that no other one beats on both return and volatility::
+
+    python etf_scenarios.py --samples 20000 --workers 4
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_join
+
+
+# Number of trading days used to annualize daily figures
+TRADING_DAYS = 252
+
+# Candidates evaluated per task
+CHUNK_SIZE = 2048
+
+
+def weight_grid(n_assets, step=0.1):
+    """Return every long-only weight vector on a grid of ``step`` that sums to one."""
+    units = int(round(1 / step))
+    combinations = [
+        combination
+        for combination in itertools.product(range(units + 1), repeat=n_assets - 1)
+        if sum(combination) <= units
+    ]
+    grid = np.array(combinations, dtype=float).reshape(-1, n_assets - 1)
+    return np.column_stack([grid, units - grid.sum(axis=1)]) / units
+
+
+def random_weights(n_samples, n_assets, seed=None):
+    """Return ``n_samples`` long-only weight vectors drawn uniformly from the simplex."""
+    return np.random.default_rng(seed).dirichlet(np.ones(n_assets), size=n_samples)
+
+
+def max_drawdowns(portfolio_returns):
+    """Return the maximum drawdown of each column of a T x K matrix of daily returns.
+
+    Drawdowns are measured from the running peak with the initial value of 1
+    included, so a loss on the first day counts.
+    """
+    values = np.cumprod(1 + portfolio_returns, axis=0)
+    peaks = np.maximum.accumulate(values, axis=0)
+    np.maximum(peaks, 1.0, out=peaks)
+    np.divide(values, peaks, out=values)
+    return values.min(axis=0) - 1
+
+
+def _evaluate_chunk(returns, weights, mean, covariance, risk_free_rate):
+    annualized_return = weights @ mean * TRADING_DAYS
+    variance = np.einsum('kn,nm,km->k', weights, covariance, weights)
+    volatility = np.sqrt(np.clip(variance, 0, None) * TRADING_DAYS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = (annualized_return - risk_free_rate) / volatility
+    drawdown = max_drawdowns(returns @ weights.T)
+    return np.column_stack([annualized_return, volatility, sharpe, drawdown])
+
+
+# Set in each worker process by _attach_worker
+_worker = {}
+
+
+def _attach_worker(name, shape, dtype, mean, covariance, risk_free_rate):
+    block = shared_memory.SharedMemory(name=name)
+    # Keep a reference to the block, the array is only a view on its buffer
+    _worker.update(
+        block=block,
+        returns=np.ndarray(shape, dtype=dtype, buffer=block.buf),
+        mean=mean,
+        covariance=covariance,
+        risk_free_rate=risk_free_rate,
+    )
+
+
+def _evaluate_in_worker(weights):
+    return _evaluate_chunk(
+        _worker['returns'], weights, _worker['mean'], _worker['covariance'], _worker['risk_free_rate']
+    )
+
+
+def evaluate_weights(returns, weights, risk_free_rate=0.0, workers=None, chunk_size=CHUNK_SIZE):
+    """Return annualized return, volatility, Sharpe ratio and max drawdown for each weight vector.
+
+    ``returns`` is a T x N DataFrame or array of daily returns and ``weights``
+    a K x N array.  ``workers`` sets the number of processes (default: one per
+    CPU; 1 evaluates in this process).
+    """
+    columns = list(returns.columns) if isinstance(returns, pd.DataFrame) else list(range(np.shape(returns)[1]))
+    returns = np.ascontiguousarray(np.nan_to_num(np.asarray(returns, dtype=float), nan=0.0))
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    if weights.shape[1] != returns.shape[1]:
+        raise ValueError(f'Weights have {weights.shape[1]} columns, returns have {returns.shape[1]}')
+    mean = returns.mean(axis=0)
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+
+    chunks = [weights[start:start + chunk_size] for start in range(0, len(weights), chunk_size)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(chunks))
+
+    if workers <= 1:
+        metrics = [_evaluate_chunk(returns, chunk, mean, covariance, risk_free_rate) for chunk in chunks]
+    else:
+        block = shared_memory.SharedMemory(create=True, size=returns.nbytes)
+        try:
+            np.ndarray(returns.shape, dtype=returns.dtype, buffer=block.buf)[:] = returns
+            # Spawned, not forked: Numba's TBB threads, once started in this process, do not survive a fork.
+            # The workers attach the block by name.
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_attach_worker,
+                initargs=(block.name, returns.shape, returns.dtype, mean, covariance, risk_free_rate),
+            ) as executor:
+                metrics = list(executor.map(_evaluate_in_worker, chunks))
+        finally:
+            block.close()
+            block.unlink()
+
+    results = pd.DataFrame(
+        np.concatenate(metrics) if metrics else np.empty((0, 4)),
+        columns=['annualized_return', 'volatility', 'sharpe', 'max_drawdown'],
+    )
+    weight_columns = pd.DataFrame(weights, columns=[f'weight_{column}' for column in columns])
+    return pd.concat([weight_columns, results], axis=1)
+
+
+def efficient_frontier(results):
+    """Return the candidates with the highest return for their volatility, sorted by volatility."""
+    ordered = results.sort_values(['volatility', 'annualized_return'], ascending=[True, False])
+    best_so_far = ordered['annualized_return'].cummax()
+    frontier = ordered[ordered['annualized_return'] >= best_so_far]
+    return frontier.drop_duplicates('annualized_return')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate random ETF weightings over the returns in etf.db.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--samples', type=int, default=10_000, help='number of random weight vectors')
+    parser.add_argument('--grid-step', type=float, help='evaluate a weight grid with this step instead')
+    parser.add_argument('--workers', type=int, help='number of worker processes')
+    parser.add_argument('--risk-free-rate', type=float, default=0.0, help='annual risk-free rate for the Sharpe ratio')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    returns = etf_join.join_assets(fields=['daily_returns'], database_path=args.database).droplevel(1, axis=1)
+    if args.grid_step:
+        weights = weight_grid(returns.shape[1], args.grid_step)
+    else:
+        weights = random_weights(args.samples, returns.shape[1], args.seed)
+
+    start = time.perf_counter()
+    results = evaluate_weights(returns, weights, args.risk_free_rate, args.workers)
+    elapsed = time.perf_counter() - start
+    print(f'Evaluated {len(results)} weightings over {len(returns)} days in {elapsed:.3f}s')
+    print('\nHighest Sharpe ratios:')
+    print(results.nlargest(5, 'sharpe').to_string(index=False))
+    print(f'\nEfficient frontier: {len(efficient_frontier(results))} weightings')
+
+
+if __name__ == '__main__':
+    main()
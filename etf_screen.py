@@ -0,0 +1,276 @@
+"""Screens across every ticker: top/bottom-N and threshold queries.
+
+The notebook's "PYPL close > 200" and "top 10 daily returns" screens cover
+one ticker and one threshold.  The functions here run the same kinds of
+screens over all the tickers at once, optionally within a date window:
+
+* ``top_n(field, n, largest=True)`` - the n largest (or smallest) values
+* ``between(field, above=None, below=None)`` - the rows strictly inside a range
+
+In SQL each ticker is answered from a secondary index on ``(field, time)``
+(``create_indexes``; the consolidated ``prices`` table has them on
+``(symbol, field)``), so a screen is an index range scan that stops after k
+rows instead of a full scan.  SQLite keeps the indexes up to date as bars are
+inserted, and ``etf_ingest`` adds them to the tables it creates once they are
+in use.
+
+``ScreenIndex`` answers the same screens from frames already in memory: every
+field is held as one value-sorted array across all tickers, so a screen is a
+binary search plus a slice, O(log n + k).
+
+    python etf_screen.py index
+    python etf_screen.py top daily_returns -n 10
+    python etf_screen.py between close --above 200
+"""
+
+import argparse
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_store
+
+
+# Fields that get a screening index
+SCREEN_FIELDS = ['close', 'daily_returns', 'volume']
+
+# Tickers combined in one compound query (SQLite allows 500 terms per compound SELECT)
+SYMBOLS_PER_QUERY = 250
+
+
+def _index_name(symbol, field):
+    return etf_data.quote_identifier(f'ix_{symbol}_{field}')
+
+
+def create_ticker_indexes(connection, symbol, fields=SCREEN_FIELDS):
+    """Create the screening indexes of one per-ticker table on a ``sqlite3`` connection."""
+    table = etf_data.quote_identifier(symbol)
+    for field in fields:
+        connection.execute(
+            f'CREATE INDEX IF NOT EXISTS {_index_name(symbol, field)} ON {table} ({etf_data.quote_identifier(field)}, time)'
+        )
+
+
+def has_indexes(connection):
+    """Return True when the database already uses screening indexes."""
+    row = connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix\\_%\\_close' ESCAPE '\\' LIMIT 1"
+    ).fetchone()
+    return row is not None
+
+
+def create_indexes(database_path=etf_data.DATABASE_PATH, symbols=None, fields=SCREEN_FIELDS):
+    """Create the screening indexes in either layout and refresh the planner statistics."""
+    long = etf_store.layout(database_path) == 'long'
+    if symbols is None and not long:
+        symbols = etf_data.wide_ticker_names(database_path)
+    connection = sqlite3.connect(database_path)
+    try:
+        with connection:
+            if long:
+                for field in fields:
+                    connection.execute(
+                        f'CREATE INDEX IF NOT EXISTS ix_{etf_store.PRICES_TABLE}_{field} '
+                        f'ON {etf_store.PRICES_TABLE} (symbol, {etf_data.quote_identifier(field)})'
+                    )
+            else:
+                for symbol in symbols:
+                    create_ticker_indexes(connection, symbol, fields)
+            connection.execute('ANALYZE')
+    finally:
+        connection.close()
+    etf_data.invalidate()
+
+
+def _check_field(field):
+    if field not in etf_data.PRICE_COLUMNS:
+        raise ValueError(f'Unknown field {field!r}, expected one of {etf_data.PRICE_COLUMNS}')
+    return etf_data.quote_identifier(field)
+
+
+def _select(position, symbol, column, conditions, long, suffix=''):
+    # One ticker's part of the compound query
+    conditions = [f'{column} IS NOT NULL'] + conditions
+    if long:
+        source = etf_store.PRICES_TABLE
+        conditions.insert(0, f'symbol = :symbol_{position}')
+    else:
+        source = etf_data.quote_identifier(symbol)
+    return (
+        f'SELECT * FROM (SELECT :symbol_{position} AS symbol, time, {column} FROM {source} '
+        f'WHERE {" AND ".join(conditions)}{suffix})'
+    )
+
+
+def _run_screen(field, conditions, params, symbols, database_path, suffix='', order=''):
+    column = _check_field(field)
+    long = etf_store.layout(database_path) == 'long'
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    frames = []
+    for chunk_start in range(0, len(symbols), SYMBOLS_PER_QUERY):
+        chunk = symbols[chunk_start:chunk_start + SYMBOLS_PER_QUERY]
+        query = '\nUNION ALL\n'.join(
+            _select(position, symbol, column, list(conditions), long, suffix) for position, symbol in enumerate(chunk)
+        ) + order
+        chunk_params = dict(params, **{f'symbol_{position}': symbol.upper() for position, symbol in enumerate(chunk)})
+        frames.append(etf_data.read_query(query, params=chunk_params, database_path=database_path))
+    return pd.concat(frames) if len(frames) > 1 else frames[0]
+
+
+def _window(start, end):
+    conditions = []
+    params = {}
+    if start is not None:
+        conditions.append('time >= :start')
+        params['start'] = etf_data.format_time(start)
+    if end is not None:
+        conditions.append('time <= :end')
+        params['end'] = etf_data.format_time(end)
+    return conditions, params
+
+
+def top_n(field='daily_returns', n=10, largest=True, start=None, end=None, symbols=None,
+          database_path=etf_data.DATABASE_PATH):
+    """Return the ``n`` largest (or smallest) values of ``field`` across the tickers.
+
+    The result is indexed by 'time' with a 'symbol' column, sorted by value.
+    """
+    conditions, params = _window(start, end)
+    params['n'] = int(n)
+    direction = 'DESC' if largest else 'ASC'
+    column = _check_field(field)
+    # Each ticker stops after n rows of its index; the outer ORDER BY merges them
+    frame = _run_screen(
+        field, conditions, params, symbols, database_path,
+        suffix=f' ORDER BY {column} {direction} LIMIT :n',
+        order=f'\nORDER BY {column} {direction} LIMIT :n',
+    )
+    frame = frame.sort_values(field, ascending=not largest, kind='stable')
+    return frame.head(int(n))
+
+
+def between(field='close', above=None, below=None, start=None, end=None, symbols=None,
+            database_path=etf_data.DATABASE_PATH):
+    """Return the rows where ``above < field < below`` across the tickers, sorted by time and symbol."""
+    conditions, params = _window(start, end)
+    column = _check_field(field)
+    if above is not None:
+        conditions.append(f'{column} > :above')
+        params['above'] = above
+    if below is not None:
+        conditions.append(f'{column} < :below')
+        params['below'] = below
+    frame = _run_screen(field, conditions, params, symbols, database_path)
+    return frame.reset_index().sort_values(['time', 'symbol'], kind='stable').set_index('time')
+
+
+class ScreenIndex:
+    """Value-sorted arrays of several fields across tickers, for screens on data in memory."""
+
+    def __init__(self, frames, fields=SCREEN_FIELDS):
+        self.symbols = [symbol.upper() for symbol in frames]
+        self._sorted = {}
+        for field in fields:
+            values, codes, times = [], [], []
+            for code, frame in enumerate(frames.values()):
+                column = frame[field].to_numpy()
+                valid = ~pd.isna(column)
+                values.append(column[valid])
+                codes.append(np.full(int(valid.sum()), code, dtype=np.int32))
+                times.append(frame.index.to_numpy()[valid])
+            values = np.concatenate(values)
+            order = np.argsort(values, kind='stable')
+            self._sorted[field] = (values[order], np.concatenate(codes)[order], np.concatenate(times)[order])
+
+    @classmethod
+    def from_database(cls, symbols=None, fields=SCREEN_FIELDS, database_path=etf_data.DATABASE_PATH):
+        if symbols is None:
+            symbols = etf_data.ticker_names(database_path)
+        frames = {symbol: etf_data.load_asset(symbol, fields, database_path=database_path, copy=False)
+                  for symbol in symbols}
+        return cls(frames, fields)
+
+    def _keep(self, field, positions, start, end, symbols):
+        # Boolean mask of the positions passing the date window and symbol filters
+        _, codes, times = self._sorted[field]
+        keep = np.ones(len(positions), dtype=bool)
+        if start is not None:
+            keep &= times[positions] >= pd.Timestamp(start).to_datetime64()
+        if end is not None:
+            keep &= times[positions] <= pd.Timestamp(end).to_datetime64()
+        if symbols is not None:
+            wanted = [self.symbols.index(symbol.upper()) for symbol in symbols]
+            keep &= np.isin(codes[positions], wanted)
+        return keep
+
+    def _frame(self, field, positions):
+        values, codes, times = self._sorted[field]
+        return pd.DataFrame(
+            {'symbol': np.asarray(self.symbols, dtype=object)[codes[positions]], field: values[positions]},
+            index=pd.DatetimeIndex(times[positions], name='time'),
+        )
+
+    def top_n(self, field='daily_returns', n=10, largest=True, start=None, end=None, symbols=None):
+        """Return the ``n`` largest (or smallest) values, like ``etf_screen.top_n``."""
+        values = self._sorted[field][0]
+        # Walk the sorted array from the wanted end in growing blocks until n rows pass the filters
+        found = []
+        count = 0
+        block = max(int(n), 1)
+        offset = 0
+        while count < n and offset < len(values):
+            stop = min(offset + block, len(values))
+            positions = np.arange(offset, stop)
+            if largest:
+                positions = len(values) - 1 - positions
+            positions = positions[self._keep(field, positions, start, end, symbols)]
+            found.append(positions)
+            count += len(positions)
+            offset = stop
+            block *= 2
+        positions = np.concatenate(found)[:int(n)] if found else np.empty(0, dtype=int)
+        return self._frame(field, positions)
+
+    def between(self, field='close', above=None, below=None, start=None, end=None, symbols=None):
+        """Return the rows where ``above < field < below``, like ``etf_screen.between``."""
+        values = self._sorted[field][0]
+        low = 0 if above is None else np.searchsorted(values, above, side='right')
+        high = len(values) if below is None else np.searchsorted(values, below, side='left')
+        positions = np.arange(low, max(low, high))
+        positions = positions[self._keep(field, positions, start, end, symbols)]
+        frame = self._frame(field, positions)
+        return frame.reset_index().sort_values(['time', 'symbol'], kind='stable').set_index('time')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Screen every ticker in etf.db.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('index', help='create the screening indexes')
+    top = commands.add_parser('top', help='largest (or smallest) values of a field')
+    top.add_argument('field')
+    top.add_argument('-n', type=int, default=10)
+    top.add_argument('--smallest', action='store_true')
+    in_range = commands.add_parser('between', help='rows with a field strictly inside a range')
+    in_range.add_argument('field')
+    in_range.add_argument('--above', type=float)
+    in_range.add_argument('--below', type=float)
+    for command in (top, in_range):
+        command.add_argument('--start', help='first date of the window')
+        command.add_argument('--end', help='last date of the window')
+    args = parser.parse_args(argv)
+
+    if args.command == 'index':
+        create_indexes(args.database)
+        print(f'Created the screening indexes in {args.database}')
+    elif args.command == 'top':
+        print(top_n(args.field, args.n, not args.smallest, args.start, args.end, database_path=args.database))
+    else:
+        print(between(args.field, args.above, args.below, args.start, args.end, database_path=args.database))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Asynchronous HTTP service for the analyzer results.
+
+Voila starts a Jupyter kernel per visitor and re-runs the whole notebook.
+This service runs the analysis steps in one long-lived process instead and
+serves their results to any number of clients:
+
+    GET /tickers
+    GET /assets/<symbol>                  ?columns=close,volume&start=...&end=...
+    GET /assets/<symbol>/returns          daily and cumulative returns
+    GET /portfolio                        ?how=inner|outer|asof
+    GET /portfolio/returns                the notebook's etf_portfolio_returns
+    GET /portfolio/annualized             annualized mean daily returns per ticker and for the ETF
+    GET /portfolio/cumulative             cumulative returns per ticker and for the ETF
+    GET /screens/top                      ?field=daily_returns&n=10&largest=false&start=...&end=...
+    GET /screens/between                  ?field=close&above=200&below=...
+    GET /rollups/<series>                 ?start=...&end=...&width=2000 (a ticker or ETF)
+    GET /stats                            cache and connection pool counters
+
+Tables come back as JSON (``{"columns": [...], "data": [[...], ...]}``, with
+'time' as the first column and portfolio columns flattened to
+'SYMBOL.field') or, with ``?format=arrow`` or an ``Accept:
+application/vnd.apache.arrow.stream`` header, as an Arrow IPC stream.
+
+The event loop only parses requests and writes responses: every endpoint runs
+on a thread pool next to the pooled read-only database connections.  The
+endpoints never write: the stored cumulative returns and rollups are read as
+they are (newer bars are compounded in memory), and they are extended by
+``etf_ingest --update-checkpoints --update-rollups`` or, with
+``--update-interval``, by a single background task of the service.  Encoded
+responses are kept in the process-wide ``etf_cache`` (keyed on the data
+version, so new bars invalidate them), where the notebook and the report keep
+their results too; with ``ETF_CACHE_DIR`` set, several service processes share
+them through the cache directory.
+
+The HTTP layer is tornado, which runs on asyncio and is already installed
+with Jupyter and Voila::
+
+    python etf_service.py --port 8050
+
+``benchmarks/bench_service_load.py`` reports the requests per second and the
+latency percentiles at increasing concurrency.
+"""
+
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import etf_cache
+import etf_data
+import etf_db
+import etf_pipeline
+import etf_screen
+import etf_snapshot
+
+
+DEFAULT_PORT = 8050
+
+# Threads running the endpoints (one per pooled database connection)
+WORKERS = etf_db.POOL_SIZE
+
+JSON_TYPE = 'application/json'
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+
+
+def _symbol(params, database_path):
+    symbol = params['symbol'].upper()
+    if symbol not in etf_data.ticker_names(database_path):
+        raise KeyError(f'Unknown ticker {symbol!r}')
+    return symbol
+
+
+def _flag(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def _float(params, name):
+    return None if params.get(name) is None else float(params[name])
+
+
+def tickers(params, database_path):
+    return etf_data.ticker_names(database_path)
+
+
+def asset(params, database_path):
+    columns = params['columns'].split(',') if params.get('columns') else None
+    return etf_data.load_asset(_symbol(params, database_path), columns, params.get('start'), params.get('end'),
+                               database_path=database_path, copy=False)
+
+
+def asset_returns(params, database_path):
+    symbol = _symbol(params, database_path)
+    daily = etf_data.load_asset(symbol, ['daily_returns'], database_path=database_path, copy=False)
+    cumulative = etf_pipeline.asset_cumulative_returns(symbol, database_path, update=False)
+    return daily.assign(cum_returns=cumulative)
+
+
+def portfolio(params, database_path):
+    import etf_join
+    return etf_join.join_assets(how=params.get('how', 'inner'), database_path=database_path)
+
+
+def portfolio_returns(params, database_path):
+    symbols = etf_data.ticker_names(database_path)
+    returns = etf_pipeline.portfolio_returns(symbols, database_path)
+    mean = returns[('ETF', 'mean_daily_returns')]
+    returns[('ETF', 'ann_mean_daily_returns_per')] = etf_pipeline.annualized_returns(mean) * 100
+    returns[('ETF', 'cum_returns')] = etf_pipeline.portfolio_cumulative_returns(symbols, database_path, update=False)
+    return returns
+
+
+def annualized(params, database_path):
+    returns = etf_pipeline.portfolio_returns(etf_data.ticker_names(database_path), database_path)
+    mean = returns.mean()
+    return {symbol: float(value) for (symbol, _), value in etf_pipeline.annualized_returns(mean).items()}
+
+
+def cumulative(params, database_path):
+    symbols = etf_data.ticker_names(database_path)
+    returns = etf_pipeline.portfolio_returns(symbols, database_path)
+    frame = etf_pipeline.assets_cumulative_returns(returns[symbols].droplevel(1, axis=1))
+    frame['ETF'] = etf_pipeline.portfolio_cumulative_returns(symbols, database_path, update=False)
+    return frame
+
+
+def top(params, database_path):
+    return etf_screen.top_n(params.get('field', 'daily_returns'), int(params.get('n', 10)),
+                            _flag(params.get('largest', 'true')), params.get('start'), params.get('end'),
+                            database_path=database_path)
+
+
+def between(params, database_path):
+    return etf_screen.between(params.get('field', 'close'), _float(params, 'above'), _float(params, 'below'),
+                              params.get('start'), params.get('end'), database_path=database_path)
+
+
+def rollup(params, database_path):
+    import etf_plotting
+    import etf_rollups
+    series = params['series'].upper()
+    if series != etf_rollups.PORTFOLIO_SERIES:
+        series = _symbol({'symbol': series}, database_path)
+    width = int(params.get('width', etf_plotting.MAX_POINTS))
+    resolution, frame = etf_rollups.load(series, params.get('start'), params.get('end'), width, database_path,
+                                         update=False)
+    return frame.assign(resolution=resolution)
+
+
+# Endpoint name -> function(params, database_path) returning a DataFrame, Series, dict or list
+ENDPOINTS = {
+    'tickers': tickers,
+    'asset': asset,
+    'asset_returns': asset_returns,
+    'portfolio': portfolio,
+    'portfolio_returns': portfolio_returns,
+    'annualized': annualized,
+    'cumulative': cumulative,
+    'top': top,
+    'between': between,
+    'rollup': rollup,
+}
+
+ROUTES = [
+    (r'/tickers', 'tickers'),
+    (r'/assets/(?P<symbol>[^/]+)', 'asset'),
+    (r'/assets/(?P<symbol>[^/]+)/returns', 'asset_returns'),
+    (r'/portfolio', 'portfolio'),
+    (r'/portfolio/returns', 'portfolio_returns'),
+    (r'/portfolio/annualized', 'annualized'),
+    (r'/portfolio/cumulative', 'cumulative'),
+    (r'/screens/top', 'top'),
+    (r'/screens/between', 'between'),
+    (r'/rollups/(?P<series>[^/]+)', 'rollup'),
+]
+
+
+def to_table(result):
+    """Return ``result`` as a flat DataFrame: the index as leading column(s), (symbol, field) columns joined."""
+    frame = result.to_frame() if isinstance(result, pd.Series) else result
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame = frame.set_axis([etf_snapshot.COLUMN_SEPARATOR.join(column) for column in frame.columns], axis=1)
+    if frame.index.name is None and isinstance(frame.index, pd.RangeIndex):
+        return frame
+    return frame.reset_index()
+
+
+def encode(result, format='json'):
+    """Encode an endpoint result as JSON or as an Arrow IPC stream; returns (content type, bytes)."""
+    if format == 'arrow':
+        if isinstance(result, dict):
+            result = pd.DataFrame({'name': list(result), 'value': list(result.values())})
+        elif isinstance(result, list):
+            result = pd.DataFrame({'value': result})
+        import pyarrow as pa
+        table = pa.Table.from_pandas(to_table(result), preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return ARROW_TYPE, sink.getvalue().to_pybytes()
+    if format != 'json':
+        raise ValueError(f"Unknown format {format!r}, expected 'json' or 'arrow'")
+    if isinstance(result, (dict, list)):
+        return JSON_TYPE, json.dumps(result).encode()
+    return JSON_TYPE, to_table(result).to_json(orient='split', index=False, date_format='iso').encode()
+
+
+def respond(endpoint, params, format='json', database_path=etf_data.DATABASE_PATH):
+    """Run ``endpoint`` and return its encoded response, from the shared cache when the data has not changed."""
+    function = ENDPOINTS[endpoint]
+    key = (tuple(sorted(params.items())), format)
+    return etf_cache.cached(f'service-{endpoint}', lambda: encode(function(params, database_path), format), key,
+                            database_path)
+
+
+def stats(database_path=etf_data.DATABASE_PATH):
+    """Return the loader cache, results cache and connection pool counters."""
+    return {
+        'loader_cache': etf_data.cache_stats(),
+        'results_cache': etf_cache.cache_stats(),
+        'connection_pool': etf_db.get_pool(database_path).stats(),
+    }
+
+
+def make_app(database_path=etf_data.DATABASE_PATH, workers=WORKERS):
+    """Return the tornado application serving ``ROUTES`` for ``database_path``."""
+    import tornado.web
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='etf-service')
+
+    class EndpointHandler(tornado.web.RequestHandler):
+        def initialize(self, endpoint):
+            self.endpoint = endpoint
+
+        async def get(self, **path):
+            params = {name: self.get_argument(name) for name in self.request.arguments if name != 'format'}
+            params.update(path)
+            accept = self.request.headers.get('Accept', '')
+            format = self.get_argument('format', 'arrow' if ARROW_TYPE in accept else 'json')
+            loop = asyncio.get_running_loop()
+            try:
+                content_type, body = await loop.run_in_executor(
+                    executor, respond, self.endpoint, params, format, database_path
+                )
+            except KeyError as error:
+                return self._error(404, error.args[0] if error.args else str(error))
+            except ValueError as error:
+                return self._error(400, str(error))
+            self.set_header('Content-Type', content_type)
+            self.finish(body)
+
+        def _error(self, status, message):
+            self.set_status(status)
+            self.set_header('Content-Type', JSON_TYPE)
+            self.finish(json.dumps({'error': str(message)}))
+
+    class StatsHandler(tornado.web.RequestHandler):
+        def get(self):
+            self.set_header('Content-Type', JSON_TYPE)
+            self.finish(json.dumps(stats(database_path)))
+
+    handlers = [(pattern + r'/?', EndpointHandler, {'endpoint': endpoint}) for pattern, endpoint in ROUTES]
+    handlers.append((r'/stats/?', StatsHandler))
+    return tornado.web.Application(handlers)
+
+
+def update(database_path=etf_data.DATABASE_PATH):
+    """Extend the stored cumulative returns and rollups with the new bars; returns the new bars per series."""
+    import etf_incremental
+    import etf_rollups
+    counts = etf_incremental.update_all(database_path)
+    etf_rollups.update_all(database_path)
+    return counts
+
+
+async def update_periodically(interval, database_path=etf_data.DATABASE_PATH):
+    """Run ``update`` every ``interval`` seconds on a thread of its own, the only writer of the service."""
+    import sqlite3
+
+    import sqlalchemy
+    import tornado.log
+
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='etf-update') as executor:
+        while True:
+            try:
+                await loop.run_in_executor(executor, update, database_path)
+            except (sqlite3.OperationalError, sqlalchemy.exc.OperationalError) as error:
+                # Read-only or busy database: the endpoints keep computing the missing bars, retry next time
+                tornado.log.app_log.warning('Update skipped: %s', error)
+            await asyncio.sleep(interval)
+
+
+async def serve(port=DEFAULT_PORT, address='127.0.0.1', database_path=etf_data.DATABASE_PATH, workers=WORKERS,
+                update_interval=None):
+    """Serve the analyzer results until cancelled, updating the stored series every ``update_interval`` seconds."""
+    app = make_app(database_path, workers)
+    server = app.listen(port, address)
+    updater = None
+    if update_interval:
+        updater = asyncio.create_task(update_periodically(update_interval, database_path))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if updater is not None:
+            updater.cancel()
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the ETF analyzer results over HTTP.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--address', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='threads running the endpoints')
+    parser.add_argument('--update-interval', type=float,
+                        help='seconds between updates of the stored cumulative returns and rollups (default: none)')
+    args = parser.parse_args(argv)
+
+    print(f'Serving {args.database} on http://{args.address}:{args.port}')
+    try:
+        asyncio.run(serve(args.port, args.address, args.database, args.workers, args.update_interval))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Columnar (Arrow IPC) snapshots of the ticker tables in etf.db.
+
+Reading from SQLite goes row by row through the driver before pandas can
+build a DataFrame.  ``export_snapshots`` materializes every ticker table, plus
+the joined portfolio frame, as uncompressed Arrow IPC files next to the
+database.  Those files are memory-mapped on read, so the numeric columns are
+handed to pandas without copying and several kernels reading the same
+snapshot share the OS page cache.
+
+Snapshots are only used while they are newer than the database; run this
+module again after the database changes to refresh them::
+
+    python etf_snapshot.py --database etf.db
+
+pyarrow is optional: without it the analyzer simply keeps reading from SQLite.
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+import etf_data
+
+
+# Name of the snapshot holding the joined portfolio frame
+PORTFOLIO_SNAPSHOT = 'PORTFOLIO'
+
+# Separator used to flatten the (symbol, field) portfolio columns
+COLUMN_SEPARATOR = '.'
+
+
+def _pyarrow():
+    # Imported on first use, so readers without a snapshot never load pyarrow
+    try:
+        import pyarrow
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def snapshot_dir(database_path=etf_data.DATABASE_PATH):
+    """Return the directory holding the snapshots for ``database_path``."""
+    return os.path.splitext(database_path)[0] + '_snapshots'
+
+
+def snapshot_path(name, database_path=etf_data.DATABASE_PATH):
+    return os.path.join(snapshot_dir(database_path), f'{name.upper()}.arrow')
+
+
+def is_fresh(name, database_path=etf_data.DATABASE_PATH):
+    """Return True when the snapshot exists and is newer than the database."""
+    try:
+        snapshot_mtime = os.stat(snapshot_path(name, database_path)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    if _pyarrow() is None:
+        return False
+    for version in etf_data.database_version(database_path):
+        if version is not None and version[0] > snapshot_mtime:
+            return False
+    return True
+
+
+def _write(frame, path):
+    pa = _pyarrow()
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    # Write to a temporary file first so readers never see a partial snapshot
+    temporary_path = path + '.tmp'
+    with pa.OSFile(temporary_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(temporary_path, path)
+
+
+def _read(path, columns=None):
+    pa = _pyarrow()
+    # Memory-map the file: the record batches reference the mapped pages directly
+    with pa.memory_map(path, 'r') as source:
+        table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select(['time'] + list(columns))
+    # split_blocks keeps each column in its own block so numeric columns stay zero-copy
+    return table.to_pandas(split_blocks=True)
+
+
+def export_snapshots(database_path=etf_data.DATABASE_PATH, symbols=None):
+    """Write an Arrow snapshot of each ticker table and of the joined portfolio.
+
+    Returns the list of files written.
+    """
+    if _pyarrow() is None:
+        raise ImportError('pyarrow is required to export snapshots')
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    os.makedirs(snapshot_dir(database_path), exist_ok=True)
+
+    paths = []
+    frames = {}
+    for symbol in symbols:
+        frame = etf_data.query_asset(symbol, database_path=database_path)
+        frames[symbol.upper()] = frame
+        path = snapshot_path(symbol, database_path)
+        _write(frame, path)
+        paths.append(path)
+
+    # Joined portfolio frame, flattened to 'SYMBOL.field' columns for storage
+    portfolio = pd.concat(frames, axis=1, join='inner')
+    portfolio.columns = [COLUMN_SEPARATOR.join(column) for column in portfolio.columns]
+    path = snapshot_path(PORTFOLIO_SNAPSHOT, database_path)
+    _write(portfolio, path)
+    paths.append(path)
+    return paths
+
+
+def read_snapshot(symbol, columns=None, database_path=etf_data.DATABASE_PATH):
+    """Read a ticker snapshot, or return None when it is missing or stale."""
+    if not is_fresh(symbol, database_path):
+        return None
+    return _read(snapshot_path(symbol, database_path), columns)
+
+
+def read_portfolio_snapshot(database_path=etf_data.DATABASE_PATH):
+    """Read the joined portfolio snapshot with (symbol, field) columns, or None when stale."""
+    if not is_fresh(PORTFOLIO_SNAPSHOT, database_path):
+        return None
+    portfolio = _read(snapshot_path(PORTFOLIO_SNAPSHOT, database_path))
+    portfolio.columns = pd.MultiIndex.from_tuples(
+        [tuple(column.split(COLUMN_SEPARATOR, 1)) for column in portfolio.columns]
+    )
+    return portfolio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export Arrow snapshots of the ticker tables in etf.db.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    args = parser.parse_args(argv)
+    for path in export_snapshots(args.database):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+"""SQL-side portfolio analytics.
+
+The notebook pulls the joined daily returns into pandas and then computes the
+equal-weight mean, the ``* 252`` annualization and ``(1 + r).cumprod() - 1``.
+The functions here compute the same figures inside SQLite and only return the
+result set:
+
+* the equal-weight mean is an expression over the joined columns (or an
+  ``AVG ... GROUP BY time`` over the consolidated ``prices`` table),
+* the cumulative return is ``EXP(SUM(LN(1 + r)) OVER (ORDER BY time)) - 1``,
+  using the ``LN``/``EXP``/``SQRT`` functions registered on every connection by
+  ``etf_data`` (when SQLite does not provide them).
+
+Missing returns are skipped like pandas does: a day's mean is taken over the
+tickers that have a value, and a day without any value leaves the cumulative
+return unchanged.  ``LN`` is NULL for a loss of 100% or more, which ``SUM``
+would skip, so the cumulative return is set to -1 from such a day on.
+
+See ``benchmarks/bench_sql_analytics.py`` for a comparison against the pandas
+path.
+"""
+
+import math
+
+import pandas as pd
+
+import etf_data
+import etf_store
+
+
+# Number of trading days used to annualize daily figures
+TRADING_DAYS = 252
+
+
+def portfolio_mean_query(symbols, database_path=etf_data.DATABASE_PATH):
+    """Return SQL (and parameters) selecting 'time' and the equal-weight 'mean_daily_returns'."""
+    symbols = [symbol.upper() for symbol in symbols]
+    if etf_store.layout(database_path) == 'long':
+        placeholders = ', '.join(f':symbol_{i}' for i in range(len(symbols)))
+        query = f"""
+        SELECT time, AVG(daily_returns) AS mean_daily_returns
+        FROM {etf_store.PRICES_TABLE}
+        WHERE symbol IN ({placeholders})
+        GROUP BY time
+        HAVING COUNT(*) = :count
+        """
+        params = {f'symbol_{i}': symbol for i, symbol in enumerate(symbols)}
+        params['count'] = len(symbols)
+        return query, params
+
+    tables = [etf_data.quote_identifier(symbol) for symbol in symbols]
+    returns = [f'{table}.daily_returns' for table in tables]
+    # Average over the non-null returns of each day, as DataFrame.mean(axis=1) does
+    total = ' + '.join(f'COALESCE({column}, 0)' for column in returns)
+    count = ' + '.join(f'({column} IS NOT NULL)' for column in returns)
+    query = f'SELECT {tables[0]}.time AS time, ({total}) / NULLIF({count}, 0) AS mean_daily_returns\n'
+    query += f'FROM {tables[0]}\n' + ''.join(
+        f'INNER JOIN {table} ON {tables[0]}.time = {table}.time\n' for table in tables[1:]
+    )
+    return query, {}
+
+
+def portfolio_returns_sql(symbols=None, database_path=etf_data.DATABASE_PATH):
+    """Return the daily mean, annualized (percent) and cumulative portfolio returns computed in SQLite.
+
+    The columns match the 'ETF' columns the notebook adds to
+    ``etf_portfolio_returns``.
+    """
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    portfolio, params = portfolio_mean_query(symbols, database_path)
+    query = f"""
+    WITH portfolio AS ({portfolio})
+    SELECT
+        time,
+        mean_daily_returns,
+        mean_daily_returns * {TRADING_DAYS} * 100 AS ann_mean_daily_returns_per,
+        CASE
+            WHEN MIN(1 + mean_daily_returns) OVER running <= 0 THEN -1.0
+            ELSE EXP(SUM(LN(1 + mean_daily_returns)) OVER running) - 1
+        END AS cum_returns
+    FROM portfolio
+    WINDOW running AS (ORDER BY time ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW)
+    ORDER BY time
+    """
+    return etf_data.read_query(query, params=params, database_path=database_path)
+
+
+def portfolio_summary_sql(symbols=None, database_path=etf_data.DATABASE_PATH):
+    """Return a Series of whole-period portfolio statistics computed in SQLite.
+
+    Includes the number of days, the date range, the mean daily return, the
+    annualized return and volatility, and the cumulative return.
+    """
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    portfolio, params = portfolio_mean_query(symbols, database_path)
+    query = f"""
+    WITH portfolio AS ({portfolio})
+    SELECT
+        COUNT(mean_daily_returns) AS days,
+        MIN(time) AS start,
+        MAX(time) AS end,
+        AVG(mean_daily_returns) AS mean_daily_returns,
+        AVG(mean_daily_returns) * {TRADING_DAYS} AS annualized_return,
+        SQRT(
+            (SUM(mean_daily_returns * mean_daily_returns)
+             - SUM(mean_daily_returns) * SUM(mean_daily_returns) / COUNT(mean_daily_returns))
+            / (COUNT(mean_daily_returns) - 1)
+        ) * {math.sqrt(TRADING_DAYS)} AS annualized_volatility,
+        CASE
+            WHEN MIN(1 + mean_daily_returns) <= 0 THEN -1.0
+            ELSE EXP(SUM(LN(1 + mean_daily_returns))) - 1
+        END AS cumulative_return
+    FROM portfolio
+    """
+    summary = etf_data.read_query(query, params=params, database_path=database_path, index_col=None).iloc[0]
+    summary['start'] = pd.Timestamp(summary['start'])
+    summary['end'] = pd.Timestamp(summary['end'])
+    return summary
@@ -0,0 +1,213 @@
+"""Optional long-format price store for etf.db.
+
+The seed database keeps one table per ticker (``GDOT``, ``GS``, ...), so the
+portfolio needs an N-way join and the single-ticker screens scan a whole table.
+This module adds a consolidated layout::
+
+    prices(symbol, time, open, high, low, close, volume, daily_returns)
+
+stored ``WITHOUT ROWID`` with a ``(symbol, time)`` primary key, plus indexes on
+``(symbol, close)`` and ``(symbol, daily_returns)``.  In a WITHOUT ROWID table
+every secondary index also carries the primary key, so those indexes cover the
+"close above a threshold" and "top N daily returns" screens: both become index
+range scans.  The portfolio is assembled with one ordered read and a pivot
+instead of N joins.
+
+Migrate an existing database (the per-ticker tables are kept unless
+``--drop-tables`` is given)::
+
+    python etf_store.py --database etf.db
+
+The functions below work with either layout; the long layout is used as soon
+as the ``prices`` table exists.
+"""
+
+import argparse
+
+import pandas as pd
+
+import etf_data
+
+
+# Name of the consolidated long-format table
+PRICES_TABLE = 'prices'
+
+PRICES_SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {PRICES_TABLE} (
+        symbol TEXT NOT NULL,
+        time TIMESTAMP NOT NULL,
+        open FLOAT,
+        high FLOAT,
+        low FLOAT,
+        close FLOAT,
+        volume BIGINT,
+        daily_returns FLOAT,
+        PRIMARY KEY (symbol, time)
+    ) WITHOUT ROWID
+    """,
+    f'CREATE INDEX IF NOT EXISTS ix_{PRICES_TABLE}_close ON {PRICES_TABLE} (symbol, close)',
+    f'CREATE INDEX IF NOT EXISTS ix_{PRICES_TABLE}_daily_returns ON {PRICES_TABLE} (symbol, daily_returns)',
+]
+
+
+def layout(database_path=etf_data.DATABASE_PATH):
+    """Return 'long' when the consolidated prices table exists, otherwise 'wide'."""
+    tables = etf_data.table_names(database_path)
+    return 'long' if PRICES_TABLE in tables else 'wide'
+
+
+def long_symbols(database_path=etf_data.DATABASE_PATH):
+    """Return the distinct symbols stored in the prices table."""
+    query = f'SELECT DISTINCT symbol FROM {PRICES_TABLE} ORDER BY symbol'
+    with etf_data.read_connection(database_path) as connection:
+        return [row[0] for row in connection.execute(query)]
+
+
+def create_schema(connection):
+    import sqlalchemy
+
+    for statement in PRICES_SCHEMA:
+        connection.execute(sqlalchemy.text(statement))
+
+
+def migrate(database_path=etf_data.DATABASE_PATH, symbols=None, drop_tables=False):
+    """Copy the per-ticker tables into the prices table in a single transaction.
+
+    Re-running the migration replaces rows already present.  Returns the
+    number of rows per symbol.
+    """
+    # Only the write paths need SQLAlchemy; reads go through etf_data.read_connection
+    import sqlalchemy
+
+    if symbols is None:
+        symbols = etf_data.wide_ticker_names(database_path)
+    columns = ', '.join(['time'] + etf_data.PRICE_COLUMNS)
+    counts = {}
+    with etf_data.get_engine(database_path).begin() as connection:
+        create_schema(connection)
+        for symbol in symbols:
+            table = etf_data.quote_identifier(symbol)
+            result = connection.execute(
+                sqlalchemy.text(
+                    f'INSERT OR REPLACE INTO {PRICES_TABLE} (symbol, {columns}) '
+                    f'SELECT :symbol, {columns} FROM {table}'
+                ),
+                {'symbol': symbol.upper()},
+            )
+            counts[symbol.upper()] = result.rowcount
+            if drop_tables:
+                connection.execute(sqlalchemy.text(f'DROP TABLE {table}'))
+        # Give the query planner statistics for the new indexes
+        connection.execute(sqlalchemy.text(f'ANALYZE {PRICES_TABLE}'))
+    etf_data.invalidate()
+    return counts
+
+
+def asset_query(symbol, columns, start=None, end=None, database_path=etf_data.DATABASE_PATH, after=None):
+    """Return the query (and parameters) reading one ticker in the database's layout.
+
+    ``start``/``end`` are inclusive bounds on 'time', ``after`` an exclusive one.
+    """
+    projection = ', '.join(['time'] + [etf_data.quote_identifier(column) for column in columns])
+    params = {'symbol': symbol.upper(), 'start': start, 'end': end, 'after': after}
+    if layout(database_path) == 'long':
+        query = f'SELECT {projection} FROM {PRICES_TABLE}'
+        conditions = ['symbol = :symbol']
+    else:
+        query = f'SELECT {projection} FROM {etf_data.quote_identifier(symbol)}'
+        conditions = []
+    if start is not None:
+        conditions.append('time >= :start')
+    if end is not None:
+        conditions.append('time <= :end')
+    if after is not None:
+        conditions.append('time > :after')
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    return query + ' ORDER BY time', params
+
+
+def closing_prices_above(symbol, threshold, database_path=etf_data.DATABASE_PATH):
+    """Return the 'time' and 'close' rows where ``symbol`` closed above ``threshold``."""
+    if layout(database_path) == 'long':
+        # Range scan of ix_prices_close: symbol = ? AND close > ?
+        # (no ORDER BY time, which would make SQLite walk the primary key instead)
+        query = f"""
+        SELECT time, close FROM {PRICES_TABLE}
+        WHERE symbol = :symbol AND close > :threshold
+        """
+    else:
+        query = f"""
+        SELECT time, close FROM {etf_data.quote_identifier(symbol)}
+        WHERE close > :threshold
+        """
+    params = {'symbol': symbol.upper(), 'threshold': threshold}
+    return etf_data.read_query(query, params=params, database_path=database_path).sort_index()
+
+
+def top_daily_returns(symbol, n=10, database_path=etf_data.DATABASE_PATH):
+    """Return the ``n`` largest daily returns of ``symbol``, in descending order."""
+    if layout(database_path) == 'long':
+        # Reverse scan of ix_prices_daily_returns for one symbol, stopping after n rows
+        query = f"""
+        SELECT time, daily_returns FROM {PRICES_TABLE}
+        WHERE symbol = :symbol
+        ORDER BY daily_returns DESC
+        LIMIT :n
+        """
+    else:
+        query = f"""
+        SELECT time, daily_returns FROM {etf_data.quote_identifier(symbol)}
+        ORDER BY daily_returns DESC
+        LIMIT :n
+        """
+    params = {'symbol': symbol.upper(), 'n': int(n)}
+    return etf_data.read_query(query, params=params, database_path=database_path)
+
+
+def pivot_prices(symbols, fields=None, how='inner', database_path=etf_data.DATABASE_PATH):
+    """Build the (symbol, field) portfolio frame from the prices table with a single pivot.
+
+    ``how='inner'`` keeps only the times present for every symbol, ``'outer'``
+    keeps all of them.
+    """
+    if how not in ('inner', 'outer'):
+        raise ValueError(f"Pivot supports 'inner' or 'outer', not {how!r}")
+    symbols = [symbol.upper() for symbol in symbols]
+    fields = list(etf_data.PRICE_COLUMNS if fields is None else fields)
+    projection = ', '.join(['symbol', 'time'] + [etf_data.quote_identifier(field) for field in fields])
+    placeholders = ', '.join(f':symbol_{i}' for i in range(len(symbols)))
+    query = f"""
+    SELECT {projection} FROM {PRICES_TABLE}
+    WHERE symbol IN ({placeholders})
+    ORDER BY symbol, time
+    """
+    params = {f'symbol_{i}': symbol for i, symbol in enumerate(symbols)}
+    prices = etf_data.read_query(query, params=params, database_path=database_path, index_col=None, copy=False)
+
+    portfolio = prices.pivot(index='time', columns='symbol', values=fields)
+    # pivot() yields (field, symbol) columns; reorder to (symbol, field) in the requested order
+    portfolio.columns = portfolio.columns.swaplevel()
+    portfolio = portfolio.reindex(columns=pd.MultiIndex.from_product([symbols, fields]))
+    if how == 'inner':
+        counts = prices['time'].value_counts()
+        portfolio = portfolio.loc[portfolio.index.isin(counts.index[counts == len(symbols)])]
+        # No gaps remain, so restore the column types the pivot widened (e.g. volume back to int64)
+        portfolio = portfolio.astype({(symbol, field): prices[field].dtype for symbol in symbols for field in fields})
+    portfolio.columns.names = [None, None]
+    portfolio.index.name = 'time'
+    return portfolio
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate etf.db to the consolidated long-format prices table.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--drop-tables', action='store_true', help='drop the per-ticker tables after copying them')
+    args = parser.parse_args(argv)
+    for symbol, count in migrate(args.database, drop_tables=args.drop_tables).items():
+        print(f'{symbol}: {count} rows')
+
+
+if __name__ == '__main__':
+    main()
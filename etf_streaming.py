@@ -0,0 +1,274 @@
+"""Out-of-core portfolio analytics over ticker histories larger than memory.
+
+The notebook reads whole tables before computing returns, so its memory grows
+with the length of the history.  The functions here process the data as a
+stream of chunks instead:
+
+* ``iter_asset_chunks`` reads one ticker ordered by 'time', ``chunksize`` rows
+  at a time, from a SQLite cursor (rows are stepped out of the database as
+  they are fetched, nothing is materialized up front)
+* ``merge_chunks`` merges the per-ticker streams into aligned portfolio rows:
+  a k-way merge by time done a chunk at a time - every row up to the smallest
+  "last time buffered" across the streams can no longer gain a partner, so it
+  is aligned and emitted, and the stream that set that bound is refilled
+* ``RunningStats`` carries the running state across chunks: the growth factor
+  for the cumulative product, the sums for the mean and the annualized return,
+  and the running peak for the maximum drawdown
+
+Peak memory is bounded by about ``chunksize`` rows per ticker, whatever the
+length of the history.  All the streams of a merge share one pooled read-only
+connection (SQLite runs several statements on one connection), so any number
+of tickers can be merged.
+
+    python etf_streaming.py --chunksize 100000 --output cumulative_returns.csv
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_profiling
+import etf_store
+
+
+# Rows read per ticker and per chunk
+CHUNK_SIZE = 50_000
+
+# Number of trading days used to annualize daily figures (as in etf_pipeline)
+TRADING_DAYS = 252
+
+
+def iter_asset_chunks(symbol, columns=None, chunksize=CHUNK_SIZE, start=None, end=None, connection=None,
+                      database_path=etf_data.DATABASE_PATH):
+    """Yield one ticker as DataFrames of at most ``chunksize`` rows, indexed by 'time' in order.
+
+    ``connection`` is a ``sqlite3`` connection to read from; by default one is
+    borrowed from the pool until the generator is exhausted or closed.
+    """
+    columns = list(etf_data.PRICE_COLUMNS if columns is None else columns)
+    start = None if start is None else etf_data.format_time(start)
+    end = None if end is None else etf_data.format_time(end)
+    query, params = etf_store.asset_query(symbol, columns, start, end, database_path)
+    if connection is None:
+        with etf_data.read_connection(database_path) as borrowed:
+            yield from iter_asset_chunks(symbol, columns, chunksize, start, end, borrowed, database_path)
+        return
+
+    cursor = connection.execute(query, params)
+    try:
+        while True:
+            with etf_profiling.stage('stream.fetch', symbol=symbol) as stage:
+                rows = cursor.fetchmany(chunksize)
+                stage.set(rows=len(rows))
+            if not rows:
+                return
+            chunk = pd.DataFrame.from_records(rows, columns=['time'] + columns, coerce_float=True)
+            chunk['time'] = pd.to_datetime(chunk['time'])
+            yield chunk.set_index('time')
+    finally:
+        cursor.close()
+
+
+def merge_chunks(streams, how='inner'):
+    """Merge ordered per-ticker chunk streams into aligned frames with (symbol, field) columns.
+
+    ``streams`` maps each symbol to an iterator of time-indexed chunks (as from
+    ``iter_asset_chunks``).  ``how`` is 'inner' (only times present for every
+    ticker, as the notebook's portfolio join) or 'outer' (every time, gaps as NaN).
+    """
+    if how not in ('inner', 'outer'):
+        raise ValueError(f"Streams can be merged 'inner' or 'outer', not {how!r}")
+    symbols = list(streams)
+    iterators = {symbol: iter(stream) for symbol, stream in streams.items()}
+    buffers = {symbol: None for symbol in symbols}
+    exhausted = set()
+
+    while True:
+        for symbol in symbols:
+            # Refill the empty buffers (skipping empty chunks)
+            while symbol not in exhausted and (buffers[symbol] is None or buffers[symbol].empty):
+                chunk = next(iterators[symbol], None)
+                if chunk is None:
+                    exhausted.add(symbol)
+                else:
+                    buffers[symbol] = chunk
+        pending = [symbol for symbol in symbols if buffers[symbol] is not None and not buffers[symbol].empty]
+        if not pending or (how == 'inner' and len(pending) < len(symbols)):
+            # Nothing left, or a ticker ran out so no later time can be in every table
+            return
+
+        # Every buffered row up to the smallest last time of the live streams is final
+        live = [buffers[symbol].index[-1] for symbol in symbols if symbol not in exhausted]
+        frontier = min(live) if live else None
+        parts = {}
+        for symbol in symbols:
+            buffer = buffers[symbol]
+            if buffer is None:
+                continue
+            cut = len(buffer) if frontier is None else buffer.index.searchsorted(frontier, side='right')
+            # Emptied buffers still take part, so the outer join keeps their columns
+            parts[symbol] = buffer.iloc[:cut]
+            buffers[symbol] = buffer.iloc[cut:]
+
+        with etf_profiling.stage('stream.merge'):
+            aligned = pd.concat(parts, axis=1, join=how).sort_index()
+        if not aligned.empty:
+            yield aligned
+
+
+def stream_portfolio(symbols=None, fields=None, how='inner', chunksize=CHUNK_SIZE, start=None, end=None,
+                     database_path=etf_data.DATABASE_PATH):
+    """Yield the portfolio join of ``symbols`` as aligned (symbol, field) chunks, like ``etf_join.join_assets``."""
+    if symbols is None:
+        symbols = etf_data.ticker_names(database_path)
+    symbols = [symbol.upper() for symbol in symbols]
+    with etf_data.read_connection(database_path) as connection:
+        streams = {
+            symbol: iter_asset_chunks(symbol, fields, chunksize, start, end, connection, database_path)
+            for symbol in symbols
+        }
+        try:
+            yield from merge_chunks(streams, how)
+        finally:
+            for stream in streams.values():
+                stream.close()
+
+
+def stream_portfolio_returns(symbols=None, how='inner', chunksize=CHUNK_SIZE, start=None, end=None,
+                             database_path=etf_data.DATABASE_PATH):
+    """Yield the daily returns of the tickers plus ('ETF', 'mean_daily_returns'), chunk by chunk.
+
+    The streamed equivalent of ``etf_pipeline.portfolio_returns``.
+    """
+    for chunk in stream_portfolio(symbols, ['daily_returns'], how, chunksize, start, end, database_path):
+        chunk[('ETF', 'mean_daily_returns')] = chunk.mean(axis=1)
+        yield chunk
+
+
+class RunningStats:
+    """Running return statistics of several series, updated one chunk at a time.
+
+    ``update`` takes a frame of daily returns (one column per series) and
+    returns the cumulative returns and drawdowns of that chunk, continuing
+    from the chunks before it; ``summary`` gives the figures so far.  Missing
+    returns leave the state unchanged.
+    """
+
+    def __init__(self, names=None):
+        self.names = None if names is None else list(names)
+        self.count = None
+        self.total = None
+        self.log_growth = None
+        self.peak = None
+        self.max_drawdown = None
+        self.first = None
+        self.last = None
+
+    def _start(self, names):
+        self.names = list(names)
+        size = len(self.names)
+        self.count = np.zeros(size, dtype=np.int64)
+        self.total = np.zeros(size)
+        # Growth is carried as a log so that long histories do not overflow or underflow
+        self.log_growth = np.zeros(size)
+        self.peak = np.zeros(size)
+        self.max_drawdown = np.zeros(size)
+
+    def update(self, returns):
+        """Add a chunk of daily returns; return its ('cum_returns', 'drawdown') columns per series."""
+        if isinstance(returns, pd.Series):
+            returns = returns.to_frame()
+        if self.count is None:
+            self._start(self.names or returns.columns)
+        values = returns[self.names].to_numpy(dtype=float)
+        missing = np.isnan(values)
+
+        self.count += (~missing).sum(axis=0)
+        self.total += np.where(missing, 0.0, values).sum(axis=0)
+
+        log_growth = self.log_growth + np.cumsum(np.where(missing, 0.0, np.log1p(values)), axis=0)
+        peak = np.maximum(self.peak, np.maximum.accumulate(log_growth, axis=0))
+        drawdown = np.expm1(log_growth - peak)
+        if len(values):
+            self.log_growth = log_growth[-1]
+            self.peak = peak[-1]
+            self.max_drawdown = np.minimum(self.max_drawdown, drawdown.min(axis=0))
+            self.first = returns.index[0] if self.first is None else self.first
+            self.last = returns.index[-1]
+
+        cumulative = np.expm1(log_growth)
+        cumulative[missing] = np.nan
+        return pd.concat(
+            {
+                'cum_returns': pd.DataFrame(cumulative, index=returns.index, columns=returns[self.names].columns),
+                'drawdown': pd.DataFrame(drawdown, index=returns.index, columns=returns[self.names].columns),
+            },
+            axis=1,
+        )
+
+    def summary(self):
+        """Return the observations, mean and annualized return, cumulative return and max drawdown per series."""
+        if self.count is None:
+            return pd.DataFrame()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.total / self.count
+        return pd.DataFrame(
+            {
+                'observations': self.count,
+                'mean_daily_returns': mean,
+                'annualized_returns': mean * TRADING_DAYS,
+                'cum_returns': np.expm1(self.log_growth),
+                'max_drawdown': self.max_drawdown,
+            },
+            index=pd.Index(self.names),
+        )
+
+
+def portfolio_summary(symbols=None, how='inner', chunksize=CHUNK_SIZE, start=None, end=None, on_chunk=None,
+                      database_path=etf_data.DATABASE_PATH):
+    """Return the ``RunningStats`` summary of every ticker and the equal-weight portfolio, in one streaming pass.
+
+    ``on_chunk(returns, running)`` is called with each chunk of daily returns
+    and its cumulative returns and drawdowns, e.g. to write them out as they
+    are produced.
+    """
+    stats = RunningStats()
+    for returns in stream_portfolio_returns(symbols, how, chunksize, start, end, database_path):
+        running = stats.update(returns)
+        if on_chunk is not None:
+            on_chunk(returns, running)
+    summary = stats.summary()
+    if not summary.empty:
+        # One row per ticker plus 'ETF' for the portfolio
+        summary.index = [symbol for symbol, _ in stats.names]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Portfolio returns of etf.db computed in a single streaming pass.')
+    parser.add_argument('--database', default=etf_data.DATABASE_PATH, help='path to the SQLite database')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help='rows read per ticker at a time')
+    parser.add_argument('--how', choices=('inner', 'outer'), default='inner', help='alignment of the tickers')
+    parser.add_argument('--output', help='CSV file receiving the daily and cumulative returns as they are computed')
+    args = parser.parse_args(argv)
+
+    written = {'header': True}
+
+    def write(returns, running):
+        frame = pd.concat([returns, running['cum_returns'].rename(columns=lambda field: 'cum_returns', level=1)],
+                          axis=1)
+        frame.columns = ['.'.join(column) for column in frame.columns]
+        frame.to_csv(args.output, mode='w' if written['header'] else 'a', header=written['header'])
+        written['header'] = False
+
+    summary = portfolio_summary(how=args.how, chunksize=args.chunksize, database_path=args.database,
+                                on_chunk=write if args.output else None)
+    print(summary)
+    if args.output:
+        print(f'Daily and cumulative returns written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Synthetic etf.db-compatible databases at any size.
+
+``generate_database`` writes N random-walk tickers of M bars with the schema
+of etf.db (one table per ticker with ``time, open, high, low, close, volume,
+daily_returns`` and an ``ix_<T>_time`` index), so the analyzer, the benchmarks
+and the tools in this repository can be run against realistic volumes:
+
+* ``gap_rate``       - fraction of bars dropped at random from each ticker
+  (missing sessions, halts), so tickers do not share every timestamp
+* ``listing_spread`` - each ticker lists and delists at random points within
+  this fraction of the time axis, so the histories start and end on
+  different dates
+* ``jitter``         - a per-ticker clock offset below this duration, so the
+  timestamps of different tickers do not line up exactly (exercises the as-of
+  join)
+
+``daily_returns`` is the change from the previous bar present in the table.
+As in etf.db, where no row is NULL, the first bar of each ticker carries the
+change from the close before it (the walk starts at 100 before the first
+generated bar)::
+
+    python etf_synthetic.py synthetic.db --tickers 100 --bars 100000 --freq min --gap-rate 0.01
+"""
+
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+
+
+def ticker_symbols(n_tickers):
+    """Return the symbols used for ``n_tickers`` synthetic tickers."""
+    return [f'T{i:04d}' for i in range(n_tickers)]
+
+
+def generate_frame(n_bars, freq='B', start='2000-01-03', gap_rate=0.0, listing_spread=0.0, jitter=None, rng=None):
+    """Return one synthetic ticker as a DataFrame indexed by 'time' with the etf.db columns."""
+    rng = np.random.default_rng() if rng is None else rng
+    times = pd.date_range(start, periods=n_bars, freq=freq, name='time')
+    returns = rng.normal(0.0005, 0.02, n_bars)
+    close = 100 * np.cumprod(1 + returns)
+
+    keep = np.ones(n_bars, dtype=bool)
+    if listing_spread:
+        span = int(n_bars * listing_spread)
+        keep[:rng.integers(0, span + 1)] = False
+        keep[n_bars - rng.integers(0, span + 1):] = False
+    if gap_rate:
+        keep &= rng.random(n_bars) >= gap_rate
+    if jitter is not None:
+        offset = int(rng.integers(0, max(pd.Timedelta(jitter).value, 1)))
+        times = times + pd.Timedelta(offset, unit='ns').floor('s')
+
+    frame = pd.DataFrame(
+        {
+            'open': close * (1 + rng.normal(0, 0.003, n_bars)),
+            'high': close * 1.01,
+            'low': close * 0.99,
+            'close': close,
+            'volume': rng.integers(1_000, 1_000_000, n_bars),
+        },
+        index=times,
+    )[keep]
+    # Returns between the bars that remain; the first one is from the close of the bar before it
+    frame['daily_returns'] = frame['close'] / frame['close'].shift() - 1
+    if len(frame):
+        frame.iloc[0, frame.columns.get_loc('daily_returns')] = returns[keep.argmax()]
+    return frame
+
+
+def write_ticker(connection, symbol, frame):
+    """Create the table of one ticker (with its 'time' index) and insert ``frame``."""
+    table = etf_data.quote_identifier(symbol)
+    connection.execute(
+        f'CREATE TABLE {table} (time TIMESTAMP, open FLOAT, high FLOAT, low FLOAT, '
+        f'close FLOAT, volume BIGINT, daily_returns FLOAT)'
+    )
+    connection.execute(f'CREATE INDEX {etf_data.quote_identifier(f"ix_{symbol}_time")} ON {table} (time)')
+    returns = frame['daily_returns'].astype(object).where(frame['daily_returns'].notna(), None)
+    connection.executemany(
+        f'INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)',
+        zip(
+            frame.index.strftime(etf_data.TIME_FORMAT),
+            frame['open'].tolist(),
+            frame['high'].tolist(),
+            frame['low'].tolist(),
+            frame['close'].tolist(),
+            frame['volume'].tolist(),
+            returns.tolist(),
+        ),
+    )
+
+
+def generate_database(path, n_tickers, n_bars, freq='B', start='2000-01-03', gap_rate=0.0, listing_spread=0.0,
+                      jitter=None, seed=0):
+    """Write an etf.db-compatible database of ``n_tickers`` x ``n_bars`` synthetic bars to ``path``.
+
+    An existing file at ``path`` is replaced.  Returns ``path``.
+    """
+    rng = np.random.default_rng(seed)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        with connection:
+            for symbol in ticker_symbols(n_tickers):
+                frame = generate_frame(n_bars, freq, start, gap_rate, listing_spread, jitter, rng)
+                write_ticker(connection, symbol, frame)
+    finally:
+        connection.close()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic etf.db-compatible database.')
+    parser.add_argument('path', help='database file to write (replaced if it exists)')
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--bars', type=int, default=1_000, help='bars per ticker before gaps')
+    parser.add_argument('--freq', default='B', help="bar interval, e.g. 'B' (business days) or 'min'")
+    parser.add_argument('--start', default='2000-01-03', help='time of the first bar')
+    parser.add_argument('--gap-rate', type=float, default=0.0, help='fraction of bars dropped at random')
+    parser.add_argument('--listing-spread', type=float, default=0.0,
+                        help='fraction of the axis over which listing and delisting dates vary')
+    parser.add_argument('--jitter', help="per-ticker clock offset below this duration, e.g. '30s'")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    generate_database(args.path, args.tickers, args.bars, args.freq, args.start, args.gap_rate,
+                      args.listing_spread, args.jitter, args.seed)
+    print(f'Wrote {args.tickers} tickers x {args.bars} bars to {args.path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+"""Make the analyzer modules importable when the tests are run from the repository root::
+
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
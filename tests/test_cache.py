@@ -0,0 +1,17 @@
+import pytest
+
+import etf_cache
+import etf_synthetic
+
+
+def test_a_failed_compute_releases_its_key_lock(tmp_path):
+    cache = etf_cache.AnalyticsCache(directory=None)
+    database_path = etf_synthetic.generate_database(str(tmp_path / 'etf.db'), 1, 5)
+
+    def fail():
+        raise RuntimeError('compute failed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_compute('result', fail, database_path=database_path)
+    assert cache._key_locks == {}
+    assert cache.get_or_compute('result', lambda: 42, database_path=database_path) == 42
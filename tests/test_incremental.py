@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+
+import etf_data
+import etf_incremental
+import etf_ingest
+import etf_synthetic
+
+
+def _cumulative(symbol, database_path):
+    returns = etf_data.load_asset(symbol, ['daily_returns'], database_path=database_path)['daily_returns']
+    return (1 + returns).cumprod() - 1
+
+
+def test_reading_returns_writes_nothing(tmp_path):
+    database_path = etf_synthetic.generate_database(str(tmp_path / 'etf.db'), 2, 50)
+    returns = etf_incremental.asset_returns('T0000', database_path=database_path)
+    assert not os.path.exists(etf_incremental.checkpoint_path(database_path))
+    np.testing.assert_allclose(returns['cum_returns'], _cumulative('T0000', database_path))
+
+
+def test_reading_returns_compounds_the_bars_after_the_checkpoint(tmp_path):
+    database_path = etf_synthetic.generate_database(str(tmp_path / 'etf.db'), 2, 50)
+    etf_incremental.update_all(database_path)
+    last = etf_data.load_asset('T0000', ['close'], database_path=database_path).index[-1]
+    etf_ingest.ingest([{'symbol': 'T0000', 'time': etf_data.format_time(last + np.timedelta64(1, 'D')),
+                        'open': 1, 'high': 1, 'low': 1, 'close': 1, 'volume': 1}], database_path)
+
+    returns = etf_incremental.asset_returns('T0000', database_path=database_path)
+    expected = _cumulative('T0000', database_path)
+    assert returns.index.equals(expected.index)
+    np.testing.assert_allclose(returns['cum_returns'], expected)
+    # The checkpoint was left where the update put it
+    assert etf_incremental.checkpoint('T0000', database_path)['time'] == etf_data.format_time(last)
@@ -0,0 +1,54 @@
+import threading
+
+import numpy as np
+import pytest
+
+import etf_kernels
+
+BACKENDS = ['numpy'] + (['numba'] if etf_kernels.backend() == 'numba' else [])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_path_metrics_count_a_loss_on_the_first_day(backend):
+    metrics = etf_kernels.path_metrics(np.array([-0.5, 0.1]), backend=backend)
+    np.testing.assert_allclose(metrics['drawdown'], [-0.5, -0.45])
+    np.testing.assert_allclose(metrics['max_drawdown'], [-0.5, -0.5])
+    np.testing.assert_array_equal(metrics['duration'], [1, 2])
+    np.testing.assert_array_equal(metrics['max_duration'], [1, 2])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_path_metrics_of_a_rising_path(backend):
+    metrics = etf_kernels.path_metrics(np.full(5, 0.01), backend=backend)
+    np.testing.assert_allclose(metrics['max_drawdown'], 0.0)
+    np.testing.assert_array_equal(metrics['max_duration'], 0)
+
+
+@pytest.mark.skipif('numba' not in BACKENDS, reason='Numba is not installed')
+def test_numba_matches_numpy():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0, 0.03, (300, 6))
+    returns[rng.random(returns.shape) < 0.02] = np.nan
+    expected = etf_kernels.path_metrics(returns, backend='numpy')
+    result = etf_kernels.path_metrics(returns, backend='numba')
+    for name in etf_kernels.PATH_METRICS:
+        np.testing.assert_allclose(result[name], expected[name], rtol=1e-12)
+
+
+@pytest.mark.skipif('numba' not in BACKENDS, reason='Numba is not installed')
+def test_kernels_compile_once_across_threads():
+    returns = np.random.default_rng(1).normal(0.0, 0.02, (100, 4))
+    expected = etf_kernels.cumulative_returns(returns, backend='numpy')
+    etf_kernels._compiled.clear()
+    results = [None] * 8
+
+    def run(slot):
+        results[slot] = etf_kernels.cumulative_returns(returns, backend='numba')
+
+    threads = [threading.Thread(target=run, args=(slot,)) for slot in range(len(results))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for result in results:
+        np.testing.assert_allclose(result, expected, rtol=1e-12)
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+import etf_montecarlo
+
+RETURNS = np.random.default_rng(0).normal(0.0005, 0.02, (500, 3))
+
+
+def test_the_result_does_not_depend_on_the_number_of_workers():
+    options = dict(n_paths=3000, n_days=100, seed=7, chunk_paths=256)
+    serial = etf_montecarlo.simulate(RETURNS, workers=1, **options)
+    parallel = etf_montecarlo.simulate(RETURNS, workers=3, **options)
+    pd.testing.assert_frame_equal(serial['bands'], parallel['bands'], check_exact=True)
+    pd.testing.assert_frame_equal(serial['risk'], parallel['risk'], check_exact=True)
+    pd.testing.assert_series_equal(serial['final'], parallel['final'], check_exact=True)
+
+
+def test_the_last_band_matches_the_percentiles_of_the_final_returns():
+    n_days = 250
+    # With blocks of one day the binned range is the drift plus or minus BIN_RANGE deviations of log(1 + r)
+    result = etf_montecarlo.simulate(RETURNS, n_paths=5000, n_days=n_days, block_size=1, workers=1)
+    log_daily = np.log1p(RETURNS.mean(axis=1))
+    width = 2 * etf_montecarlo.BIN_RANGE * np.sqrt(log_daily.var() * n_days) / etf_montecarlo.BINS
+
+    band = result['bands'].iloc[-1]
+    assert band.name == n_days
+    np.testing.assert_allclose(np.log1p(band), np.log1p(result['final'][band.index]), rtol=0, atol=width)
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+
+import etf_portfolio_engine
+
+
+def test_wiped_out_asset_is_bought_back_at_the_next_rebalance():
+    index = pd.bdate_range('2020-01-01', periods=60)
+    returns = np.full((60, 2), 0.01)
+    returns[5, 0] = -1.0
+    weights = np.array([0.5, 0.5])
+    for rebalance in ('monthly', 'never'):
+        values = etf_portfolio_engine.portfolio_values(returns, weights, rebalance, index=index)
+        points = etf_portfolio_engine.rebalance_points(index, rebalance)
+        expected = etf_portfolio_engine.loop_values(returns, weights, points)
+        assert np.isfinite(values).all()
+        np.testing.assert_allclose(values, expected, rtol=1e-12)
+
+
+def test_returns_below_minus_one_are_floored():
+    index = pd.bdate_range('2020-01-01', periods=70)
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0, 0.02, (70, 3))
+    returns[[3, 40], [1, 2]] = -1.5
+    weights = np.array([0.3, 0.3, 0.3])
+    values = etf_portfolio_engine.portfolio_values(returns, weights, 'monthly', index=index)
+    points = etf_portfolio_engine.rebalance_points(index, 'monthly')
+    expected = etf_portfolio_engine.loop_values(returns, weights, points)
+    np.testing.assert_allclose(values, expected, rtol=1e-12)
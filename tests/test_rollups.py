@@ -0,0 +1,86 @@
+import shutil
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import etf_data
+import etf_rollups
+import etf_synthetic
+
+N_TICKERS = 3
+N_BARS = 300
+APPENDED = 12
+
+
+@pytest.fixture
+def databases(tmp_path):
+    # The full history, and a copy without the last APPENDED bars of each ticker
+    full = etf_synthetic.generate_database(str(tmp_path / 'full.db'), N_TICKERS, N_BARS, gap_rate=0.05)
+    truncated = str(tmp_path / 'truncated.db')
+    shutil.copy(full, truncated)
+    connection = sqlite3.connect(truncated)
+    with connection:
+        for symbol in etf_synthetic.ticker_symbols(N_TICKERS):
+            connection.execute(
+                f'DELETE FROM {symbol} WHERE time IN (SELECT time FROM {symbol} ORDER BY time DESC LIMIT ?)',
+                (APPENDED,),
+            )
+    connection.close()
+    return full, truncated
+
+
+def _append_rest(full, truncated):
+    connection = sqlite3.connect(truncated)
+    connection.execute('ATTACH DATABASE ? AS full', (full,))
+    with connection:
+        for symbol in etf_synthetic.ticker_symbols(N_TICKERS):
+            connection.execute(
+                f'INSERT INTO main.{symbol} SELECT * FROM full.{symbol} '
+                f'WHERE time > (SELECT MAX(time) FROM main.{symbol})'
+            )
+    connection.close()
+
+
+def _assert_same_rollups(database_path, expected_path):
+    for series in etf_synthetic.ticker_symbols(N_TICKERS) + [etf_rollups.PORTFOLIO_SERIES]:
+        for resolution in etf_rollups.RESOLUTIONS:
+            pd.testing.assert_frame_equal(
+                etf_rollups.read_rollup(series, resolution, database_path=database_path),
+                etf_rollups.read_rollup(series, resolution, database_path=expected_path),
+                rtol=1e-9,
+            )
+
+
+def test_updated_rollups_match_a_full_build(databases):
+    full, truncated = databases
+    etf_rollups.update_all(truncated)
+    _append_rest(full, truncated)
+    counts = etf_rollups.update_all(truncated)
+    assert all(count == APPENDED for series, count in counts.items() if series != etf_rollups.PORTFOLIO_SERIES)
+
+    etf_rollups.update_all(full)
+    _assert_same_rollups(truncated, full)
+
+
+def test_portfolio_rollups_are_rebuilt_when_the_members_change(databases):
+    full, _ = databases
+    symbols = etf_synthetic.ticker_symbols(N_TICKERS)
+    etf_rollups.update_portfolio(symbols[:2], database_path=full)
+    etf_rollups.update_all(full)
+
+    expected = etf_rollups.read_rollup(etf_rollups.PORTFOLIO_SERIES, 'week', database_path=full)
+    etf_rollups.rebuild(etf_rollups.PORTFOLIO_SERIES, full)
+    etf_rollups.update_portfolio(symbols, database_path=full)
+    etf_data.invalidate()
+    pd.testing.assert_frame_equal(
+        etf_rollups.read_rollup(etf_rollups.PORTFOLIO_SERIES, 'week', database_path=full), expected, rtol=1e-9
+    )
+
+
+def test_plan_falls_back_to_the_raw_rows(databases):
+    full, _ = databases
+    assert etf_rollups.plan('T0000', width=10, database_path=full) == etf_rollups.RAW
+    etf_rollups.update_all(full)
+    assert etf_rollups.plan('T0000', width=10, database_path=full) == 'month'
+    assert etf_rollups.plan('T0000', width=N_BARS + 1, database_path=full) == etf_rollups.RAW
@@ -0,0 +1,12 @@
+import numpy as np
+
+import etf_scenarios
+
+
+def test_max_drawdowns_count_a_loss_on_the_first_day():
+    returns = np.array([[-0.5, 0.1], [0.1, -0.5]])
+    np.testing.assert_allclose(etf_scenarios.max_drawdowns(returns), [-0.5, -0.5])
+
+
+def test_max_drawdowns_of_a_rising_path_are_zero():
+    np.testing.assert_allclose(etf_scenarios.max_drawdowns(np.full((10, 1), 0.01)), [0.0])
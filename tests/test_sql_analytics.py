@@ -0,0 +1,36 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import etf_data
+import etf_sql_analytics
+import etf_synthetic
+
+RETURNS = pd.DataFrame(
+    {'A': [0.1, -1.0, 0.2, 0.05], 'B': [0.05, -1.0, 0.1, -0.02]},
+    index=pd.bdate_range('2020-01-01', periods=4),
+)
+
+
+def test_fallback_ln_matches_the_builtin():
+    connection = sqlite3.connect(':memory:')
+    for value in (2.0, 1.0, 0.5, 0.0, -1.0, None):
+        assert etf_data._ln(value) == connection.execute('SELECT LN(?)', (value,)).fetchone()[0]
+
+
+def test_cumulative_return_stays_at_minus_one_after_a_wipe_out(tmp_path):
+    database_path = str(tmp_path / 'etf.db')
+    connection = sqlite3.connect(database_path)
+    with connection:
+        for symbol, returns in RETURNS.items():
+            close = 100 * (1 + returns).cumprod()
+            frame = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close,
+                                  'volume': 1000, 'daily_returns': returns}, index=RETURNS.index)
+            etf_synthetic.write_ticker(connection, symbol, frame)
+    connection.close()
+
+    returns = etf_sql_analytics.portfolio_returns_sql(database_path=database_path)
+    np.testing.assert_allclose(returns['cum_returns'], [0.075, -1.0, -1.0, -1.0])
+    summary = etf_sql_analytics.portfolio_summary_sql(database_path=database_path)
+    assert summary['cumulative_return'] == -1.0
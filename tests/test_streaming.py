@@ -0,0 +1,42 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import etf_kernels
+import etf_streaming
+import etf_synthetic
+
+# The first return is the worst drawdown of each series: it only counts from the initial value
+RETURNS = pd.DataFrame(
+    {'A': [-0.3, 0.1, 0.05, -0.1, 0.2, -0.05], 'B': [-0.2, -0.05, 0.3, 0.02, -0.1, 0.1]},
+    index=pd.bdate_range('2020-01-01', periods=6),
+)
+
+
+def test_running_stats_match_path_metrics_across_chunks():
+    stats = etf_streaming.RunningStats()
+    running = pd.concat([stats.update(RETURNS.iloc[:1]), stats.update(RETURNS.iloc[1:4]),
+                         stats.update(RETURNS.iloc[4:])])
+    metrics = etf_kernels.path_metrics(RETURNS)
+    np.testing.assert_allclose(running['drawdown'], metrics['drawdown'])
+    np.testing.assert_allclose(running['cum_returns'], metrics['cum_returns'])
+    np.testing.assert_allclose(stats.summary()['max_drawdown'], metrics['max_drawdown'].iloc[-1])
+
+
+def test_portfolio_summary_matches_path_metrics(tmp_path):
+    database_path = str(tmp_path / 'etf.db')
+    connection = sqlite3.connect(database_path)
+    with connection:
+        for symbol, returns in RETURNS.items():
+            close = 100 * (1 + returns).cumprod()
+            frame = pd.DataFrame({'open': close, 'high': close, 'low': close, 'close': close,
+                                  'volume': 1000, 'daily_returns': returns}, index=RETURNS.index)
+            etf_synthetic.write_ticker(connection, symbol, frame)
+    connection.close()
+
+    summary = etf_streaming.portfolio_summary(chunksize=2, database_path=database_path)
+    portfolio = RETURNS.assign(ETF=RETURNS.mean(axis=1))
+    metrics = etf_kernels.path_metrics(portfolio)
+    np.testing.assert_allclose(summary.loc[['A', 'B', 'ETF'], 'max_drawdown'], metrics['max_drawdown'].iloc[-1])
+    np.testing.assert_allclose(summary.loc[['A', 'B', 'ETF'], 'max_drawdown'], [-0.3, -0.24, -0.25])